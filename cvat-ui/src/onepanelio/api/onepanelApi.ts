@@ -74,11 +74,44 @@ export const OnepanelApi = {
         });
     },
 
-    async executeWorkflow(taskInstanceId: string, payload: any) {
-        return OnepanelApi.fetchJson(`${baseUrl}/onepanelio/execute_workflow/${taskInstanceId}`, {
+    // the workflow is waited for until the timeout or the cancellation,
+    // null is returned for a cancelled request
+    async executeWorkflow(
+        taskInstanceId: string,
+        payload: any,
+        isCancelled: () => boolean = () => false,
+        timeout: number = 30 * 60 * 1000,
+    ) {
+        await OnepanelApi.fetchJson(`${baseUrl}/onepanelio/execute_workflow/${taskInstanceId}`, {
             method: 'POST',
             body: JSON.stringify(payload)
         });
+
+        // annotations are dumped in background, wait for the workflow
+        const deadline = Date.now() + timeout;
+        while (!isCancelled()) {
+            const response = await OnepanelApi.fetchJson(
+                `${baseUrl}/onepanelio/execute_workflow/${taskInstanceId}/status`, {
+                    method: 'GET',
+                },
+            );
+            if (response.state === 'Finished') {
+                return response.result;
+            }
+            if (response.state === 'Failed') {
+                throw {
+                    data: { message: response.message },
+                };
+            }
+            if (Date.now() > deadline) {
+                throw {
+                    data: { message: 'The training workflow is not created yet, please check it later' },
+                };
+            }
+            await new Promise((resolve) => setTimeout(resolve, 2000));
+        }
+
+        return null;
     },
 
     async getBaseModel(workflowTemplateUid: string, sysRefModel: string = "") {
@@ -64,6 +64,8 @@ const InitialState = {
 }
 
 export default class ModelNewAnnotationModalComponent extends React.PureComponent<Props, State> {
+    private unmounted = false;
+
     public constructor(props: Props) {
         super(props);
         this.state = InitialState;
@@ -80,6 +82,11 @@ export default class ModelNewAnnotationModalComponent extends React.PureComponen
         }
     }
 
+    public componentWillUnmount(): void {
+        // stops waiting for the workflow
+        this.unmounted = true;
+    }
+
     private async handleSubmit(): Promise<void> {
         if (this.state.confirmingSubmitWorkflow) {
             return;
@@ -203,8 +210,12 @@ export default class ModelNewAnnotationModalComponent extends React.PureComponen
         }
 
         try {
-            let successResp = await OnepanelApi.executeWorkflow(taskInstance.id, finalPayload);
-        
+            let successResp = await OnepanelApi.executeWorkflow(taskInstance.id, finalPayload,
+                () => this.unmounted);
+            if (this.unmounted) {
+                return;
+            }
+
             notification.open({
                 message: 'Training Workflow is running',
                 duration: 0,
@@ -219,7 +230,11 @@ export default class ModelNewAnnotationModalComponent extends React.PureComponen
             });
 
             closeDialog();
-        } catch (e) {     
+        } catch (e) {
+            if (this.unmounted) {
+                return;
+            }
+
             this.setState({
                 submittingWorkflow: false,
                 confirmingSubmitWorkflow: false,
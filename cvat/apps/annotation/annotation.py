@@ -4,6 +4,7 @@
 
 import os
 import copy
+from bisect import bisect_left, bisect_right
 from collections import OrderedDict, namedtuple
 
 from django.utils import timezone
@@ -120,7 +121,8 @@ class AnnotationIR:
 
         if len(segment_shapes) < len(track['shapes']):
             interpolated_shapes = TrackManager.get_interpolated_shapes(track, start, stop)
-            scoped_shapes = filter_track_shapes(interpolated_shapes)
+            scoped_shapes = filter_track_shapes(
+                interpolated_shapes.between(start, stop))
 
             if scoped_shapes:
                 if not scoped_shapes[0]['keyframe']:
@@ -171,13 +173,13 @@ class Annotation:
     Tag.__new__.__defaults__ = (0, )
     Frame = namedtuple('Frame', 'frame, name, width, height, labeled_shapes, tags')
 
-    def __init__(self, annotation_ir, db_task, scheme='', host='', create_callback=None):
+    def __init__(self, annotation_ir, db_task, scheme='', host='', segments=None):
         self._annotation_ir = annotation_ir
         self._db_task = db_task
         self._scheme = scheme
         self._host = host
-        self._create_callback=create_callback
         self._MAX_ANNO_SIZE=30000
+        self._init_segments(segments or [])
         self._frame_info = {}
         self._frame_mapping = {}
         self._frame_step = db_task.data.get_frame_step()
@@ -202,33 +204,45 @@ class Annotation:
                 **attr_mapping['immutable'],
             }
 
+        # Indexes for lookups by name. The first match is kept like
+        # in a linear search.
+        self._label_ids = {}
+        for db_label in self._label_mapping.values():
+            self._label_ids.setdefault(db_label.name, db_label.id)
+
+        self._attribute_ids = {}
+        self._attribute_names = {}
+        for label_id, attr_mapping in self._attribute_mapping.items():
+            attribute_ids = {'mutable': {}, 'immutable': {}, None: {}}
+            for attr_type in ['mutable', 'immutable']:
+                for attr_id, attr_name in attr_mapping[attr_type].items():
+                    attribute_ids[attr_type].setdefault(attr_name, attr_id)
+            for attr_id, attr_name in self._attribute_mapping_merged[label_id].items():
+                attribute_ids[None].setdefault(attr_name, attr_id)
+                self._attribute_names.setdefault(attr_id, attr_name)
+            self._attribute_ids[label_id] = attribute_ids
+
+        # Exported attribute lists are shared between shapes with
+        # the same attributes, so they must not be modified
+        self._exported_attributes = {}
+
         self._init_frame_info()
         self._init_meta()
 
     def _get_label_id(self, label_name):
-        for db_label in self._label_mapping.values():
-            if label_name == db_label.name:
-                return db_label.id
-        return None
+        return self._label_ids.get(label_name)
 
     def _get_label_name(self, label_id):
         return self._label_mapping[label_id].name
 
     def _get_attribute_name(self, attribute_id):
-        for attribute_mapping in self._attribute_mapping_merged.values():
-            if attribute_id in attribute_mapping:
-                return attribute_mapping[attribute_id]
+        return self._attribute_names.get(attribute_id)
 
     def _get_attribute_id(self, label_id, attribute_name, attribute_type=None):
-        if attribute_type:
-            container = self._attribute_mapping[label_id][attribute_type]
-        else:
-            container = self._attribute_mapping_merged[label_id]
-
-        for attr_id, attr_name in container.items():
-            if attribute_name == attr_name:
-                return attr_id
-        return None
+        attribute_ids = self._attribute_ids.get(label_id)
+        if attribute_ids is None:
+            return None
+        return attribute_ids[attribute_type].get(attribute_name)
 
     def _get_mutable_attribute_id(self, label_id, attribute_name):
         return self._get_attribute_id(label_id, attribute_name, 'mutable')
@@ -319,13 +333,17 @@ class Annotation:
             self._meta["source"] = str(os.path.basename(self._db_task.data.video.path))
 
     def _export_attributes(self, attributes):
-        exported_attributes = []
-        for attr in attributes:
-            attribute_name = self._get_attribute_name(attr["spec_id"])
-            exported_attributes.append(Annotation.Attribute(
-                name=attribute_name,
-                value=attr["value"],
-            ))
+        key = tuple((attr["spec_id"], attr["value"]) for attr in attributes)
+        exported_attributes = self._exported_attributes.get(key)
+        if exported_attributes is None:
+            exported_attributes = []
+            for spec_id, value in key:
+                attribute_name = self._get_attribute_name(spec_id)
+                exported_attributes.append(Annotation.Attribute(
+                    name=attribute_name,
+                    value=value,
+                ))
+            self._exported_attributes[key] = exported_attributes
         return exported_attributes
 
     def _export_tracked_shape(self, shape):
@@ -463,40 +481,79 @@ class Annotation:
 
         return _track
 
-    def _call_callback(self):
-        if self._len() > self._MAX_ANNO_SIZE:
-            self._create_callback(self._annotation_ir.serialize())
-            self._annotation_ir.reset()
+    def _init_segments(self, segments):
+        # Imported objects are split by segments and are passed to
+        # the create callback of each segment in batches
+        segments = sorted(segments, key=lambda segment: segment[0])
+        self._segment_starts = [start for start, _, _ in segments]
+        self._segment_stops = [stop for _, stop, _ in segments]
+        self._segment_callbacks = [callback for _, _, callback in segments]
+        self._segment_data = [AnnotationIR() for _ in segments]
+        self._segment_sizes = [0] * len(segments)
+        self._buffered_size = 0
+
+    def _get_segments(self, start, stop):
+        return range(bisect_left(self._segment_stops, start),
+            bisect_right(self._segment_starts, stop))
+
+    def _add_to_segment(self, idx, size):
+        self._segment_sizes[idx] += size
+        self._buffered_size += size
+        # Keep the number of buffered objects bounded
+        while self._buffered_size > self._MAX_ANNO_SIZE:
+            self._flush_segment(max(range(len(self._segment_sizes)),
+                key=self._segment_sizes.__getitem__))
+
+    def _flush_segment(self, idx):
+        if self._segment_sizes[idx]:
+            self._segment_callbacks[idx](self._segment_data[idx].serialize())
+            self._segment_data[idx].reset()
+            self._buffered_size -= self._segment_sizes[idx]
+            self._segment_sizes[idx] = 0
+
+    def flush(self):
+        for idx in range(len(self._segment_sizes)):
+            self._flush_segment(idx)
 
     def add_tag(self, tag):
         imported_tag = self._import_tag(tag)
         if imported_tag['label_id']:
-            self._annotation_ir.add_tag(imported_tag)
-            self._call_callback()
+            if not self._segment_callbacks:
+                self._annotation_ir.add_tag(imported_tag)
+            frame = imported_tag['frame']
+            for idx in self._get_segments(frame, frame):
+                self._segment_data[idx].add_tag(imported_tag)
+                self._add_to_segment(idx, 1)
 
     def add_shape(self, shape):
         imported_shape = self._import_shape(shape)
         if imported_shape['label_id']:
-            self._annotation_ir.add_shape(imported_shape)
-            self._call_callback()
+            if not self._segment_callbacks:
+                self._annotation_ir.add_shape(imported_shape)
+            frame = imported_shape['frame']
+            for idx in self._get_segments(frame, frame):
+                self._segment_data[idx].add_shape(imported_shape)
+                self._add_to_segment(idx, 1)
 
     def add_track(self, track):
         imported_track = self._import_track(track)
         if imported_track['label_id']:
-            self._annotation_ir.add_track(imported_track)
-            self._call_callback()
+            if not self._segment_callbacks:
+                self._annotation_ir.add_track(imported_track)
+            last_shape = imported_track['shapes'][-1]
+            stop = last_shape['frame'] if last_shape['outside'] else float('inf')
+            for idx in self._get_segments(imported_track['frame'], stop):
+                start, stop = self._segment_starts[idx], self._segment_stops[idx]
+                if AnnotationIR._is_track_inside(imported_track, start, stop):
+                    segment_track = AnnotationIR._slice_track(imported_track,
+                        start, stop)
+                    self._segment_data[idx].add_track(segment_track)
+                    self._add_to_segment(idx, len(segment_track['shapes']))
 
     @property
     def data(self):
         return self._annotation_ir
 
-    def _len(self):
-        track_len = 0
-        for track in self._annotation_ir.tracks:
-            track_len += len(track['shapes'])
-
-        return len(self._annotation_ir.tags) + len(self._annotation_ir.shapes) + track_len
-
     @property
     def frame_info(self):
         return self._frame_info
@@ -11,7 +11,8 @@ class ImageLoader():
         self._frame_provider = frame_provider
 
     def __iter__(self):
-        for frame, _ in self._frame_provider.get_frames(self._frame_provider.Quality.ORIGINAL):
+        for frame, _ in self._frame_provider.get_frames(
+                self._frame_provider.Quality.ORIGINAL, prefetch=True):
             yield self._load_image(frame)
 
     def __len__(self):
@@ -4,36 +4,83 @@
 # SPDX-License-Identifier: MIT
 
 from collections import OrderedDict
+import os.path as osp
+import threading
 
 from django.db import transaction
 
 from cvat.apps.annotation.annotation import Annotation
 from cvat.apps.engine.annotation import TaskAnnotation
-from cvat.apps.engine.models import ShapeType, AttributeType
+from cvat.apps.engine.frame_provider import ChunkCache, FrameProvider
+from cvat.apps.engine.models import AttributeType, DataChoice, ShapeType
 
 import datumaro.components.extractor as datumaro
-from datumaro.util.image import Image
+from datumaro.util.image import ByteImage, Image
 
 
 class CvatImagesExtractor(datumaro.Extractor):
-    def __init__(self, url, frame_provider):
+    def __init__(self, url, db_data):
         super().__init__()
 
-        self._frame_provider = frame_provider
+        # the frames are read once, so they are not put to the frame cache
+        self._frame_provider = FrameProvider(db_data, cache=ChunkCache(0))
+        # images can be read from several threads during export
+        self._frame_provider_lock = threading.Lock()
+        self._is_video = db_data.original_chunk_type == DataChoice.VIDEO
+        self._frame_info = self._load_frame_info(db_data)
         self._subsets = None
 
+    @staticmethod
+    def _load_frame_info(db_data):
+        # the images are named by the frame numbers, because the names of
+        # the uploaded files can be the same in different directories
+        if hasattr(db_data, 'video'):
+            return OrderedDict((frame, {
+                'path': str(frame),
+                'width': db_data.video.width,
+                'height': db_data.video.height,
+            }) for frame in range(db_data.size))
+
+        return OrderedDict((db_image['frame'], {
+                'path': str(db_image['frame']) + \
+                    osp.splitext(db_image['path'])[1],
+                'width': db_image['width'],
+                'height': db_image['height'],
+            }) for db_image in db_data.images.order_by('frame') \
+                .values('frame', 'path', 'width', 'height'))
+
+    def _load_bytes(self, frame):
+        with self._frame_provider_lock:
+            frame, _ = self._frame_provider.get_frame(frame,
+                self._frame_provider.Quality.ORIGINAL,
+                self._frame_provider.Type.BUFFER)
+        return frame.getvalue()
+
+    def _load_array(self, frame):
+        with self._frame_provider_lock:
+            frame, _ = self._frame_provider.get_frame(frame,
+                self._frame_provider.Quality.ORIGINAL,
+                self._frame_provider.Type.NUMPY_ARRAY)
+        return frame
+
+    def _make_item(self, frame, frame_info):
+        size = (frame_info['height'], frame_info['width'])
+        # NOTE: the frame is bound as an argument to avoid late binding
+        if self._is_video:
+            image = Image(path=frame_info['path'], size=size,
+                data=lambda frame=frame: self._load_array(frame))
+        else:
+            # original chunks keep the uploaded files as is
+            image = ByteImage(path=frame_info['path'], size=size,
+                data=lambda frame=frame: self._load_bytes(frame))
+        return datumaro.DatasetItem(id=frame, image=image)
+
     def __iter__(self):
-        frames = self._frame_provider.get_frames(
-            self._frame_provider.Quality.ORIGINAL,
-            self._frame_provider.Type.NUMPY_ARRAY)
-        for item_id, (image, _) in enumerate(frames):
-            yield datumaro.DatasetItem(
-                id=item_id,
-                image=Image(image),
-            )
+        for frame, frame_info in self._frame_info.items():
+            yield self._make_item(frame, frame_info)
 
     def __len__(self):
-        return len(self._frame_provider)
+        return len(self._frame_info)
 
     def subsets(self):
         return self._subsets
@@ -41,10 +88,8 @@ class CvatImagesExtractor(datumaro.Extractor):
     def get(self, item_id, subset=None, path=None):
         if path or subset:
             raise KeyError()
-        return datumaro.DatasetItem(
-            id=item_id,
-            image=self._frame_provider[item_id].getvalue()
-        )
+        frame = int(item_id)
+        return self._make_item(frame, self._frame_info[frame])
 
 class CvatAnnotationsExtractor(datumaro.Extractor):
     def __init__(self, url, cvat_annotations):
@@ -0,0 +1,147 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import os.path as osp
+import shutil
+import threading
+
+from datumaro.util.image import ImageWriter
+
+from .util import get_file_hash
+
+
+class ExportCache:
+    """
+    Content-addressed storage of the exported task images. The images are
+    stored once by the hash of their contents and hard-linked into
+    the export directories. The task images don't change, so an image is
+    identified by its path and the output format. The images are shared
+    by the exports to all the formats and removed with the last of them.
+    """
+
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+        self._objects_dir = osp.join(cache_dir, 'objects')
+        self._index_path = osp.join(cache_dir, 'images.json')
+        self._lock = threading.Lock()
+        self._index = self._load_index() # image key: hash
+        self._hashes = {} # absolute linked file path: hash
+
+    def _load_index(self):
+        try:
+            with open(self._index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _get_object_path(self, file_hash, ext):
+        return osp.join(self._objects_dir, file_hash + ext)
+
+    @staticmethod
+    def _link(src_path, dst_path):
+        try:
+            os.link(src_path, dst_path)
+        except OSError:
+            shutil.copyfile(src_path, dst_path)
+
+    def link_image(self, key, path):
+        """
+        Puts the cached image to the path. Returns False, if the image
+        is not cached.
+        """
+
+        with self._lock:
+            file_hash = self._index.get(key)
+        if file_hash is None:
+            return False
+
+        object_path = self._get_object_path(file_hash, osp.splitext(path)[1])
+        if not osp.isfile(object_path):
+            return False
+
+        if osp.lexists(path):
+            os.remove(path)
+        self._link(object_path, path)
+        with self._lock:
+            self._hashes[osp.abspath(path)] = file_hash
+        return True
+
+    def add_image(self, key, path):
+        file_hash = get_file_hash(path)
+        object_path = self._get_object_path(file_hash, osp.splitext(path)[1])
+        if not osp.isfile(object_path):
+            os.makedirs(self._objects_dir, exist_ok=True)
+            tmp_path = '%s.%s.tmp' % (object_path, threading.get_ident())
+            self._link(path, tmp_path)
+            os.replace(tmp_path, object_path)
+
+        with self._lock:
+            self._index[key] = file_hash
+            self._hashes[osp.abspath(path)] = file_hash
+
+    def is_cached(self, path):
+        with self._lock:
+            return osp.abspath(path) in self._hashes
+
+    def get_file_hash(self, path):
+        with self._lock:
+            file_hash = self._hashes.get(osp.abspath(path))
+        if file_hash is None:
+            file_hash = get_file_hash(path)
+        return file_hash
+
+    def save(self):
+        with self._lock:
+            index = dict(self._index)
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def is_used(self):
+        """
+        Checks if the cache directory has exported archives or running
+        exports, which can use the cached images
+        """
+
+        own_files = { osp.basename(self._objects_dir),
+            osp.basename(self._index_path) }
+        return any(name not in own_files and not name.endswith('.tmp')
+            for name in os.listdir(self._cache_dir))
+
+    def clear(self):
+        with self._lock:
+            self._index = {}
+            self._hashes = {}
+        shutil.rmtree(self._objects_dir, ignore_errors=True)
+        if osp.exists(self._index_path):
+            os.remove(self._index_path)
+
+class CachingImageWriter(ImageWriter):
+    """
+    Takes the images from the export cache, if they were saved before.
+    """
+
+    def __init__(self, cache, **kwargs):
+        super().__init__(**kwargs)
+        self._cache = cache
+
+    def save(self, image, path):
+        key = None
+        if image.path:
+            key = osp.splitext(path)[1].lower() + ':' + image.path
+            if self._cache.link_image(key, path):
+                self._count(copied=True)
+                return True
+
+        # the file can be a link to a cached object, it must not be changed
+        if osp.lexists(path):
+            os.remove(path)
+        if not super().save(image, path):
+            return False
+        if key:
+            self._cache.add_image(key, path)
+        return True
@@ -29,11 +29,16 @@ def load(file_object, annotations):
     dm_dataset = CocoInstancesExtractor(file_object.name)
     import_dm_annotations(dm_dataset, annotations)
 
+from django.conf import settings
 from datumaro.plugins.coco_format.converter import \
     CocoInstancesConverter as _CocoInstancesConverter
 class CvatCocoConverter(_CocoInstancesConverter):
     NAME = 'cvat_coco'
 
+    def __init__(self, **kwargs):
+        kwargs.setdefault('workers', settings.DATASET_EXPORT_WORKERS)
+        super().__init__(**kwargs)
+
 def dump(file_object, annotations):
     import os.path as osp
     import shutil
@@ -25,6 +25,7 @@ format_spec = {
 from datumaro.components.converter import Converter
 class CvatMaskConverter(Converter):
     def __init__(self, save_images=False):
+        super().__init__()
         self._save_images = save_images
 
     def __call__(self, extractor, save_dir):
@@ -45,6 +46,7 @@ class CvatMaskConverter(Converter):
         converter = env.make_converter('voc_segmentation',
             apply_colormap=True, label_map='source',
             save_images=self._save_images)
+        converter.image_writer = self.image_writer
         converter(extractor, save_dir=save_dir)
 
 def dump(file_object, annotations):
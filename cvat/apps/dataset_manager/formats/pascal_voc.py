@@ -62,10 +62,12 @@ def load(file_object, annotations):
         dm_dataset = dm_project.make_dataset()
         import_dm_annotations(dm_dataset, annotations)
 
+from django.conf import settings
 from datumaro.components.converter import Converter
 from datumaro.components.project import ProjectDataset
 class CvatVocConverter(Converter):
     def __init__(self, save_images=False):
+        super().__init__()
         self._save_images = save_images
 
     def __call__(self, extractor, save_dir):
@@ -79,7 +81,9 @@ class CvatVocConverter(Converter):
         extractor = extractor.transform(id_from_image)
         extractor = Dataset.from_extractors(orig_sources,extractor) # apply lazy transforms
         converter = env.make_converter('voc', label_map='source',
-            save_images=self._save_images)
+            save_images=self._save_images,
+            workers=settings.DATASET_EXPORT_WORKERS)
+        converter.image_writer = self.image_writer
         converter(extractor, save_dir=save_dir)
 
 def dump(file_object, annotations):
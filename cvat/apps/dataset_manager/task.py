@@ -17,12 +17,12 @@ from cvat.settings.base import DATUMARO_PATH as _DATUMARO_REPO_PATH, \
     BASE_DIR as _CVAT_ROOT_DIR
 from cvat.apps.engine.log import slogger
 from cvat.apps.engine.models import Task
-from cvat.apps.engine.frame_provider import FrameProvider
-from .util import current_function_name, make_zip_archive
+from .util import current_function_name, update_zip_archive
 
 from datumaro.components.project import Project, Environment
 import datumaro.components.extractor as datumaro
 from .bindings import CvatImagesExtractor, CvatTaskExtractor
+from .export_cache import CachingImageWriter, ExportCache
 
 _FORMATS_DIR = osp.join(osp.dirname(__file__), 'formats')
 
@@ -41,6 +41,9 @@ _TASK_IMAGES_REMOTE_EXTRACTOR = 'cvat_rest_api_task_images'
 def get_export_cache_dir(db_task):
     return osp.join(db_task.get_task_dirname(), 'export_cache')
 
+def get_export_manifest_path(archive_path):
+    return archive_path + '.manifest.json'
+
 EXPORT_FORMAT_DATUMARO_PROJECT = "datumaro_project"
 
 
@@ -81,7 +84,7 @@ class TaskProject:
         })
         self._project.env.extractors.register(_TASK_IMAGES_EXTRACTOR,
             lambda url: CvatImagesExtractor(url,
-                FrameProvider(self._db_task.data)))
+                self._db_task.data))
 
         self._init_dataset()
         self._dataset.define_categories(self._generate_categories())
@@ -92,7 +95,7 @@ class TaskProject:
         self._project = Project.load(self._project_dir)
         self._project.env.extractors.register(_TASK_IMAGES_EXTRACTOR,
             lambda url: CvatImagesExtractor(url,
-                FrameProvider(self._db_task.data)))
+                self._db_task.data))
 
     def _import_from_task(self, user):
         self._project = Project.generate(self._project_dir, config={
@@ -105,7 +108,7 @@ class TaskProject:
         })
         self._project.env.extractors.register(_TASK_IMAGES_EXTRACTOR,
             lambda url: CvatImagesExtractor(url,
-                FrameProvider(self._db_task.data)))
+                self._db_task.data))
 
         self._project.add_source('task_%s_anno' % self._db_task.id, {
             'format': _TASK_ANNO_EXTRACTOR,
@@ -144,7 +147,8 @@ class TaskProject:
         else:
             self._project.save(save_dir=save_dir)
 
-    def export(self, dst_format, save_dir, save_images=False, server_url=None):
+    def export(self, dst_format, save_dir, save_images=False, server_url=None,
+            image_writer=None):
         if self._dataset is None:
             self._init_dataset()
         if dst_format == EXPORT_FORMAT_DATUMARO_PROJECT:
@@ -152,6 +156,8 @@ class TaskProject:
         else:
             converter = self._dataset.env.make_converter(dst_format,
                 save_images=save_images)
+            if image_writer is not None:
+                converter.image_writer = image_writer
             self._dataset.export_project(converter=converter, save_dir=save_dir)
 
     def _remote_image_converter(self, save_dir, server_url=None):
@@ -269,14 +275,23 @@ def export_project(task_id, user, dst_format=None, server_url=None):
         if not (osp.exists(archive_path) and \
                 task_time <= osp.getmtime(archive_path)):
             os.makedirs(cache_dir, exist_ok=True)
+            export_cache = ExportCache(cache_dir)
             with tempfile.TemporaryDirectory(
                     dir=cache_dir, prefix=dst_format + '_') as temp_dir:
                 project = TaskProject.from_task(db_task, user)
                 project.export(dst_format, save_dir=temp_dir, save_images=True,
-                    server_url=server_url)
+                    server_url=server_url,
+                    image_writer=CachingImageWriter(export_cache))
+                export_cache.save()
 
+                # images go first, they don't change on annotation updates
                 os.makedirs(cache_dir, exist_ok=True)
-                make_zip_archive(temp_dir, archive_path)
+                updated_entries = update_zip_archive(temp_dir, archive_path,
+                    get_export_manifest_path(archive_path),
+                    get_hash=export_cache.get_file_hash,
+                    sort_key=lambda path: \
+                        (not export_cache.is_cached(path), path),
+                    remove_files=True)
 
             archive_ctime = osp.getctime(archive_path)
             scheduler = django_rq.get_scheduler()
@@ -286,10 +301,11 @@ def export_project(task_id, user, dst_format=None, server_url=None):
                 file_path=archive_path, file_ctime=archive_ctime)
             slogger.task[task_id].info(
                 "The task '{}' is exported as '{}' "
+                "({} archive entries updated) "
                 "and available for downloading for next '{}'. "
                 "Export cache cleaning job is enqueued, "
                 "id '{}', start in '{}'".format(
-                    db_task.name, dst_format, CACHE_TTL,
+                    db_task.name, dst_format, updated_entries, CACHE_TTL,
                     cleaning_job.id, CACHE_TTL))
 
         return archive_path
@@ -301,6 +317,13 @@ def clear_export_cache(task_id, file_path, file_ctime):
     try:
         if osp.exists(file_path) and osp.getctime(file_path) == file_ctime:
             os.remove(file_path)
+            manifest_path = get_export_manifest_path(file_path)
+            if osp.exists(manifest_path):
+                os.remove(manifest_path)
+            # the cached images are removed with the last exported archive
+            export_cache = ExportCache(osp.dirname(file_path))
+            if not export_cache.is_used():
+                export_cache.clear()
             slogger.task[task_id].info(
                 "Export cache file '{}' successfully removed" \
                 .format(file_path))
@@ -0,0 +1,88 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import shutil
+from io import BytesIO
+
+from django.test import TestCase
+from PIL import Image as PILImage
+
+from cvat.apps.dataset_manager.bindings import CvatImagesExtractor
+from cvat.apps.engine.media_extractors import ZipChunkWriter
+from cvat.apps.engine.models import Data, Image
+
+from datumaro.util.image import ByteImage
+
+
+def create_db_data(frames, chunk_size, paths=None):
+    if paths is None:
+        paths = ["dir/image_{}.jpg".format(frame) for frame in range(frames)]
+    db_data = Data.objects.create(size=frames, stop_frame=frames - 1,
+        chunk_size=chunk_size)
+    Image.objects.bulk_create([Image(data=db_data, frame=frame,
+        width=10 + frame, height=20, path=paths[frame])
+        for frame in range(frames)])
+    return db_data
+
+def write_original_chunks(db_data):
+    os.makedirs(db_data.get_original_cache_dirname(), exist_ok=True)
+    files = []
+    for chunk_number in range(0, db_data.size, db_data.chunk_size):
+        chunk_files = []
+        for db_image in db_data.images.filter(frame__gte=chunk_number,
+                frame__lt=chunk_number + db_data.chunk_size).order_by('frame'):
+            buf = BytesIO()
+            PILImage.new('RGB', size=(db_image.width, db_image.height),
+                color=(db_image.frame, 0, 0)).save(buf, 'jpeg')
+            chunk_files.append((buf, db_image.path, db_image.frame))
+        ZipChunkWriter(100).save_as_chunk(chunk_files,
+            db_data.get_original_chunk_path(
+                chunk_number // db_data.chunk_size))
+        files.extend(buf.getvalue() for buf, _, _ in chunk_files)
+    return files
+
+class CvatImagesExtractorTest(TestCase):
+    def _create_db_data(self, *args, **kwargs):
+        db_data = create_db_data(*args, **kwargs)
+        # data ids are reused by the tests
+        self.addCleanup(shutil.rmtree, db_data.get_data_dirname(),
+            ignore_errors=True)
+        return db_data
+
+    def test_can_read_image_info_without_chunks(self):
+        db_data = self._create_db_data(frames=5, chunk_size=2)
+
+        items = list(CvatImagesExtractor('', db_data))
+
+        self.assertEqual(len(items), 5)
+        for frame, item in enumerate(items):
+            self.assertEqual(item.id, str(frame))
+            self.assertEqual(item.image.size, (20, 10 + frame))
+            self.assertEqual(item.image.path, "{}.jpg".format(frame))
+
+    def test_can_pass_original_bytes(self):
+        db_data = self._create_db_data(frames=5, chunk_size=2)
+        files = write_original_chunks(db_data)
+
+        extractor = CvatImagesExtractor('', db_data)
+
+        for frame, item in enumerate(extractor):
+            self.assertTrue(isinstance(item.image, ByteImage))
+            self.assertEqual(item.image.ext, '.jpg')
+            self.assertEqual(item.image.get_bytes(), files[frame])
+            self.assertEqual(item.image.data.shape, (20, 10 + frame, 3))
+        self.assertEqual(extractor.get(3).image.get_bytes(), files[3])
+
+    def test_can_name_images_with_same_names_uniquely(self):
+        db_data = self._create_db_data(frames=3, chunk_size=2,
+            paths=["a/1.jpg", "b/1.jpg", "1.jpg"])
+        files = write_original_chunks(db_data)
+
+        items = list(CvatImagesExtractor('', db_data))
+
+        # the converters name the output images by the file names
+        self.assertEqual([item.image.filename for item in items],
+            ['0.jpg', '1.jpg', '2.jpg'])
+        self.assertEqual([item.image.get_bytes() for item in items], files)
@@ -0,0 +1,162 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import os.path as osp
+import tempfile
+import zipfile
+from unittest import TestCase
+
+import numpy as np
+
+from cvat.apps.dataset_manager.export_cache import (CachingImageWriter,
+    ExportCache)
+from cvat.apps.dataset_manager.util import update_zip_archive
+
+from datumaro.util.image import ByteImage, Image, encode_image
+
+
+def write_file(path, data):
+    os.makedirs(osp.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def read_archive(path):
+    with zipfile.ZipFile(path) as archive:
+        return { name: archive.read(name) for name in archive.namelist() }
+
+class UpdateZipArchiveTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.src_dir = osp.join(self._tmp_dir.name, 'src')
+        self.archive_path = osp.join(self._tmp_dir.name, 'a.zip')
+        self.manifest_path = self.archive_path + '.manifest.json'
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _update(self):
+        return update_zip_archive(self.src_dir, self.archive_path,
+            self.manifest_path)
+
+    def test_rewrites_only_changed_entries(self):
+        for i in range(5):
+            write_file(osp.join(self.src_dir, 'images', '%s.jpg' % i),
+                ('image %s' % i).encode())
+        write_file(osp.join(self.src_dir, 'z.txt'), b'annotations')
+
+        self.assertEqual(self._update(), 6)
+        size = osp.getsize(self.archive_path)
+
+        write_file(osp.join(self.src_dir, 'z.txt'), b'new annotations')
+        self.assertEqual(self._update(), 1)
+
+        self.assertEqual(osp.getsize(self.archive_path), size + 4)
+        self.assertEqual(read_archive(self.archive_path)['z.txt'],
+            b'new annotations')
+
+    def test_can_remove_and_add_entries(self):
+        write_file(osp.join(self.src_dir, 'a.txt'), b'a')
+        write_file(osp.join(self.src_dir, 'b.txt'), b'b')
+        write_file(osp.join(self.src_dir, 'c.txt'), b'c')
+        self._update()
+
+        os.remove(osp.join(self.src_dir, 'b.txt'))
+        write_file(osp.join(self.src_dir, 'd.txt'), b'd')
+        self.assertEqual(self._update(), 1)
+
+        self.assertEqual(read_archive(self.archive_path),
+            { 'a.txt': b'a', 'c.txt': b'c', 'd.txt': b'd' })
+
+    def test_keeps_archive_on_failure(self):
+        write_file(osp.join(self.src_dir, 'a.txt'), b'a')
+        self._update()
+        write_file(osp.join(self.src_dir, 'b.txt'), b'b')
+
+        def compression(name):
+            raise OSError()
+        with self.assertRaises(OSError):
+            update_zip_archive(self.src_dir, self.archive_path,
+                self.manifest_path, compression=compression)
+
+        self.assertEqual(read_archive(self.archive_path), { 'a.txt': b'a' })
+        self.assertEqual(set(os.listdir(self._tmp_dir.name)),
+            { 'src', 'a.zip' })
+
+    def test_rewrites_archive_without_manifest(self):
+        write_file(osp.join(self.src_dir, 'a.txt'), b'a')
+        self._update()
+        os.remove(self.manifest_path)
+
+        self.assertEqual(self._update(), 1)
+        self.assertEqual(read_archive(self.archive_path), { 'a.txt': b'a' })
+
+class CachingImageWriterTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = osp.join(self._tmp_dir.name, 'cache')
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _export(self, images, save_dir):
+        cache = ExportCache(self.cache_dir)
+        writer = CachingImageWriter(cache)
+        os.makedirs(save_dir)
+        for image in images:
+            writer.save(image, osp.join(save_dir,
+                osp.splitext(image.path)[0] + '.jpg'))
+        cache.save()
+        return cache, writer
+
+    def test_saves_each_image_once(self):
+        loaded = []
+        def load(i):
+            loaded.append(i)
+            return encode_image(np.ones((2, 3, 3)) * i, '.jpg')
+        images = [ByteImage(path='%s.jpg' % i, data=lambda i=i: load(i))
+            for i in range(3)]
+
+        self._export(images, osp.join(self._tmp_dir.name, 'a'))
+        cache, writer = self._export(images,
+            osp.join(self._tmp_dir.name, 'b'))
+
+        self.assertEqual(loaded, [0, 1, 2])
+        self.assertEqual(writer.copied, 3)
+        for i in range(3):
+            path = osp.join(self._tmp_dir.name, 'b', '%s.jpg' % i)
+            self.assertTrue(cache.is_cached(path))
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), images[i].get_bytes())
+
+    def test_doesnt_change_cached_images(self):
+        save_dir = osp.join(self._tmp_dir.name, 'a')
+        _, writer = self._export(
+            [Image(path='a.png', data=np.zeros((2, 3, 3)))], save_dir)
+        image_path = osp.join(save_dir, 'a.jpg')
+        with open(image_path, 'rb') as f:
+            image_bytes = f.read()
+
+        # the file is a link to the cached object
+        writer.save(Image(data=np.ones((2, 3, 3)) * 255), image_path)
+
+        object_dir = osp.join(self.cache_dir, 'objects')
+        object_path = osp.join(object_dir, os.listdir(object_dir)[0])
+        with open(object_path, 'rb') as f:
+            self.assertEqual(f.read(), image_bytes)
+
+    def test_can_clear_unused_cache(self):
+        save_dir = osp.join(self.cache_dir, 'a')
+        cache, _ = self._export(
+            [Image(path='a.png', data=np.zeros((2, 3, 3)))], save_dir)
+        self.assertTrue(cache.is_used())
+
+        os.remove(osp.join(save_dir, 'a.jpg'))
+        os.rmdir(save_dir)
+        self.assertFalse(cache.is_used())
+        cache.clear()
+
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        self.assertFalse(ExportCache(self.cache_dir).link_image('.jpg:a.png',
+            osp.join(self._tmp_dir.name, 'a.jpg')))
@@ -0,0 +1,52 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import os.path as osp
+import tempfile
+import zipfile
+from unittest import TestCase
+
+from cvat.apps.dataset_manager.util import make_zip_archive
+
+
+class ZipArchiveTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.src_dir = osp.join(self._tmp_dir.name, 'src')
+        self.files = {
+            'annotations/a.json': b'{"a": 1}' * 100,
+            'images/1.jpg': os.urandom(100),
+            '2.PNG': os.urandom(100),
+        }
+        for name, data in self.files.items():
+            path = osp.join(self.src_dir, name)
+            os.makedirs(osp.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _check_archive(self, archive_file):
+        with zipfile.ZipFile(archive_file) as archive:
+            self.assertEqual(
+                { name: archive.read(name) for name in archive.namelist() },
+                self.files)
+            compression = { i.filename: i.compress_type
+                for i in archive.infolist() }
+        self.assertEqual(compression, {
+            'annotations/a.json': zipfile.ZIP_DEFLATED,
+            'images/1.jpg': zipfile.ZIP_STORED,
+            '2.PNG': zipfile.ZIP_STORED,
+        })
+
+    def test_can_make_archive(self):
+        archive_path = osp.join(self._tmp_dir.name, 'a.zip')
+
+        make_zip_archive(self.src_dir, archive_path, remove_files=True)
+
+        self._check_archive(archive_path)
+        self.assertEqual(
+            [f for _, _, files in os.walk(self.src_dir) for f in files], [])
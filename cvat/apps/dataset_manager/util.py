@@ -1,20 +1,123 @@
-
 # Copyright (C) 2019-2020 Intel Corporation
 #
 # SPDX-License-Identifier: MIT
 
+import hashlib
 import inspect
+import json
 import os, os.path as osp
+import shutil
 import zipfile
 
+from cvat.apps.engine.utils import get_zip_compression
+
 
 def current_function_name(depth=1):
     return inspect.getouterframes(inspect.currentframe())[depth].function
 
 
-def make_zip_archive(src_path, dst_path):
+def _list_files(src_path):
+    for (dirpath, _, filenames) in os.walk(src_path):
+        for name in filenames:
+            yield osp.join(dirpath, name)
+
+def _write_zip_entry(archive, path, name, compression, remove_file=False):
+    archive.write(path, name, compress_type=compression(name))
+    if remove_file:
+        os.remove(path)
+
+def make_zip_archive(src_path, dst_path, compression=get_zip_compression,
+        remove_files=False):
+    """
+    Writes the directory files to a zip archive. The compression method
+    is chosen for each entry by its name. The files can be removed as soon
+    as they are archived to avoid keeping two copies on disk.
+    The destination can be a path or a file object, the file object
+    is not required to be seekable.
+    """
+
     with zipfile.ZipFile(dst_path, 'w') as archive:
-        for (dirpath, _, filenames) in os.walk(src_path):
-            for name in filenames:
-                path = osp.join(dirpath, name)
-                archive.write(path, osp.relpath(path, src_path))
+        for path in _list_files(src_path):
+            _write_zip_entry(archive, path, osp.relpath(path, src_path),
+                compression, remove_file=remove_files)
+
+def get_file_hash(path):
+    file_hash = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def _load_zip_manifest(archive, manifest_path):
+    # the manifest is valid only for the archive it was written with
+    try:
+        with open(manifest_path) as f:
+            manifest = dict(tuple(entry) for entry in json.load(f))
+    except (OSError, ValueError):
+        return {}
+
+    if set(manifest) != set(archive.namelist()):
+        return {}
+    return manifest
+
+def _copy_zip_entry(src_archive, dst_archive, name):
+    # stored entries, like images, are copied without recompression
+    src_info = src_archive.getinfo(name)
+    dst_info = zipfile.ZipInfo(name, date_time=src_info.date_time)
+    dst_info.compress_type = src_info.compress_type
+    dst_info.external_attr = src_info.external_attr
+    with src_archive.open(src_info) as src, \
+            dst_archive.open(dst_info, 'w') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+def update_zip_archive(src_path, dst_path, manifest_path,
+        get_hash=get_file_hash, sort_key=None, compression=get_zip_compression,
+        remove_files=False):
+    """
+    Makes a zip archive of the directory like make_zip_archive(), but
+    takes the entries, which are not changed, from the existing archive.
+    The entry hashes are stored in the manifest file. The new archive is
+    written to a temporary file and replaces the existing one, so
+    the readers of the existing archive are not affected.
+    """
+
+    files = sorted(_list_files(src_path), key=sort_key)
+    entries = [(osp.relpath(path, src_path), path) for path in files]
+    hashes = { name: get_hash(path) for name, path in entries }
+
+    old_archive = None
+    manifest = {}
+    if osp.isfile(dst_path):
+        old_archive = zipfile.ZipFile(dst_path)
+        manifest = _load_zip_manifest(old_archive, manifest_path)
+    # the manifest can't describe the archive during the update
+    if osp.isfile(manifest_path):
+        os.remove(manifest_path)
+
+    tmp_path = '{}.{}.tmp'.format(dst_path, os.getpid())
+    written = 0
+    try:
+        with zipfile.ZipFile(tmp_path, 'w') as archive:
+            for name, path in entries:
+                if manifest.get(name) == hashes[name]:
+                    _copy_zip_entry(old_archive, archive, name)
+                    if remove_files:
+                        os.remove(path)
+                else:
+                    _write_zip_entry(archive, path, name, compression,
+                        remove_file=remove_files)
+                    written += 1
+        if old_archive is not None:
+            old_archive.close()
+            old_archive = None
+        os.replace(tmp_path, dst_path)
+    finally:
+        if old_archive is not None:
+            old_archive.close()
+        if osp.isfile(tmp_path):
+            os.remove(tmp_path)
+
+    with open(manifest_path, 'w') as f:
+        json.dump([(name, hashes[name]) for name, _ in entries], f)
+
+    return written
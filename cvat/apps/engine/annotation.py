@@ -2,13 +2,20 @@
 #
 # SPDX-License-Identifier: MIT
 
+import functools
+import hashlib
+import io
+import json
 import os
+import shutil
+import tempfile
 from enum import Enum
 from collections import OrderedDict
 from django.utils import timezone
 
 from django.conf import settings
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import Max
 
 from cvat.apps.profiler import silk_profile
 from cvat.apps.engine.plugins import plugin_decorator
@@ -48,6 +55,35 @@ def get_job_data(pk, user):
 
     return annotation.data
 
+def _set_read_snapshot():
+    # all the queries of the transaction see the same data
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ '
+                'READ ONLY')
+
+def stream_job_data(pk, user):
+    """
+    Yields the job annotations as JSON chunks. The objects are read from
+    the database while the chunks are consumed, in one transaction.
+    """
+
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost:
+            _set_read_snapshot()
+        annotation = JobAnnotation(pk, user, lock=False)
+        yield from serializers.LabeledDataStreamSerializer(
+            annotation.iter_from_db())
+
+def stream_task_data(pk, user):
+    """
+    Returns the task annotations as JSON chunks. The job annotations are
+    merged at the segment overlaps, so the data is built before rendering.
+    """
+
+    return serializers.LabeledDataStreamSerializer(get_task_data(pk, user))
+
 @silk_profile(name="POST job data")
 @transaction.atomic
 def put_job_data(pk, user, data):
@@ -155,6 +191,66 @@ def bulk_create(db_model, objects, flt_param):
 
     return []
 
+# Fields of rows for bulk_insert, "id" is None for new objects
+TAG_FIELDS = ("id", "job_id", "label_id", "frame", "group")
+TRACK_FIELDS = TAG_FIELDS
+LABELED_SHAPE_FIELDS = TAG_FIELDS + ("type", "occluded", "z_order", "points")
+TRACKED_SHAPE_FIELDS = ("id", "track_id", "type", "occluded", "z_order",
+    "points", "frame", "outside")
+ATTRIBUTE_FIELDS = ("id", "spec_id", "value")
+
+def _to_copy_text(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t") \
+        .replace("\n", "\\n").replace("\r", "\\r")
+
+def _copy_rows(db_model, fields, rows):
+    opts = db_model._meta
+    db_fields = [opts.get_field(name) for name in fields]
+    quote_name = connection.ops.quote_name
+    copy_sql = "COPY {} ({}) FROM STDIN".format(quote_name(opts.db_table),
+        ", ".join(quote_name(field.column) for field in db_fields))
+    batch_size = settings.ANNOTATION_BULK_INSERT_BATCH_SIZE
+
+    ids = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            new_ids = iter(())
+            new_count = sum(1 for row in batch if row[0] is None)
+            if new_count:
+                cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+                    "FROM generate_series(1, %s)", [opts.db_table, new_count])
+                new_ids = (row[0] for row in cursor.fetchall())
+
+            buffer = io.StringIO()
+            for row in batch:
+                row_id = next(new_ids) if row[0] is None else row[0]
+                ids.append(row_id)
+                buffer.write("\t".join(_to_copy_text(field.get_prep_value(value))
+                    for field, value in zip(db_fields, (row_id, ) + row[1:])))
+                buffer.write("\n")
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+
+    return ids
+
+def bulk_insert(db_model, fields, rows, flt_param):
+    """
+    Inserts rows of field values and returns ids of the rows. On PostgreSQL
+    the rows are written with COPY in batches without model instances.
+    """
+    if not rows:
+        return []
+    if 'postgresql' in settings.DATABASES["default"]["ENGINE"]:
+        return _copy_rows(db_model, fields, rows)
+
+    objects = [db_model(**dict(zip(fields, row))) for row in rows]
+    return [obj.id for obj in bulk_create(db_model, objects, flt_param)]
+
 def _merge_table_rows(rows, keys_for_merge, field_id):
     # It is necessary to keep a stable order of original rows
     # (e.g. for tracked boxes). Otherwise prev_box.frame can be bigger
@@ -184,10 +280,13 @@ def _merge_table_rows(rows, keys_for_merge, field_id):
     return list(merged_rows.values())
 
 class JobAnnotation:
-    def __init__(self, pk, user):
+    def __init__(self, pk, user, lock=True):
+        # lock: lock the job row until the end of the transaction
         self.user = user
-        self.db_job = models.Job.objects.select_related('segment__task') \
-            .select_for_update().get(id=pk)
+        db_jobs = models.Job.objects.select_related('segment__task')
+        if lock:
+            db_jobs = db_jobs.select_for_update()
+        self.db_job = db_jobs.get(id=pk)
 
         db_segment = self.db_job.segment
         self.start_frame = db_segment.start_frame
@@ -222,167 +321,161 @@ class JobAnnotation:
         self.ir_data.reset()
 
     def _save_tracks_to_db(self, tracks):
-        db_tracks = []
-        db_track_attrvals = []
-        db_shapes = []
-        db_shape_attrvals = []
+        track_rows = []
+        track_attrval_rows = []
+        shape_rows = []
+        shape_attrval_rows = []
 
         for track in tracks:
             track_attributes = track.pop("attributes", [])
             shapes = track.pop("shapes")
-            db_track = models.LabeledTrack(job=self.db_job, **track)
-            if db_track.label_id not in self.db_labels:
-                raise AttributeError("label_id `{}` is invalid".format(db_track.label_id))
+            label_id = track["label_id"]
+            if label_id not in self.db_labels:
+                raise AttributeError("label_id `{}` is invalid".format(label_id))
+            track_idx = len(track_rows)
+            track_rows.append((track.get("id"), self.db_job.id, label_id,
+                track["frame"], track.get("group")))
 
             for attr in track_attributes:
-                db_attrval = models.LabeledTrackAttributeVal(**attr)
-                if db_attrval.spec_id not in self.db_attributes[db_track.label_id]["immutable"]:
-                    raise AttributeError("spec_id `{}` is invalid".format(db_attrval.spec_id))
-                db_attrval.track_id = len(db_tracks)
-                db_track_attrvals.append(db_attrval)
+                if attr["spec_id"] not in self.db_attributes[label_id]["immutable"]:
+                    raise AttributeError("spec_id `{}` is invalid".format(attr["spec_id"]))
+                track_attrval_rows.append((None, attr["spec_id"], attr["value"], track_idx))
 
             for shape in shapes:
                 shape_attributes = shape.pop("attributes", [])
                 # FIXME: need to clamp points (be sure that all of them inside the image)
                 # Should we check here or implement a validator?
-                db_shape = models.TrackedShape(**shape)
-                db_shape.track_id = len(db_tracks)
+                shape_idx = len(shape_rows)
+                shape_rows.append((shape.get("id"), track_idx, shape["type"],
+                    shape.get("occluded", False), shape.get("z_order", 0),
+                    shape["points"], shape["frame"], shape.get("outside", False)))
 
                 for attr in shape_attributes:
-                    db_attrval = models.TrackedShapeAttributeVal(**attr)
-                    if db_attrval.spec_id not in self.db_attributes[db_track.label_id]["mutable"]:
-                        raise AttributeError("spec_id `{}` is invalid".format(db_attrval.spec_id))
-                    db_attrval.shape_id = len(db_shapes)
-                    db_shape_attrvals.append(db_attrval)
+                    if attr["spec_id"] not in self.db_attributes[label_id]["mutable"]:
+                        raise AttributeError("spec_id `{}` is invalid".format(attr["spec_id"]))
+                    shape_attrval_rows.append((None, attr["spec_id"], attr["value"], shape_idx))
 
-                db_shapes.append(db_shape)
                 shape["attributes"] = shape_attributes
 
-            db_tracks.append(db_track)
             track["attributes"] = track_attributes
             track["shapes"] = shapes
 
-        db_tracks = bulk_create(
+        track_ids = bulk_insert(
             db_model=models.LabeledTrack,
-            objects=db_tracks,
+            fields=TRACK_FIELDS,
+            rows=track_rows,
             flt_param={"job_id": self.db_job.id}
         )
 
-        for db_attrval in db_track_attrvals:
-            db_attrval.track_id = db_tracks[db_attrval.track_id].id
-        bulk_create(
+        bulk_insert(
             db_model=models.LabeledTrackAttributeVal,
-            objects=db_track_attrvals,
+            fields=ATTRIBUTE_FIELDS + ("track_id", ),
+            rows=[row[:-1] + (track_ids[row[-1]], ) for row in track_attrval_rows],
             flt_param={}
         )
 
-        for db_shape in db_shapes:
-            db_shape.track_id = db_tracks[db_shape.track_id].id
-
-        db_shapes = bulk_create(
+        shape_ids = bulk_insert(
             db_model=models.TrackedShape,
-            objects=db_shapes,
+            fields=TRACKED_SHAPE_FIELDS,
+            rows=[row[:1] + (track_ids[row[1]], ) + row[2:] for row in shape_rows],
             flt_param={"track__job_id": self.db_job.id}
         )
 
-        for db_attrval in db_shape_attrvals:
-            db_attrval.shape_id = db_shapes[db_attrval.shape_id].id
-
-        bulk_create(
+        bulk_insert(
             db_model=models.TrackedShapeAttributeVal,
-            objects=db_shape_attrvals,
+            fields=ATTRIBUTE_FIELDS + ("shape_id", ),
+            rows=[row[:-1] + (shape_ids[row[-1]], ) for row in shape_attrval_rows],
             flt_param={}
         )
 
         shape_idx = 0
-        for track, db_track in zip(tracks, db_tracks):
-            track["id"] = db_track.id
+        for track, track_id in zip(tracks, track_ids):
+            track["id"] = track_id
             for shape in track["shapes"]:
-                shape["id"] = db_shapes[shape_idx].id
+                shape["id"] = shape_ids[shape_idx]
                 shape_idx += 1
 
         self.ir_data.tracks = tracks
 
     def _save_shapes_to_db(self, shapes):
-        db_shapes = []
-        db_attrvals = []
+        shape_rows = []
+        attrval_rows = []
 
         for shape in shapes:
             attributes = shape.pop("attributes", [])
+            label_id = shape["label_id"]
+            if label_id not in self.db_labels:
+                raise AttributeError("label_id `{}` is invalid".format(label_id))
             # FIXME: need to clamp points (be sure that all of them inside the image)
             # Should we check here or implement a validator?
-            db_shape = models.LabeledShape(job=self.db_job, **shape)
-            if db_shape.label_id not in self.db_labels:
-                raise AttributeError("label_id `{}` is invalid".format(db_shape.label_id))
+            shape_idx = len(shape_rows)
+            shape_rows.append((shape.get("id"), self.db_job.id, label_id,
+                shape["frame"], shape.get("group"), shape["type"],
+                shape.get("occluded", False), shape.get("z_order", 0),
+                shape["points"]))
 
             for attr in attributes:
-                db_attrval = models.LabeledShapeAttributeVal(**attr)
-                if db_attrval.spec_id not in self.db_attributes[db_shape.label_id]["all"]:
-                    raise AttributeError("spec_id `{}` is invalid".format(db_attrval.spec_id))
-
-                db_attrval.shape_id = len(db_shapes)
-                db_attrvals.append(db_attrval)
+                if attr["spec_id"] not in self.db_attributes[label_id]["all"]:
+                    raise AttributeError("spec_id `{}` is invalid".format(attr["spec_id"]))
+                attrval_rows.append((None, attr["spec_id"], attr["value"], shape_idx))
 
-            db_shapes.append(db_shape)
             shape["attributes"] = attributes
 
-        db_shapes = bulk_create(
+        shape_ids = bulk_insert(
             db_model=models.LabeledShape,
-            objects=db_shapes,
+            fields=LABELED_SHAPE_FIELDS,
+            rows=shape_rows,
             flt_param={"job_id": self.db_job.id}
         )
 
-        for db_attrval in db_attrvals:
-            db_attrval.shape_id = db_shapes[db_attrval.shape_id].id
-
-        bulk_create(
+        bulk_insert(
             db_model=models.LabeledShapeAttributeVal,
-            objects=db_attrvals,
+            fields=ATTRIBUTE_FIELDS + ("shape_id", ),
+            rows=[row[:-1] + (shape_ids[row[-1]], ) for row in attrval_rows],
             flt_param={}
         )
 
-        for shape, db_shape in zip(shapes, db_shapes):
-            shape["id"] = db_shape.id
+        for shape, shape_id in zip(shapes, shape_ids):
+            shape["id"] = shape_id
 
         self.ir_data.shapes = shapes
 
     def _save_tags_to_db(self, tags):
-        db_tags = []
-        db_attrvals = []
+        tag_rows = []
+        attrval_rows = []
 
         for tag in tags:
             attributes = tag.pop("attributes", [])
-            db_tag = models.LabeledImage(job=self.db_job, **tag)
-            if db_tag.label_id not in self.db_labels:
-                raise AttributeError("label_id `{}` is invalid".format(db_tag.label_id))
+            label_id = tag["label_id"]
+            if label_id not in self.db_labels:
+                raise AttributeError("label_id `{}` is invalid".format(label_id))
+            tag_idx = len(tag_rows)
+            tag_rows.append((tag.get("id"), self.db_job.id, label_id,
+                tag["frame"], tag.get("group")))
 
             for attr in attributes:
-                db_attrval = models.LabeledImageAttributeVal(**attr)
-                if db_attrval.spec_id not in self.db_attributes[db_tag.label_id]["all"]:
-                    raise AttributeError("spec_id `{}` is invalid".format(db_attrval.spec_id))
-                db_attrval.tag_id = len(db_tags)
-                db_attrvals.append(db_attrval)
+                if attr["spec_id"] not in self.db_attributes[label_id]["all"]:
+                    raise AttributeError("spec_id `{}` is invalid".format(attr["spec_id"]))
+                attrval_rows.append((None, attr["spec_id"], attr["value"], tag_idx))
 
-            db_tags.append(db_tag)
             tag["attributes"] = attributes
 
-        db_tags = bulk_create(
+        tag_ids = bulk_insert(
             db_model=models.LabeledImage,
-            objects=db_tags,
+            fields=TAG_FIELDS,
+            rows=tag_rows,
             flt_param={"job_id": self.db_job.id}
         )
 
-        for db_attrval in db_attrvals:
-            db_attrval.image_id = db_tags[db_attrval.tag_id].id
-
-        bulk_create(
+        bulk_insert(
             db_model=models.LabeledImageAttributeVal,
-            objects=db_attrvals,
+            fields=ATTRIBUTE_FIELDS + ("image_id", ),
+            rows=[row[:-1] + (tag_ids[row[-1]], ) for row in attrval_rows],
             flt_param={}
         )
 
-        for tag, db_tag in zip(tags, db_tags):
-            tag["id"] = db_tag.id
+        for tag, tag_id in zip(tags, tag_ids):
+            tag["id"] = tag_id
 
         self.ir_data.tags = tags
 
@@ -466,172 +559,134 @@ class JobAnnotation:
         self._delete(data)
         self._commit()
 
+    def _init_version_from_db(self):
+        db_commit = self.db_job.commits.last()
+        self.ir_data.version = db_commit.version if db_commit else 0
+
     @staticmethod
-    def _extend_attributes(attributeval_set, default_attribute_values):
-        shape_attribute_specs_set = set(attr.spec_id for attr in attributeval_set)
-        for db_attr in default_attribute_values:
-            if db_attr.spec_id not in shape_attribute_specs_set:
-                attributeval_set.append(dotdict([
-                    ('spec_id', db_attr.spec_id),
-                    ('value', db_attr.value),
-                ]))
-
-    def _init_tags_from_db(self):
-        db_tags = self.db_job.labeledimage_set.prefetch_related(
-            "label",
-            "labeledimageattributeval_set"
-        ).values(
-            'id',
-            'frame',
-            'label_id',
-            'group',
-            'labeledimageattributeval__spec_id',
-            'labeledimageattributeval__value',
-            'labeledimageattributeval__id',
-        ).order_by('frame')
-
-        db_tags = _merge_table_rows(
-            rows=db_tags,
-            keys_for_merge={
-                "labeledimageattributeval_set": [
-                    'labeledimageattributeval__spec_id',
-                    'labeledimageattributeval__value',
-                    'labeledimageattributeval__id',
-                ],
-            },
-            field_id='id',
-        )
+    def _group_attributes(rows):
+        attributes = {}
+        for owner_id, spec_id, value in rows:
+            attributes.setdefault(owner_id, []).append(
+                {"spec_id": spec_id, "value": value})
+        return attributes
 
-        for db_tag in db_tags:
-            self._extend_attributes(db_tag.labeledimageattributeval_set,
-                self.db_attributes[db_tag.label_id]["all"].values())
-
-        serializer = serializers.LabeledImageSerializer(db_tags, many=True)
-        self.ir_data.tags = serializer.data
-
-    def _init_shapes_from_db(self):
-        db_shapes = self.db_job.labeledshape_set.prefetch_related(
-            "label",
-            "labeledshapeattributeval_set"
-        ).values(
-            'id',
-            'label_id',
-            'type',
-            'frame',
-            'group',
-            'occluded',
-            'z_order',
-            'points',
-            'labeledshapeattributeval__spec_id',
-            'labeledshapeattributeval__value',
-            'labeledshapeattributeval__id',
-            ).order_by('frame')
-
-        db_shapes = _merge_table_rows(
-            rows=db_shapes,
-            keys_for_merge={
-                'labeledshapeattributeval_set': [
-                    'labeledshapeattributeval__spec_id',
-                    'labeledshapeattributeval__value',
-                    'labeledshapeattributeval__id',
-                ],
-            },
-            field_id='id',
-        )
-        for db_shape in db_shapes:
-            self._extend_attributes(db_shape.labeledshapeattributeval_set,
-                self.db_attributes[db_shape.label_id]["all"].values())
-
-        serializer = serializers.LabeledShapeSerializer(db_shapes, many=True)
-        self.ir_data.shapes = serializer.data
-
-    def _init_tracks_from_db(self):
-        db_tracks = self.db_job.labeledtrack_set.prefetch_related(
-            "label",
-            "labeledtrackattributeval_set",
-            "trackedshape_set__trackedshapeattributeval_set"
-        ).values(
-            "id",
-            "frame",
-            "label_id",
-            "group",
-            "labeledtrackattributeval__spec_id",
-            "labeledtrackattributeval__value",
-            "labeledtrackattributeval__id",
-            "trackedshape__type",
-            "trackedshape__occluded",
-            "trackedshape__z_order",
-            "trackedshape__points",
-            "trackedshape__id",
-            "trackedshape__frame",
-            "trackedshape__outside",
-            "trackedshape__trackedshapeattributeval__spec_id",
-            "trackedshape__trackedshapeattributeval__value",
-            "trackedshape__trackedshapeattributeval__id",
-        ).order_by('id', 'trackedshape__frame')
-
-        db_tracks = _merge_table_rows(
-            rows=db_tracks,
-            keys_for_merge={
-                "labeledtrackattributeval_set": [
-                    "labeledtrackattributeval__spec_id",
-                    "labeledtrackattributeval__value",
-                    "labeledtrackattributeval__id",
-                ],
-                "trackedshape_set":[
-                    "trackedshape__type",
-                    "trackedshape__occluded",
-                    "trackedshape__z_order",
-                    "trackedshape__points",
-                    "trackedshape__id",
-                    "trackedshape__frame",
-                    "trackedshape__outside",
-                    "trackedshape__trackedshapeattributeval__spec_id",
-                    "trackedshape__trackedshapeattributeval__value",
-                    "trackedshape__trackedshapeattributeval__id",
-                ],
-            },
-            field_id="id",
-        )
+    @staticmethod
+    def _add_default_attributes(attributes, default_attribute_values):
+        spec_ids = set(attr["spec_id"] for attr in attributes)
+        for attr in default_attribute_values:
+            if attr["spec_id"] not in spec_ids:
+                attributes.append({"spec_id": attr["spec_id"], "value": attr["value"]})
+        return attributes
+
+    def _iter_tags_from_db(self):
+        attributes = self._group_attributes(models.LabeledImageAttributeVal.objects
+            .filter(image__job_id=self.db_job.id).order_by('id')
+            .values_list('image_id', 'spec_id', 'value'))
+
+        for tag_id, frame, label_id, group in models.LabeledImage.objects \
+                .filter(job_id=self.db_job.id).order_by('frame', 'id') \
+                .values_list('id', 'frame', 'label_id', 'group').iterator():
+            yield {
+                "id": tag_id,
+                "frame": frame,
+                "label_id": label_id,
+                "group": group,
+                "attributes": self._add_default_attributes(
+                    attributes.get(tag_id, []),
+                    self.db_attributes[label_id]["all"].values()),
+            }
 
-        for db_track in db_tracks:
-            db_track["trackedshape_set"] = _merge_table_rows(db_track["trackedshape_set"], {
-                'trackedshapeattributeval_set': [
-                    'trackedshapeattributeval__value',
-                    'trackedshapeattributeval__spec_id',
-                    'trackedshapeattributeval__id',
-                ]
-            }, 'id')
-
-            # A result table can consist many equal rows for track/shape attributes
-            # We need filter unique attributes manually
-            db_track["labeledtrackattributeval_set"] = list(set(db_track["labeledtrackattributeval_set"]))
-            self._extend_attributes(db_track.labeledtrackattributeval_set,
-                self.db_attributes[db_track.label_id]["immutable"].values())
-
-            default_attribute_values = self.db_attributes[db_track.label_id]["mutable"].values()
-            for db_shape in db_track["trackedshape_set"]:
-                db_shape["trackedshapeattributeval_set"] = list(
-                    set(db_shape["trackedshapeattributeval_set"])
-                )
-                # in case of trackedshapes need to interpolate attriute values and extend it
-                # by previous shape attribute values (not default values)
-                self._extend_attributes(db_shape["trackedshapeattributeval_set"], default_attribute_values)
-                default_attribute_values = db_shape["trackedshapeattributeval_set"]
-
-
-        serializer = serializers.LabeledTrackSerializer(db_tracks, many=True)
-        self.ir_data.tracks = serializer.data
+    def _iter_shapes_from_db(self):
+        attributes = self._group_attributes(models.LabeledShapeAttributeVal.objects
+            .filter(shape__job_id=self.db_job.id).order_by('id')
+            .values_list('shape_id', 'spec_id', 'value'))
+
+        for shape_id, label_id, shape_type, frame, group, occluded, z_order, points \
+                in models.LabeledShape.objects.filter(job_id=self.db_job.id) \
+                .order_by('frame', 'id').values_list('id', 'label_id', 'type',
+                'frame', 'group', 'occluded', 'z_order', 'points').iterator():
+            yield {
+                "type": shape_type,
+                "occluded": occluded,
+                "z_order": z_order,
+                "points": points,
+                "id": shape_id,
+                "frame": frame,
+                "label_id": label_id,
+                "group": group,
+                "attributes": self._add_default_attributes(
+                    attributes.get(shape_id, []),
+                    self.db_attributes[label_id]["all"].values()),
+            }
 
-    def _init_version_from_db(self):
-        db_commit = self.db_job.commits.last()
-        self.ir_data.version = db_commit.version if db_commit else 0
+    def _iter_tracks_from_db(self):
+        track_attributes = self._group_attributes(models.LabeledTrackAttributeVal.objects
+            .filter(track__job_id=self.db_job.id).order_by('id')
+            .values_list('track_id', 'spec_id', 'value'))
+        shape_attributes = self._group_attributes(models.TrackedShapeAttributeVal.objects
+            .filter(shape__track__job_id=self.db_job.id).order_by('id')
+            .values_list('shape_id', 'spec_id', 'value'))
+
+        tracked_shapes = {}
+        for track_id, shape_id, shape_type, occluded, z_order, points, frame, outside \
+                in models.TrackedShape.objects.filter(track__job_id=self.db_job.id) \
+                .order_by('track_id', 'frame').values_list('track_id', 'id', 'type',
+                'occluded', 'z_order', 'points', 'frame', 'outside'):
+            tracked_shapes.setdefault(track_id, []).append({
+                "type": shape_type,
+                "occluded": occluded,
+                "z_order": z_order,
+                "points": points,
+                "id": shape_id,
+                "frame": frame,
+                "outside": outside,
+                "attributes": shape_attributes.get(shape_id, []),
+            })
+
+        for track_id, frame, label_id, group in models.LabeledTrack.objects \
+                .filter(job_id=self.db_job.id).order_by('id') \
+                .values_list('id', 'frame', 'label_id', 'group').iterator():
+            # in case of trackedshapes need to interpolate attriute values and extend it
+            # by previous shape attribute values (not default values)
+            default_attribute_values = self.db_attributes[label_id]["mutable"].values()
+            shapes = tracked_shapes.pop(track_id, [])
+            for shape in shapes:
+                self._add_default_attributes(shape["attributes"], default_attribute_values)
+                default_attribute_values = shape["attributes"]
+
+            yield {
+                "id": track_id,
+                "frame": frame,
+                "label_id": label_id,
+                "group": group,
+                "shapes": shapes,
+                "attributes": self._add_default_attributes(
+                    track_attributes.get(track_id, []),
+                    self.db_attributes[label_id]["immutable"].values()),
+            }
 
     def init_from_db(self):
-        self._init_tags_from_db()
-        self._init_shapes_from_db()
-        self._init_tracks_from_db()
+        self.ir_data.tags = list(self._iter_tags_from_db())
+        self.ir_data.shapes = list(self._iter_shapes_from_db())
+        self.ir_data.tracks = list(self._iter_tracks_from_db())
+        self._init_version_from_db()
+
+    def iter_from_db(self):
+        """
+        Returns the annotations like data, but the tags, shapes and tracks
+        are iterators, which read the database while they are consumed.
+        The object lists are read by separate queries, so they must be
+        consumed in the same transaction to match the version.
+        """
+
         self._init_version_from_db()
+        return {
+            "version": self.ir_data.version,
+            "tags": self._iter_tags_from_db(),
+            "shapes": self._iter_shapes_from_db(),
+            "tracks": self._iter_tracks_from_db(),
+        }
 
     @property
     def data(self):
@@ -639,9 +694,9 @@ class JobAnnotation:
 
     def upload(self, annotation_file, loader):
         annotation_importer = Annotation(
-            annotation_ir=self.ir_data,
+            annotation_ir=AnnotationIR(),
             db_task=self.db_job.segment.task,
-            create_callback=self.create,
+            segments=[(self.start_frame, self.stop_frame, self.create)],
             )
         self.delete()
         db_format = loader.annotation_format
@@ -657,7 +712,110 @@ class JobAnnotation:
             global_vars["annotations"] = annotation_importer
 
             execute_python_code("{}(file_object, annotations)".format(loader.handler), global_vars)
-        self.create(annotation_importer.data.slice(self.start_frame, self.stop_frame).serialize())
+        annotation_importer.flush()
+
+class TaskAnnotationCache:
+    """
+    On-disk cache of job annotations and of matching results at segment
+    boundaries of a task. Cached data is validated by job commit versions,
+    so the merged task annotations can be updated incrementally.
+    The cache is kept in the task directory and removed with the task.
+    """
+
+    _STATE_FILE = "boundaries.json"
+
+    def __init__(self, db_task, labels_key):
+        self._dirname = db_task.get_annotation_cache_dirname()
+        self._labels_key = self.get_key_digest(labels_key)
+        self._boundaries = {}
+        self._jobs = {}
+        self._changed = False
+        self.job_hits = 0
+        self.job_misses = 0
+        self.boundary_hits = 0
+        self.boundary_misses = 0
+
+        state = self._read(self._STATE_FILE)
+        if state and state["labels_key"] == self._labels_key:
+            self._boundaries = { int(jid): (key, self._load_matches(matches))
+                for jid, (key, matches) in state["boundaries"].items() }
+        elif os.path.isdir(self._dirname):
+            # default attribute values of all jobs could be changed
+            shutil.rmtree(self._dirname, ignore_errors=True)
+
+    @staticmethod
+    def get_key_digest(key):
+        # the sets are sorted to make the digest independent of the order
+        return hashlib.sha1(json.dumps(key, sort_keys=True,
+            default=sorted).encode()).hexdigest()
+
+    @staticmethod
+    def _load_matches(matches):
+        # JSON object keys are strings, the frames are restored
+        return { kind: { int(frame): frame_matches
+                for frame, frame_matches in kind_matches.items() }
+            for kind, kind_matches in matches.items() }
+
+    def _read(self, filename):
+        try:
+            with open(os.path.join(self._dirname, filename)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, filename, data):
+        os.makedirs(self._dirname, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._dirname)
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, os.path.join(self._dirname, filename))
+
+    @staticmethod
+    def _get_job_filename(jid, version):
+        return "job_{}_{}.json".format(jid, version)
+
+    def get_job_data(self, jid, version):
+        data = self._read(self._get_job_filename(jid, version))
+        if data is None:
+            self.job_misses += 1
+        else:
+            self.job_hits += 1
+        return data
+
+    def put_job_data(self, jid, version, data):
+        # the data is modified by merging, so it is written right away
+        self._write(self._get_job_filename(jid, version), data)
+        self._jobs[jid] = version
+        self._changed = True
+
+    def get_matches(self, jid, key):
+        cached_key, matches = self._boundaries.get(jid, (None, None))
+        if cached_key == key:
+            self.boundary_hits += 1
+            return matches
+        self.boundary_misses += 1
+        return None
+
+    def put_matches(self, jid, key, matches):
+        if self._boundaries.get(jid, (None, None))[0] != key:
+            self._boundaries[jid] = (key, matches)
+            self._changed = True
+
+    def save(self):
+        if not self._changed:
+            return
+
+        self._write(self._STATE_FILE, {
+            "labels_key": self._labels_key,
+            "boundaries": self._boundaries,
+        })
+
+        for jid, version in self._jobs.items():
+            prefix = "job_{}_".format(jid)
+            for filename in os.listdir(self._dirname):
+                if filename.startswith(prefix) and \
+                        filename != self._get_job_filename(jid, version):
+                    os.remove(os.path.join(self._dirname, filename))
 
 class TaskAnnotation:
     def __init__(self, pk, user):
@@ -712,8 +870,13 @@ class TaskAnnotation:
             for db_job in self.db_jobs:
                 delete_job_data(db_job.id, self.user)
 
-    def init_from_db(self):
+    def init_from_db(self, use_cache=None):
         self.reset()
+        if use_cache is None:
+            use_cache = settings.TASK_ANNOTATION_CACHE
+        if use_cache:
+            self._init_from_cache()
+            return
 
         for db_job in self.db_jobs:
             annotation = JobAnnotation(db_job.id, self.user)
@@ -725,6 +888,77 @@ class TaskAnnotation:
             overlap = self.db_task.overlap
             self._merge_data(annotation.ir_data, start_frame, overlap)
 
+    def _get_labels_key(self):
+        return tuple(models.AttributeSpec.objects \
+            .filter(label__task_id=self.db_task.id).order_by("id") \
+            .values_list("id", "label_id", "mutable", "default_value"))
+
+    _SOURCE_KEY = "_merge_source"
+
+    def _init_from_cache(self):
+        """
+        Merges job annotations with reusing of the matching results at
+        segment boundaries which don't depend on changed jobs.
+
+        Each merged object keeps the set of jobs (with their versions)
+        which define its content. Objects which take part in matching get
+        the union of these sets, and a cached matching result is reused
+        only if the job and the ordered matching candidates are the same.
+        """
+        self.merge_cache = TaskAnnotationCache(self.db_task, self._get_labels_key())
+        versions = dict(models.JobCommit.objects \
+            .filter(job__segment__task_id=self.db_task.id) \
+            .values("job_id").annotate(version=Max("version")) \
+            .values_list("job_id", "version"))
+        overlap = self.db_task.overlap
+        # (job id, object index) -> the set of (job id, version)
+        sources = { kind: {} for kind in ("tags", "shapes", "tracks") }
+
+        for db_job in self.db_jobs:
+            version = versions.get(db_job.id, 0)
+            job_source = frozenset([(db_job.id, version)])
+            data = self.merge_cache.get_job_data(db_job.id, version)
+            if data is None:
+                annotation = JobAnnotation(db_job.id, self.user)
+                annotation.init_from_db()
+                data = annotation.data
+                self.merge_cache.put_job_data(db_job.id, version, data)
+            job_data = AnnotationIR(data)
+            if version > self.ir_data.version:
+                self.ir_data.version = version
+
+            # the objects are marked with their position in the job data,
+            # the mark is kept by merging and removed in the end
+            for kind in sources:
+                for idx, obj in enumerate(job_data[kind]):
+                    obj[self._SOURCE_KEY] = (db_job.id, idx)
+
+            start_frame = db_job.segment.start_frame
+            data_manager = DataManager(self.ir_data)
+            candidates = data_manager.get_merge_candidates(start_frame)
+            candidate_sources = { kind: [sources[kind][obj[self._SOURCE_KEY]]
+                for obj in objects] for kind, objects in candidates.items() }
+            key = TaskAnnotationCache.get_key_digest([version, candidate_sources])
+            matches = data_manager.merge(job_data, start_frame, overlap,
+                self.merge_cache.get_matches(db_job.id, key))
+            self.merge_cache.put_matches(db_job.id, key, matches)
+
+            for kind, objects in candidates.items():
+                source = job_source.union(*candidate_sources[kind])
+                for obj in objects:
+                    sources[kind][obj[self._SOURCE_KEY]] = source
+                for obj in job_data[kind]:
+                    if obj["frame"] < start_frame + overlap:
+                        sources[kind][obj[self._SOURCE_KEY]] = source
+                    else:
+                        sources[kind][obj[self._SOURCE_KEY]] = job_source
+
+        for kind in sources:
+            for obj in self.ir_data[kind]:
+                del obj[self._SOURCE_KEY]
+
+        self.merge_cache.save()
+
     def dump(self, filename, dumper, scheme, host):
         anno_exporter = Annotation(
             annotation_ir=self.ir_data,
@@ -749,7 +983,9 @@ class TaskAnnotation:
         annotation_importer = Annotation(
             annotation_ir=AnnotationIR(),
             db_task=self.db_task,
-            create_callback=self.create,
+            segments=[(db_job.segment.start_frame, db_job.segment.stop_frame,
+                functools.partial(self._create_job_data, db_job.id))
+                for db_job in self.db_jobs],
             )
         self.delete()
         db_format = loader.annotation_format
@@ -764,7 +1000,10 @@ class TaskAnnotation:
             global_vars["annotations"] = annotation_importer
 
             execute_python_code("{}(file_object, annotations)".format(loader.handler), global_vars)
-        self.create(annotation_importer.data.serialize())
+        annotation_importer.flush()
+
+    def _create_job_data(self, jid, data):
+        patch_job_data(jid, self.user, data, PatchAction.CREATE)
 
     @property
     def data(self):
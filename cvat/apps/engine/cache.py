@@ -0,0 +1,267 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import fcntl
+import json
+import math
+import os
+import os.path as osp
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from cvat.apps.engine.log import slogger
+from cvat.apps.engine.media_extractors import (MEDIA_TYPES, ListChunkWriter,
+    Mpeg4ChunkWriter, Mpeg4CompressedChunkWriter, VideoFrameIndex,
+    VideoReader, ZipChunkWriter, ZipCompressedChunkWriter)
+from cvat.apps.engine.models import DataChoice
+
+
+# the media, which can be read by frame ranges without preprocessing
+LAZY_MEDIA_TYPES = ('image', 'directory', 'zip', 'video')
+
+def get_chunk_writer(db_data, original):
+    if original:
+        writer_class = {
+            DataChoice.VIDEO: Mpeg4ChunkWriter,
+            DataChoice.IMAGESET: ZipChunkWriter,
+            DataChoice.LIST: ListChunkWriter,
+        }[db_data.original_chunk_type]
+        return writer_class(100)
+
+    writer_class = Mpeg4CompressedChunkWriter \
+        if db_data.compressed_chunk_type == DataChoice.VIDEO \
+        else ZipCompressedChunkWriter
+    return writer_class(db_data.image_quality)
+
+def save_media_info(db_data, media_type, media_files):
+    with open(db_data.get_media_info_path(), 'w') as f:
+        json.dump({ 'media_type': media_type, 'files': media_files }, f)
+
+def load_media_info(db_data):
+    with open(db_data.get_media_info_path()) as f:
+        return json.load(f)
+
+def make_chunk_extractor(db_data, chunk_number):
+    """
+    Returns an iterator over the source frames of the chunk
+    """
+
+    media_info = load_media_info(db_data)
+    media_type = media_info['media_type']
+    upload_dir = db_data.get_upload_dirname()
+    source_path = [osp.join(upload_dir, f) for f in media_info['files']]
+
+    step = db_data.get_frame_step()
+    first_frame = chunk_number * db_data.chunk_size
+    last_frame = min(first_frame + db_data.chunk_size, db_data.size) - 1
+    start = db_data.start_frame + first_frame * step
+    stop = db_data.start_frame + last_frame * step
+
+    if media_type == 'video':
+        # the index of the source video is built on task creation
+        reader = VideoReader(source_path, step=step, start=start, stop=stop,
+            index=VideoFrameIndex.get(source_path[0]))
+        return reader.iterate_from(start)
+
+    return iter(MEDIA_TYPES[media_type]['extractor'](
+        source_path=source_path, step=step, start=start, stop=stop))
+
+class ChunkStorage:
+    """
+    Builds the chunks of the tasks, created without chunks, on request
+    and keeps them in the data directories. The following chunks are
+    built in background. When the total size of the chunks exceeds
+    the limit, the least recently used ones are removed. The chunks,
+    used in the last keep_time seconds, are not removed, because the web
+    server can still be sending them.
+
+    The chunks are shared by the server processes, the size and the access
+    time of the files are the shared state. Each process tracks the chunk
+    sizes in memory and reloads the index from the data directories every
+    rescan_interval seconds, so the chunks of the other processes are
+    counted. The chunks are removed under a file lock and only if they
+    were not used by any process in the last keep_time seconds.
+    """
+
+    def __init__(self, data_root, max_size, prefetch_count, keep_time=60,
+            rescan_interval=60):
+        self._data_root = data_root
+        self._max_size = max_size
+        self._prefetch_count = prefetch_count
+        self._keep_time = keep_time
+        self._rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        self._building = {} # chunk path: lock
+        self._prefetching = set()
+        self._executor = None
+        self._index = None # chunk path: (size, last use time), in LRU order
+        self._index_time = None
+        self._size = 0
+
+    @staticmethod
+    def _get_chunk_path(db_data, chunk_number, original):
+        if original:
+            return db_data.get_original_chunk_path(chunk_number)
+        return db_data.get_compressed_chunk_path(chunk_number)
+
+    def get_chunk(self, db_data, chunk_number, original):
+        chunk_path = self._get_chunk_path(db_data, chunk_number, original)
+        self._build(db_data, chunk_number, original, chunk_path)
+        self._prefetch(db_data, chunk_number, original)
+        return chunk_path
+
+    def _build(self, db_data, chunk_number, original, chunk_path):
+        with self._lock:
+            lock = self._building.setdefault(chunk_path, threading.Lock())
+
+        with lock:
+            built = not osp.isfile(chunk_path)
+            if built:
+                self._write_chunk(db_data, chunk_number, original, chunk_path)
+            else:
+                # the access time orders the chunks for eviction,
+                # the modification time must be kept for the frame cache
+                os.utime(chunk_path, (time.time(), osp.getmtime(chunk_path)))
+
+        with self._lock:
+            self._building.pop(chunk_path, None)
+            self._add_to_index(chunk_path)
+            if built:
+                self._evict()
+
+    @staticmethod
+    def _write_chunk(db_data, chunk_number, original, chunk_path):
+        images = list(make_chunk_extractor(db_data, chunk_number))
+        if not images:
+            raise Exception('Chunk {} has no frames'.format(chunk_number))
+
+        # the extension is kept for the writers
+        root, ext = osp.splitext(chunk_path)
+        tmp_path = '{}.{}-{}.tmp{}'.format(root, os.getpid(),
+            threading.get_ident(), ext)
+        tmp_index_path = VideoFrameIndex.get_index_path(tmp_path)
+        try:
+            get_chunk_writer(db_data, original).save_as_chunk(images, tmp_path)
+            if osp.isfile(tmp_index_path):
+                os.replace(tmp_index_path,
+                    VideoFrameIndex.get_index_path(chunk_path))
+            os.replace(tmp_path, chunk_path)
+        finally:
+            for path in [tmp_path, tmp_index_path]:
+                if osp.isfile(path):
+                    os.remove(path)
+
+    def _prefetch(self, db_data, chunk_number, original):
+        chunk_count = math.ceil(db_data.size / db_data.chunk_size)
+        for next_chunk in range(chunk_number + 1,
+                min(chunk_number + 1 + self._prefetch_count, chunk_count)):
+            chunk_path = self._get_chunk_path(db_data, next_chunk, original)
+            if osp.isfile(chunk_path):
+                continue
+
+            with self._lock:
+                if chunk_path in self._prefetching:
+                    continue
+                self._prefetching.add(chunk_path)
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1)
+            self._executor.submit(self._prefetch_chunk, db_data, next_chunk,
+                original, chunk_path)
+
+    def _prefetch_chunk(self, db_data, chunk_number, original, chunk_path):
+        try:
+            self._build(db_data, chunk_number, original, chunk_path)
+        except Exception:
+            slogger.glob.error('cannot build chunk {} of data #{}'.format(
+                chunk_number, db_data.id), exc_info=True)
+        finally:
+            with self._lock:
+                self._prefetching.discard(chunk_path)
+
+    def _list_chunks(self):
+        for data_dir in os.scandir(self._data_root):
+            # only the data of the tasks, created without chunks, is evicted
+            if not osp.isfile(osp.join(data_dir.path, 'media.json')):
+                continue
+            for chunk_dir in ['compressed', 'original']:
+                chunk_dir = osp.join(data_dir.path, chunk_dir)
+                if not osp.isdir(chunk_dir):
+                    continue
+                for entry in os.scandir(chunk_dir):
+                    if '.tmp' in entry.name or \
+                            entry.name.endswith('.index.json'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, stat.st_size, stat.st_atime
+
+    def _load_index(self):
+        self._index = OrderedDict(
+            (chunk_path, (size, atime))
+            for chunk_path, size, atime in sorted(self._list_chunks(),
+                key=lambda chunk: chunk[2]))
+        self._index_time = time.monotonic()
+        self._size = sum(size for size, _ in self._index.values())
+
+    def _add_to_index(self, chunk_path):
+        if self._index is None:
+            self._load_index()
+
+        prev_size, _ = self._index.pop(chunk_path, (0, None))
+        self._size -= prev_size
+        try:
+            size = osp.getsize(chunk_path)
+        except OSError: # removed by another process
+            return
+        self._index[chunk_path] = (size, time.time())
+        self._size += size
+
+    @contextmanager
+    def _lock_storage(self):
+        # the chunks are removed by one process at a time
+        with open(osp.join(self._data_root, '.chunks.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _evict(self):
+        # the chunks of the other processes are counted after a rescan
+        if self._rescan_interval <= time.monotonic() - self._index_time:
+            self._load_index()
+        if self._size <= self._max_size:
+            return
+
+        with self._lock_storage():
+            now = time.time()
+            # the most recently used chunk is kept even if it doesn't fit
+            for chunk_path, (size, last_use) in list(self._index.items()):
+                if self._size <= self._max_size or len(self._index) <= 1 or \
+                        now - last_use < self._keep_time:
+                    break
+                del self._index[chunk_path]
+                self._size -= size
+
+                try:
+                    stat = os.stat(chunk_path)
+                except OSError: # removed by another process
+                    continue
+                if now - stat.st_atime < self._keep_time:
+                    # used by another process after the scan
+                    self._index[chunk_path] = (stat.st_size, stat.st_atime)
+                    self._size += stat.st_size
+                    continue
+
+                for path in [chunk_path,
+                        VideoFrameIndex.get_index_path(chunk_path)]:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
@@ -3,9 +3,13 @@
 # SPDX-License-Identifier: MIT
 
 import copy
+from collections.abc import MutableSequence, Sequence
 
 import numpy as np
 from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+import shapely
 from shapely import geometry
 
 from . import models
@@ -15,15 +19,24 @@ class DataManager:
     def __init__(self, data):
         self.data = data
 
-    def merge(self, data, start_frame, overlap):
-        tags = TagManager(self.data.tags)
-        tags.merge(data.tags, start_frame, overlap)
+    def _get_managers(self):
+        return {
+            'tags': TagManager(self.data.tags),
+            'shapes': ShapeManager(self.data.shapes),
+            'tracks': TrackManager(self.data.tracks),
+        }
 
-        shapes = ShapeManager(self.data.shapes)
-        shapes.merge(data.shapes, start_frame, overlap)
+    def get_merge_candidates(self, start_frame):
+        return { kind: manager.get_merge_candidates(start_frame)
+            for kind, manager in self._get_managers().items() }
 
-        tracks = TrackManager(self.data.tracks)
-        tracks.merge(data.tracks, start_frame, overlap)
+    def merge(self, data, start_frame, overlap, matches=None):
+        computed_matches = {}
+        for kind, manager in self._get_managers().items():
+            computed_matches[kind] = manager.merge(getattr(data, kind),
+                start_frame, overlap, matches[kind] if matches is not None else None)
+
+        return computed_matches
 
     def to_shapes(self, end_frame):
         shapes = self.data.shapes
@@ -69,7 +82,29 @@ class ObjectManager:
     def _modify_unmached_object(obj, end_frame):
         raise NotImplementedError()
 
-    def merge(self, objects, start_frame, overlap):
+    @staticmethod
+    def _prepare_objects(int_objects, old_objects, start_frame, overlap):
+        # Makes the same changes in objects as the similarity calculation
+        # does. It is used when matching results are passed to merge.
+        pass
+
+    def get_merge_candidates(self, start_frame):
+        """
+        Returns existing objects which can be matched with objects
+        of a segment, started from start_frame, in the order of matching
+        """
+        objects_by_frame = self._get_objects_by_frame(self.objects, start_frame)
+        return [obj for objects in objects_by_frame.values() for obj in objects]
+
+    def merge(self, objects, start_frame, overlap, matches=None):
+        """
+        Merges objects of a segment into the existing objects. Returns
+        matched pairs of object indexes for each frame. Matches from
+        a previous merge of the same objects can be passed to skip
+        the matching.
+        """
+        computed_matches = {}
+
         # 1. Split objects on two parts: new and which can be intersected
         # with existing objects.
         new_objects = [obj for obj in objects
@@ -92,7 +127,7 @@ class ObjectManager:
                 for old_obj in old_objects_by_frame[frame]:
                     self._modify_unmached_object(old_obj, start_frame + overlap)
             self.objects.extend(int_objects)
-            return
+            return computed_matches
 
         # 4. Build cost matrix for each frame and find correspondence using
         # Hungarian algorithm. In this case min_cost_thresh is stronger
@@ -102,25 +137,22 @@ class ObjectManager:
             if frame in old_objects_by_frame:
                 int_objects = int_objects_by_frame[frame]
                 old_objects = old_objects_by_frame[frame]
-                cost_matrix = np.empty(shape=(len(int_objects), len(old_objects)),
-                    dtype=float)
-                # 5.1 Construct cost matrix for the frame.
-                for i, int_obj in enumerate(int_objects):
-                    for j, old_obj in enumerate(old_objects):
-                        cost_matrix[i][j] = 1 - self._calc_objects_similarity(
-                            int_obj, old_obj, start_frame, overlap)
-
-                # 6. Find optimal solution using Hungarian algorithm.
-                row_ind, col_ind = linear_sum_assignment(cost_matrix)
+                if matches is not None:
+                    self._prepare_objects(int_objects, old_objects,
+                        start_frame, overlap)
+                    frame_matches = matches.get(frame, [])
+                else:
+                    frame_matches = self._match_objects(int_objects, old_objects,
+                        start_frame, overlap, min_cost_thresh)
+                if frame_matches:
+                    computed_matches[frame] = frame_matches
+
                 old_objects_indexes = list(range(0, len(old_objects)))
                 int_objects_indexes = list(range(0, len(int_objects)))
-                for i, j in zip(row_ind, col_ind):
-                    # Reject the solution if the cost is too high. Remember
-                    # inside int_objects_indexes objects which were handled.
-                    if cost_matrix[i][j] <= min_cost_thresh:
-                        old_objects[j] = self._unite_objects(int_objects[i], old_objects[j])
-                        int_objects_indexes[i] = -1
-                        old_objects_indexes[j] = -1
+                for i, j in frame_matches:
+                    old_objects[j] = self._unite_objects(int_objects[i], old_objects[j])
+                    int_objects_indexes[i] = -1
+                    old_objects_indexes[j] = -1
 
                 # 7. Add all new objects which were not processed.
                 for i in int_objects_indexes:
@@ -137,6 +169,80 @@ class ObjectManager:
                 # We don't have old objects on the frame. Let's add all new ones.
                 self.objects.extend(int_objects_by_frame[frame])
 
+        return computed_matches
+
+    @staticmethod
+    def _group_objects(int_objects, old_objects, key):
+        groups = {}
+        for idx, obj in enumerate(int_objects):
+            groups.setdefault(key(obj), ([], []))[0].append(idx)
+        for idx, obj in enumerate(old_objects):
+            group = groups.get(key(obj))
+            if group is not None:
+                group[1].append(idx)
+        return groups
+
+    @staticmethod
+    def _get_candidate_pairs(int_objects, old_objects):
+        """
+        Returns pairs of indexes of objects which can be similar.
+        Similarity of other pairs is considered zero.
+        """
+        groups = ObjectManager._group_objects(int_objects, old_objects,
+            lambda obj: obj["label_id"])
+        for int_indexes, old_indexes in groups.values():
+            for i in int_indexes:
+                for j in old_indexes:
+                    yield i, j
+
+    def _match_objects(self, int_objects, old_objects, start_frame, overlap,
+            min_cost_thresh):
+        # 5.1 Compute costs for pairs of objects which can be similar.
+        # Other pairs have the maximal cost.
+        rows, cols, costs = [], [], []
+        for i, j in self._get_candidate_pairs(int_objects, old_objects):
+            cost = 1 - self._calc_objects_similarity(
+                int_objects[i], old_objects[j], start_frame, overlap)
+            if cost < 1:
+                rows.append(i)
+                cols.append(j)
+                costs.append(cost)
+        if not costs:
+            return []
+
+        # 6. Find optimal solution using Hungarian algorithm for each
+        # connected component of similar objects. Pairs with the maximal
+        # cost are rejected anyway, so the solution is the same as for
+        # the whole cost matrix.
+        int_count = len(int_objects)
+        nodes = int_count + len(old_objects)
+        graph = coo_matrix((np.ones(len(rows)),
+            (rows, [int_count + j for j in cols])), shape=(nodes, nodes))
+        _, components = connected_components(graph, directed=False)
+
+        edges_by_component = {}
+        for i, j, cost in zip(rows, cols, costs):
+            edges_by_component.setdefault(components[i], []).append((i, j, cost))
+
+        matches = []
+        for edges in edges_by_component.values():
+            int_indexes = sorted(set(i for i, _, _ in edges))
+            old_indexes = sorted(set(j for _, j, _ in edges))
+            int_positions = { idx: pos for pos, idx in enumerate(int_indexes) }
+            old_positions = { idx: pos for pos, idx in enumerate(old_indexes) }
+            cost_matrix = np.ones(shape=(len(int_indexes), len(old_indexes)),
+                dtype=float)
+            for i, j, cost in edges:
+                cost_matrix[int_positions[i]][old_positions[j]] = cost
+
+            # Reject the solution if the cost is too high.
+            row_ind, col_ind = linear_sum_assignment(cost_matrix)
+            matches.extend((int_indexes[r], old_indexes[c])
+                for r, c in zip(row_ind, col_ind)
+                if cost_matrix[r][c] <= min_cost_thresh)
+
+        return sorted(matches)
+
 class TagManager(ObjectManager):
     @staticmethod
     def _get_cost_threshold():
@@ -189,6 +295,46 @@ class ShapeManager(ObjectManager):
     def _get_cost_threshold():
         return 0.25
 
+    # Rectangles are compared in blocks to limit the memory usage
+    _BOX_BLOCK_SIZE = 1024
+
+    @staticmethod
+    def _get_boxes(objects, indexes):
+        boxes = np.array([objects[idx]["points"][:4] for idx in indexes],
+            dtype=float).reshape(-1, 4)
+        return np.concatenate([
+            np.minimum(boxes[:, 0:2], boxes[:, 2:4]),
+            np.maximum(boxes[:, 0:2], boxes[:, 2:4]),
+        ], axis=1)
+
+    @staticmethod
+    def _get_candidate_pairs(int_objects, old_objects):
+        groups = ObjectManager._group_objects(int_objects, old_objects,
+            lambda obj: (obj["type"], obj.get("label_id")))
+        for (shape_type, _), (int_indexes, old_indexes) in groups.items():
+            if not old_indexes:
+                continue
+
+            if shape_type == models.ShapeType.RECTANGLE:
+                # Only rectangles with intersecting bounding boxes can
+                # have non-zero IoU. Touching ones are kept for simplicity.
+                int_boxes = ShapeManager._get_boxes(int_objects, int_indexes)
+                old_boxes = ShapeManager._get_boxes(old_objects, old_indexes)
+                block_size = ShapeManager._BOX_BLOCK_SIZE
+                for start in range(0, len(int_indexes), block_size):
+                    boxes = int_boxes[start : start + block_size, np.newaxis]
+                    intersects = np.all(
+                        (boxes[..., 0:2] <= old_boxes[:, 2:4]) & \
+                        (old_boxes[:, 0:2] <= boxes[..., 2:4]), axis=2)
+                    for r, c in zip(*np.nonzero(intersects)):
+                        yield int_indexes[start + r], old_indexes[c]
+            elif shape_type == models.ShapeType.POLYGON:
+                # The similarity of polygons doesn't depend on their
+                # positions (see _calc_objects_similarity)
+                for i in int_indexes:
+                    for j in old_indexes:
+                        yield i, j
+
     @staticmethod
     def _calc_objects_similarity(obj0, obj1, start_frame, overlap):
         def _calc_polygons_similarity(p0, p1):
@@ -221,6 +367,69 @@ class ShapeManager(ObjectManager):
     def _modify_unmached_object(obj, end_frame):
         pass
 
+class _InterpolatedShape:
+    __slots__ = ('template', 'frame', 'points')
+
+    def __init__(self, template, frame, points):
+        self.template = template
+        self.frame = frame
+        self.points = points
+
+    def build(self):
+        shape = TrackManager._copy_shape(self.template)
+        shape["points"] = self.points.copy()
+        shape["keyframe"] = False
+        shape["frame"] = self.frame
+        return shape
+
+class InterpolatedShapes(MutableSequence):
+    """
+    Key and interpolated shapes of a track in frame order. The interpolated
+    shapes are kept as points and their dicts are built on first access.
+    """
+
+    def __init__(self, shapes=()):
+        self._shapes = list(shapes)
+
+    def _get(self, idx):
+        shape = self._shapes[idx]
+        if isinstance(shape, _InterpolatedShape):
+            shape = shape.build()
+            self._shapes[idx] = shape
+        return shape
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._get(i) for i in range(*idx.indices(len(self)))]
+        return self._get(idx)
+
+    def __setitem__(self, idx, shape):
+        self._shapes[idx] = shape
+
+    def __delitem__(self, idx):
+        del self._shapes[idx]
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def insert(self, idx, shape):
+        self._shapes.insert(idx, shape)
+
+    def extend(self, shapes):
+        self._shapes.extend(shapes)
+
+    def between(self, start_frame, stop_frame):
+        """Returns the shapes of the frames in [start_frame, stop_frame]"""
+
+        return [self._get(idx) for idx, shape in enumerate(self._shapes)
+            if start_frame <= (shape.frame if isinstance(shape,
+                _InterpolatedShape) else shape["frame"]) <= stop_frame]
+
 class TrackManager(ObjectManager):
     def to_shapes(self, end_frame):
         shapes = []
@@ -258,8 +467,10 @@ class TrackManager(ObjectManager):
             # and stop_frame is the stop frame of current segment
             # end_frame == stop_frame + 1
             end_frame = start_frame + overlap
-            obj0_shapes = TrackManager.get_interpolated_shapes(obj0, start_frame, end_frame)
-            obj1_shapes = TrackManager.get_interpolated_shapes(obj1, start_frame, end_frame)
+            obj0_shapes = TrackManager.get_interpolated_shapes(obj0,
+                start_frame, end_frame).between(start_frame, end_frame - 1)
+            obj1_shapes = TrackManager.get_interpolated_shapes(obj1,
+                start_frame, end_frame).between(start_frame, end_frame - 1)
             obj0_shapes_by_frame = {shape["frame"]:shape for shape in obj0_shapes}
             obj1_shapes_by_frame = {shape["frame"]:shape for shape in obj1_shapes}
             assert obj0_shapes_by_frame and obj1_shapes_by_frame
@@ -300,6 +511,26 @@ class TrackManager(ObjectManager):
                     obj["interpolated_shapes"].append(last_interpolated_shape)
                 obj["interpolated_shapes"].append(shape)
 
+    @staticmethod
+    def _prepare_objects(int_objects, old_objects, start_frame, overlap):
+        # Interpolated shapes are cached in tracks and key shapes get
+        # 'keyframe' and inherited attributes
+        int_labels = set(obj["label_id"] for obj in int_objects)
+        old_labels = set(obj["label_id"] for obj in old_objects)
+        end_frame = start_frame + overlap
+        for obj in int_objects:
+            if obj["label_id"] in old_labels:
+                TrackManager.get_interpolated_shapes(obj, start_frame, end_frame)
+        for obj in old_objects:
+            if obj["label_id"] in int_labels:
+                TrackManager.get_interpolated_shapes(obj, start_frame, end_frame)
+
+    # Shapely 2.0+ provides vectorized versions of the geometry operations.
+    # The results are the same as for the per-geometry calls.
+    _VECTORIZED_GEOMETRY = hasattr(shapely, 'linestrings')
+    _NORMALIZED_POINTS_COUNT = 100
+    _SIMPLIFY_TOLERANCE = 0.05
+
     @staticmethod
     def normalize_shape(shape):
         points = list(shape["points"])
@@ -307,11 +538,17 @@ class TrackManager(ObjectManager):
             points.extend(points) # duplicate points for single point case
         points = np.asarray(points).reshape(-1, 2)
         broken_line = geometry.LineString(points)
-        points = []
-        for off in range(0, 100, 1):
-            p = broken_line.interpolate(off / 100, True)
-            points.append(p.x)
-            points.append(p.y)
+        count = TrackManager._NORMALIZED_POINTS_COUNT
+        if TrackManager._VECTORIZED_GEOMETRY:
+            resampled = shapely.line_interpolate_point(broken_line,
+                np.arange(count) / count, normalized=True)
+            points = shapely.get_coordinates(resampled).ravel().tolist()
+        else:
+            points = []
+            for off in range(0, count, 1):
+                p = broken_line.interpolate(off / count, True)
+                points.append(p.x)
+                points.append(p.y)
 
         shape = copy.copy(shape)
         shape["points"] = points
@@ -319,42 +556,88 @@ class TrackManager(ObjectManager):
         return shape
 
     @staticmethod
-    def get_interpolated_shapes(track, start_frame, end_frame):
-        def interpolate(shape0, shape1):
-            shapes = []
-            is_same_type = shape0["type"] == shape1["type"]
-            is_polygon = shape0["type"] == models.ShapeType.POLYGON
-            is_polyline = shape0["type"] == models.ShapeType.POLYLINE
-            is_same_size = len(shape0["points"]) == len(shape1["points"])
-            if not is_same_type or is_polygon or is_polyline or not is_same_size:
-                shape0 = TrackManager.normalize_shape(shape0)
-                shape1 = TrackManager.normalize_shape(shape1)
+    def _simplify_lines(lines):
+        """
+        Simplifies each of the broken lines (an array of [N, K, 2] shape)
+        and returns the list of flattened point lists.
+        """
+
+        tolerance = TrackManager._SIMPLIFY_TOLERANCE
+        if lines.shape[1] == 2:
+            # Simplification keeps the end points of a line as is,
+            # so only degenerate lines can be changed here.
+            simplified = [None] * len(lines)
+            degenerate = np.all(lines[:, 0] == lines[:, 1], axis=1)
+            for idx, line in enumerate(lines.astype(float)):
+                if not degenerate[idx]:
+                    simplified[idx] = line.ravel().tolist()
+            for idx in np.flatnonzero(degenerate):
+                broken_line = geometry.LineString(lines[idx]).simplify(tolerance, False)
+                simplified[idx] = [x for p in broken_line.coords for x in p]
+            return simplified
+
+        if TrackManager._VECTORIZED_GEOMETRY:
+            broken_lines = shapely.simplify(shapely.linestrings(lines),
+                tolerance, preserve_topology=False)
+            coords, line_idx = shapely.get_coordinates(broken_lines,
+                return_index=True)
+            bounds = np.cumsum(np.bincount(line_idx, minlength=len(lines)))
+            return [c.ravel().tolist() for c in np.split(coords, bounds[:-1])]
+
+        simplified = []
+        for line in lines:
+            broken_line = geometry.LineString(line).simplify(tolerance, False)
+            simplified.append([x for p in broken_line.coords for x in p])
+        return simplified
 
+    @staticmethod
+    def _copy_shape(shape):
+        # A faster replacement for deepcopy. Points are replaced by callers,
+        # other values except attributes are immutable.
+        shape = copy.copy(shape)
+        shape["attributes"] = [copy.copy(attr) for attr in shape["attributes"]]
+        return shape
+
+    @staticmethod
+    def _interpolate(shape0, shape1):
+        is_same_type = shape0["type"] == shape1["type"]
+        is_polygon = shape0["type"] == models.ShapeType.POLYGON
+        is_polyline = shape0["type"] == models.ShapeType.POLYLINE
+        is_same_size = len(shape0["points"]) == len(shape1["points"])
+        if not is_same_type or is_polygon or is_polyline or not is_same_size:
+            shape0 = TrackManager.normalize_shape(shape0)
+            shape1 = TrackManager.normalize_shape(shape1)
+
+        frames = np.arange(shape0["frame"] + 1, shape1["frame"])
+        if not len(frames):
+            return []
+
+        # All in-between frames are computed at once, a row per frame
+        if shape1["outside"]:
+            points = np.tile(np.asarray(shape0["points"]), (len(frames), 1))
+        else:
             distance = shape1["frame"] - shape0["frame"]
             step = np.subtract(shape1["points"], shape0["points"]) / distance
-            for frame in range(shape0["frame"] + 1, shape1["frame"]):
-                off = frame - shape0["frame"]
-                if shape1["outside"]:
-                    points = np.asarray(shape0["points"]).reshape(-1, 2)
-                else:
-                    points = (shape0["points"] + step * off).reshape(-1, 2)
-                shape = copy.deepcopy(shape0)
-                if len(points) == 1:
-                    shape["points"] = points.flatten()
-                else:
-                    broken_line = geometry.LineString(points).simplify(0.05, False)
-                    shape["points"] = [x for p in broken_line.coords for x in p]
+            points = shape0["points"] + step * (frames - shape0["frame"])[:, None]
+        points = points.reshape(len(frames), -1, 2)
 
-                shape["keyframe"] = False
-                shape["frame"] = frame
-                shapes.append(shape)
-            return shapes
+        if points.shape[1] == 1:
+            interpolated_points = points.reshape(len(frames), -1)
+        else:
+            interpolated_points = TrackManager._simplify_lines(points)
+
+        # the dicts are built by InterpolatedShapes on access, the key
+        # shape is copied, because the callers can change it before that
+        template = TrackManager._copy_shape(shape0)
+        return [_InterpolatedShape(template, frame, frame_points)
+            for frame, frame_points in zip(frames.tolist(), interpolated_points)]
 
+    @staticmethod
+    def get_interpolated_shapes(track, start_frame, end_frame):
         if track.get("interpolated_shapes"):
             return track["interpolated_shapes"]
 
-        # TODO: should be return an iterator?
-        shapes = []
+        shapes = InterpolatedShapes()
         curr_frame = track["shapes"][0]["frame"]
         prev_shape = {}
         for shape in track["shapes"]:
@@ -364,7 +647,7 @@ class TrackManager(ObjectManager):
                     if attr["spec_id"] not in map(lambda el: el["spec_id"], shape["attributes"]):
                         shape["attributes"].append(copy.deepcopy(attr))
                 if not prev_shape["outside"]:
-                    shapes.extend(interpolate(prev_shape, shape))
+                    shapes.extend(TrackManager._interpolate(prev_shape, shape))
 
             shape["keyframe"] = True
             shapes.append(shape)
@@ -376,7 +659,7 @@ class TrackManager(ObjectManager):
                or prev_shape["type"] == models.ShapeType.POINTS):
             shape = copy.copy(prev_shape)
             shape["frame"] = end_frame
-            shapes.extend(interpolate(prev_shape, shape))
+            shapes.extend(TrackManager._interpolate(prev_shape, shape))
 
         track["interpolated_shapes"] = shapes
 
@@ -3,17 +3,36 @@
 # SPDX-License-Identifier: MIT
 
 import math
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from io import BytesIO
 
 import numpy as np
+from django.conf import settings
 from PIL import Image
 
-from cvat.apps.engine.media_extractors import VideoReader, ZipReader
+from cvat.apps.engine.cache import ChunkStorage
+from cvat.apps.engine.media_extractors import (ListReader, VideoFrameIndex,
+    VideoReader, ZipReader)
 from cvat.apps.engine.mime_types import mimetypes
-from cvat.apps.engine.models import DataChoice
+from cvat.apps.engine.models import DataChoice, StorageMethodChoice
+from cvat.apps.engine.utils import stream_zip_files
 
 
+def open_chunk(reader_class, chunk_path):
+    if reader_class is VideoReader:
+        return VideoReader([chunk_path],
+            index=VideoFrameIndex.get(chunk_path))
+    return reader_class([chunk_path])
+
+def _get_seek_pos(iterable, idx):
+    # the position, from which the iterable can start reading the item
+    get_keyframe = getattr(iterable, 'get_keyframe', None)
+    return get_keyframe(idx) if get_keyframe is not None else 0
+
 class RandomAccessIterator:
     def __init__(self, iterable):
         self.iterable = iterable
@@ -28,8 +47,9 @@ class RandomAccessIterator:
 
     def __getitem__(self, idx):
         assert 0 <= idx
-        if self.iterator is None or idx <= self.pos:
-            self.reset()
+        if self.iterator is None or idx <= self.pos or \
+                self.pos + 1 < _get_seek_pos(self.iterable, idx):
+            self.reset(idx)
         v = None
         while self.pos < idx:
             # NOTE: don't keep the last item in self, it can be expensive
@@ -37,9 +57,140 @@ class RandomAccessIterator:
             self.pos += 1
         return v
 
-    def reset(self):
-        self.iterator = iter(self.iterable)
-        self.pos = -1
+    def reset(self, idx=0):
+        iterate_from = getattr(self.iterable, 'iterate_from', None)
+        if idx and iterate_from is not None:
+            self.iterator = iterate_from(idx)
+            self.pos = idx - 1
+        else:
+            self.iterator = iter(self.iterable)
+            self.pos = -1
+
+class ChunkCache:
+    """
+    Per-process LRU cache of opened chunk readers and the frames
+    decoded from them. The size limit applies to the decoded frames.
+    """
+
+    CacheInfo = namedtuple('CacheInfo',
+        ['hits', 'misses', 'evictions', 'chunks', 'size', 'max_size'])
+
+    class CachedChunk:
+        def __init__(self, reader, mtime):
+            self.mtime = mtime
+            self.size = 0 # the part of the size, accounted in the cache
+            self.lock = threading.Lock()
+            self._reader = reader
+            self._iterator = None
+            self._pos = -1
+            self._frames = {} # frame offset: (frame, frame_name)
+
+        @staticmethod
+        def _get_frame_size(frame):
+            if isinstance(frame, bytes):
+                return len(frame)
+            return sum(plane.buffer_size for plane in frame.planes)
+
+        def get(self, idx):
+            """
+            Returns (frame, frame_name), the number of decoded bytes
+            and a flag, whether the frame has been decoded before
+            """
+            with self.lock:
+                decoded = idx in self._frames
+                decoded_size = 0
+                if not decoded and (self._iterator is None or
+                        idx <= self._pos or
+                        self._pos + 1 < _get_seek_pos(self._reader, idx)):
+                    self._seek(idx)
+                while idx not in self._frames:
+                    try:
+                        frame, frame_name, _ = next(self._iterator)
+                    except StopIteration:
+                        self._iterator = None
+                        raise IndexError('Frame {} is out of chunk'.format(idx))
+                    self._pos += 1
+                    if self._pos in self._frames:
+                        continue
+                    if isinstance(frame, BytesIO):
+                        frame = frame.getvalue()
+                    self._frames[self._pos] = (frame, frame_name)
+                    decoded_size += self._get_frame_size(frame)
+                return self._frames[idx], decoded_size, decoded
+
+        def _seek(self, idx):
+            iterate_from = getattr(self._reader, 'iterate_from', None)
+            if idx and iterate_from is not None:
+                self._iterator = iterate_from(idx)
+                self._pos = idx - 1
+            else:
+                self._iterator = iter(self._reader)
+                self._pos = -1
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._chunks = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self):
+        return 0 < self._max_size
+
+    def get_frame(self, key, chunk_path, reader_class, frame_offset):
+        # chunks are not supposed to be changed, but data ids can be reused
+        mtime = os.path.getmtime(chunk_path)
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is None or chunk.mtime != mtime:
+                if chunk is not None:
+                    self._remove(key)
+                chunk = self.CachedChunk(open_chunk(reader_class, chunk_path),
+                    mtime)
+                self._chunks[key] = chunk
+            self._chunks.move_to_end(key)
+
+        frame, decoded_size, decoded = chunk.get(frame_offset)
+
+        with self._lock:
+            if decoded:
+                self._hits += 1
+            else:
+                self._misses += 1
+            if self._chunks.get(key) is chunk:
+                chunk.size += decoded_size
+                self._size += decoded_size
+            self._evict()
+        return frame
+
+    def _remove(self, key):
+        chunk = self._chunks.pop(key)
+        self._size -= chunk.size
+
+    def _evict(self):
+        # the most recently used chunk is kept even if it doesn't fit
+        while self._max_size < self._size and 1 < len(self._chunks):
+            self._remove(next(iter(self._chunks)))
+            self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self._size = 0
+
+    def info(self):
+        with self._lock:
+            return self.CacheInfo(hits=self._hits, misses=self._misses,
+                evictions=self._evictions, chunks=len(self._chunks),
+                size=self._size, max_size=self._max_size)
+
+_chunk_cache = ChunkCache(settings.FRAME_CACHE_MAX_SIZE_MB * 1024 * 1024)
+_chunk_storage = ChunkStorage(settings.MEDIA_DATA_ROOT,
+    settings.CHUNK_CACHE_MAX_SIZE_MB * 1024 * 1024,
+    settings.CHUNK_PREFETCH_COUNT)
 
 class FrameProvider:
     class Quality(Enum):
@@ -61,24 +212,36 @@ class FrameProvider:
         def load(self, chunk_id):
             if self.chunk_id != chunk_id:
                 self.chunk_id = chunk_id
-                self.chunk_reader = RandomAccessIterator(
-                    self.reader_class([self.get_chunk_path(chunk_id)]))
+                self.chunk_reader = RandomAccessIterator(open_chunk(
+                    self.reader_class, self.get_chunk_path(chunk_id)))
             return self.chunk_reader
 
-    def __init__(self, db_data):
+    def __init__(self, db_data, cache=None, storage=None):
         self._db_data = db_data
         self._loaders = {}
+        self._cache = cache if cache is not None else _chunk_cache
+        storage = storage if storage is not None else _chunk_storage
+
+        get_compressed_chunk_path = db_data.get_compressed_chunk_path
+        get_original_chunk_path = db_data.get_original_chunk_path
+        if db_data.storage_method == StorageMethodChoice.CACHE:
+            # the chunks are built on request
+            get_compressed_chunk_path = lambda chunk_number: \
+                storage.get_chunk(db_data, chunk_number, original=False)
+            get_original_chunk_path = lambda chunk_number: \
+                storage.get_chunk(db_data, chunk_number, original=True)
 
         reader_class = {
             DataChoice.IMAGESET: ZipReader,
             DataChoice.VIDEO: VideoReader,
+            DataChoice.LIST: ListReader,
         }
         self._loaders[self.Quality.COMPRESSED] = self.ChunkLoader(
             reader_class[db_data.compressed_chunk_type],
-            db_data.get_compressed_chunk_path)
+            get_compressed_chunk_path)
         self._loaders[self.Quality.ORIGINAL] = self.ChunkLoader(
             reader_class[db_data.original_chunk_type],
-            db_data.get_original_chunk_path)
+            get_original_chunk_path)
 
     def __len__(self):
         return self._db_data.size
@@ -115,9 +278,8 @@ class FrameProvider:
             return frame.to_image() if reader_class is VideoReader else Image.open(frame)
         elif out_type == self.Type.NUMPY_ARRAY:
             if reader_class is VideoReader:
-                image = np.array(frame.to_image())
-            else:
-                image = np.array(Image.open(frame))
+                return frame.to_ndarray(format='bgr24')
+            image = np.array(Image.open(frame))
             if len(image.shape) == 3 and image.shape[2] in {3, 4}:
                 image[:, :, :3] = image[:, :, 2::-1] # RGB to BGR
             return image
@@ -131,18 +293,115 @@ class FrameProvider:
         chunk_number = self._validate_chunk_number(chunk_number)
         return self._loaders[quality].get_chunk_path(chunk_number)
 
-    def get_frame(self, frame_number, quality=Quality.ORIGINAL,
-            out_type=Type.BUFFER):
-        _, chunk_number, frame_offset = self._validate_frame_number(frame_number)
+    def is_chunk_manifest(self, quality=Quality.ORIGINAL):
+        return self._loaders[quality].reader_class is ListReader
+
+    def stream_chunk(self, chunk_number, quality=Quality.ORIGINAL):
+        """
+        Yields a manifest chunk as a zip archive of the original files
+        by parts. The archive has the same layout as the zip chunks.
+        """
+
+        reader = ListReader([self.get_chunk(chunk_number, quality)])
+        return stream_zip_files(
+            (path, '{:06d}{}'.format(idx, os.path.splitext(path)[1]))
+            for idx, path in enumerate(reader.get_image_paths()))
+
+    @staticmethod
+    def get_cache_info():
+        return _chunk_cache.info()
+
+    def _get_cached_frame(self, quality, chunk_number, frame_offset):
         loader = self._loaders[quality]
-        chunk_reader = loader.load(chunk_number)
-        frame, frame_name, _ = chunk_reader[frame_offset]
+        frame, frame_name = self._cache.get_frame(
+            (self._db_data.id, quality, chunk_number),
+            loader.get_chunk_path(chunk_number), loader.reader_class,
+            frame_offset)
+        if isinstance(frame, bytes):
+            frame = BytesIO(frame)
+        return frame, frame_name
 
-        frame = self._convert_frame(frame, loader.reader_class, out_type)
-        if loader.reader_class is VideoReader:
+    def _make_frame(self, frame, frame_name, reader_class, out_type):
+        frame = self._convert_frame(frame, reader_class, out_type)
+        if reader_class is VideoReader:
             return (frame, 'image/png')
         return (frame, mimetypes.guess_type(frame_name))
 
-    def get_frames(self, quality=Quality.ORIGINAL, out_type=Type.BUFFER):
-        for idx in range(self._db_data.size):
-            yield self.get_frame(idx, quality=quality, out_type=out_type)
+    def _get_frame(self, frame_number, quality, out_type, cached):
+        _, chunk_number, frame_offset = self._validate_frame_number(frame_number)
+        loader = self._loaders[quality]
+        if cached:
+            frame, frame_name = self._get_cached_frame(quality,
+                chunk_number, frame_offset)
+        else:
+            chunk_reader = loader.load(chunk_number)
+            frame, frame_name, _ = chunk_reader[frame_offset]
+
+        return self._make_frame(frame, frame_name, loader.reader_class,
+            out_type)
+
+    def get_frame(self, frame_number, quality=Quality.ORIGINAL,
+            out_type=Type.BUFFER):
+        return self._get_frame(frame_number, quality, out_type,
+            cached=self._cache.enabled)
+
+    def _read_chunk(self, quality, chunk_number, frame_offsets):
+        # frame offsets are expected to be sorted
+        loader = self._loaders[quality]
+        chunk_reader = loader.reader_class([loader.get_chunk_path(chunk_number)])
+        frame_offsets = iter(frame_offsets)
+        next_offset = next(frame_offsets, None)
+        for offset, (frame, frame_name, _) in enumerate(chunk_reader):
+            if next_offset is None:
+                break
+            if offset == next_offset:
+                yield frame, frame_name
+                next_offset = next(frame_offsets, None)
+
+    def get_frames(self, quality=Quality.ORIGINAL, out_type=Type.BUFFER,
+            start=0, stop=None, step=1, prefetch=False):
+        """
+        Yields (frame, mime type) for the frames in range(start, stop, step).
+        Each chunk is read once, from the beginning to the end. With prefetch,
+        the next chunk is read on a background thread, while the frames of
+        the current one are consumed.
+        """
+
+        # Sequential reading doesn't benefit from the cache,
+        # so the whole task is not pushed through it
+        if stop is None or self._db_data.size < stop:
+            stop = self._db_data.size
+        if start < 0 or step < 1:
+            raise Exception('Incorrect requested frame range: {}:{}:{}' \
+                .format(start, stop, step))
+
+        chunks = OrderedDict() # chunk number: frame offsets
+        for frame_number in range(start, stop, step):
+            chunk_number, frame_offset = divmod(frame_number,
+                self._db_data.chunk_size)
+            chunks.setdefault(chunk_number, []).append(frame_offset)
+
+        reader_class = self._loaders[quality].reader_class
+        if not prefetch:
+            for chunk_number, frame_offsets in chunks.items():
+                for frame, frame_name in self._read_chunk(quality,
+                        chunk_number, frame_offsets):
+                    yield self._make_frame(frame, frame_name, reader_class,
+                        out_type)
+            return
+
+        read_chunk = lambda chunk_number: list(self._read_chunk(quality,
+            chunk_number, chunks[chunk_number]))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            chunk_numbers = list(chunks)
+            next_chunk = None
+            if chunk_numbers:
+                next_chunk = executor.submit(read_chunk, chunk_numbers[0])
+            for chunk_idx in range(len(chunk_numbers)):
+                chunk_frames = next_chunk.result()
+                if chunk_idx + 1 < len(chunk_numbers):
+                    next_chunk = executor.submit(read_chunk,
+                        chunk_numbers[chunk_idx + 1])
+                for frame, frame_name in chunk_frames:
+                    yield self._make_frame(frame, frame_name, reader_class,
+                        out_type)
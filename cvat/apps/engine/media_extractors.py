@@ -6,8 +6,11 @@ import os
 import tempfile
 import shutil
 import zipfile
+import tarfile
 import io
+import json
 from abc import ABC, abstractmethod
+from bisect import bisect_right
 
 import av
 import av.datasets
@@ -109,14 +112,25 @@ class ImageListReader(IMediaReader):
         img = Image.open(self._source_path[0])
         return img.width, img.height
 
+    def get_image_sizes(self):
+        # only the image headers are read
+        for i in range(self._start, self._stop, self._step):
+            with Image.open(self.get_image(i)) as img:
+                yield self.get_path(i), i, img.size
+
+def _list_images(source_dir):
+    image_paths = []
+    for root, _, files in os.walk(source_dir):
+        paths = [os.path.join(root, f) for f in files]
+        paths = filter(lambda x: get_mime(x) == 'image', paths)
+        image_paths.extend(paths)
+    return image_paths
+
 class DirectoryReader(ImageListReader):
     def __init__(self, source_path, step=1, start=0, stop=None):
         image_paths = []
         for source in source_path:
-            for root, _, files in os.walk(source):
-                paths = [os.path.join(root, f) for f in files]
-                paths = filter(lambda x: get_mime(x) == 'image', paths)
-                image_paths.extend(paths)
+            image_paths.extend(_list_images(source))
         super().__init__(
             source_path=image_paths,
             step=step,
@@ -124,13 +138,31 @@ class DirectoryReader(ImageListReader):
             stop=stop,
         )
 
-class ArchiveReader(DirectoryReader):
+class ArchiveReader(ImageListReader):
+    """
+    Reads the images from an archive. Tar archives, including compressed
+    ones, are read directly, other archives are extracted
+    to a temporary directory.
+    """
+
     def __init__(self, source_path, step=1, start=0, stop=None):
-        self._tmp_dir = create_tmp_dir()
         self._archive_source = source_path[0]
-        Archive(self._archive_source).extractall(self._tmp_dir)
+        self._tmp_dir = None
+        self._is_tar = tarfile.is_tarfile(self._archive_source)
+
+        if self._is_tar:
+            # only the member headers are kept, the data is skipped
+            with self._open_tar() as tar_source:
+                image_names = [member.name for member in tar_source
+                    if member.isfile() and get_mime(member.name) == 'image']
+        else:
+            self._tmp_dir = create_tmp_dir()
+            Archive(self._archive_source).extractall(self._tmp_dir)
+            image_names = [os.path.relpath(p, self._tmp_dir)
+                for p in _list_images(self._tmp_dir)]
+
         super().__init__(
-            source_path=[self._tmp_dir],
+            source_path=image_names,
             step=step,
             start=start,
             stop=stop,
@@ -139,37 +171,138 @@ class ArchiveReader(DirectoryReader):
     def __del__(self):
         delete_tmp_dir(self._tmp_dir)
 
+    def _open_tar(self):
+        # the stream mode reads the archive once from the beginning,
+        # seeking back in compressed archives means decompressing them again
+        return tarfile.open(self._archive_source, mode='r|*')
+
+    def _read_tar_images(self, names):
+        """
+        Yields the images with the names in the order of names. The archive
+        is read once and only up to the last of the images.
+        """
+
+        if not names:
+            return
+
+        positions = { name: pos for pos, name in enumerate(names) }
+        images = {} # position: image bytes, for the images read in advance
+        next_pos = 0
+        with self._open_tar() as tar_source:
+            for member in tar_source:
+                pos = positions.get(member.name)
+                if pos is None or pos < next_pos or not member.isfile():
+                    continue
+                images[pos] = tar_source.extractfile(member).read()
+                while next_pos in images:
+                    yield io.BytesIO(images.pop(next_pos))
+                    next_pos += 1
+                if next_pos == len(names):
+                    return
+        raise Exception('Image {} is not found in the archive'.format(
+            names[next_pos]))
+
+    def __iter__(self):
+        if not self._is_tar:
+            yield from super().__iter__()
+            return
+
+        indices = range(self._start, self._stop, self._step)
+        images = self._read_tar_images([self._source_path[i] for i in indices])
+        try:
+            for i, image in zip(indices, images):
+                yield (image, self.get_path(i), i)
+        finally:
+            images.close()
+
+    def get_image(self, i):
+        if self._is_tar:
+            images = self._read_tar_images([self._source_path[i]])
+            try:
+                return next(images)
+            finally:
+                images.close()
+        return os.path.join(self._tmp_dir, self._source_path[i])
+
     def get_path(self, i):
         base_dir = os.path.dirname(self._archive_source)
-        return os.path.join(base_dir, os.path.relpath(self._source_path[i], self._tmp_dir))
+        return os.path.join(base_dir, self._source_path[i])
+
+    def get_preview(self):
+        return self._get_preview(Image.open(self.get_image(0)))
+
+    def get_image_size(self):
+        img = Image.open(self.get_image(0))
+        return img.width, img.height
+
+def _get_pdf_page_count(pdf_path):
+    try:
+        from pdf2image import pdfinfo_from_path
+    except ImportError: # older pdf2image versions
+        from pdf2image.pdf2image import _page_count
+        return _page_count(pdf_path)
+    return int(pdfinfo_from_path(pdf_path)['Pages'])
+
+class PdfReader(ImageListReader):
+    """
+    Renders the pages of a PDF document on demand
+    """
+
+    # pages are rendered by batches to reduce the number of renderer calls
+    PAGE_BATCH_SIZE = 10
 
-class PdfReader(DirectoryReader):
     def __init__(self, source_path, step=1, start=0, stop=None):
         if not source_path:
             raise Exception('No PDF found')
 
-        from pdf2image import convert_from_path
         self._pdf_source = source_path[0]
-        self._tmp_dir = create_tmp_dir()
-        file_ = convert_from_path(self._pdf_source)
         basename = os.path.splitext(os.path.basename(self._pdf_source))[0]
-        for page_num, page in enumerate(file_):
-            output = os.path.join(self._tmp_dir, '{}{:09d}.jpeg'.format(basename, page_num))
-            page.save(output, 'JPEG')
+        page_names = ['{}{:09d}.jpeg'.format(basename, page_num)
+            for page_num in range(_get_pdf_page_count(self._pdf_source))]
 
         super().__init__(
-            source_path=[self._tmp_dir],
+            source_path=page_names,
             step=step,
             start=start,
             stop=stop,
         )
 
-    def __del__(self):
-        delete_tmp_dir(self._tmp_dir)
+    def _render_pages(self, first, last):
+        from pdf2image import convert_from_path
+        pages = []
+        for page in convert_from_path(self._pdf_source,
+                first_page=first + 1, last_page=last):
+            buf = io.BytesIO()
+            page.save(buf, 'JPEG')
+            page.close()
+            buf.seek(0)
+            pages.append(buf)
+        return pages
+
+    def __iter__(self):
+        if self._step != 1:
+            yield from super().__iter__()
+            return
+
+        for first in range(self._start, self._stop, self.PAGE_BATCH_SIZE):
+            last = min(first + self.PAGE_BATCH_SIZE, self._stop)
+            for i, page in zip(range(first, last),
+                    self._render_pages(first, last)):
+                yield (page, self.get_path(i), i)
+
+    def get_image(self, i):
+        return self._render_pages(i, i + 1)[0]
 
     def get_path(self, i):
         base_dir = os.path.dirname(self._pdf_source)
-        return os.path.join(base_dir, os.path.relpath(self._source_path[i], self._tmp_dir))
+        return os.path.join(base_dir, self._source_path[i])
+
+    def get_preview(self):
+        return self._get_preview(Image.open(self.get_image(0)))
+
+    def get_image_size(self):
+        img = Image.open(self.get_image(0))
+        return img.width, img.height
 
 class ZipReader(ImageListReader):
     def __init__(self, source_path, step=1, start=0, stop=None):
@@ -191,17 +324,119 @@ class ZipReader(ImageListReader):
     def get_image(self, i):
         return io.BytesIO(self._zip_source.read(self._source_path[i]))
 
+    def get_image_sizes(self):
+        # the files are not extracted, only the image headers are read
+        for i in range(self._start, self._stop, self._step):
+            with self._zip_source.open(self._source_path[i]) as f, \
+                    Image.open(f) as img:
+                yield self.get_path(i), i, img.size
+
     def get_path(self, i):
         return os.path.join(os.path.dirname(self._zip_source.filename), self._source_path[i])
 
-class VideoReader(IMediaReader):
+class ListReader(ImageListReader):
+    """
+    Reads the original images by a manifest chunk, written by ListChunkWriter
+    """
+
     def __init__(self, source_path, step=1, start=0, stop=None):
+        chunk_path = source_path[0]
+        chunk_dir = os.path.dirname(chunk_path)
+        with open(chunk_path) as f:
+            image_paths = [os.path.normpath(os.path.join(chunk_dir, p))
+                for p in json.load(f)]
+        super().__init__(image_paths, step, start, stop)
+        # the manifest defines the order of the frames
+        self._source_path = image_paths
+
+    def get_image_paths(self):
+        return list(self._source_path)
+
+    def get_image(self, i):
+        with open(self._source_path[i], 'rb') as f:
+            return io.BytesIO(f.read())
+
+class VideoFrameIndex:
+    """
+    Presentation timestamps of the video frames and the numbers of
+    the key frames, from which decoding can be started. The index is
+    built by demuxing, without decoding, and stored next to the video.
+    """
+
+    def __init__(self, frame_pts, keyframes):
+        self.frame_pts = frame_pts # frame number: pts
+        self.keyframes = keyframes # sorted key frame numbers
+        self.frame_numbers = { pts: i for i, pts in enumerate(frame_pts) }
+
+    @staticmethod
+    def get_index_path(video_path):
+        return os.path.splitext(video_path)[0] + '.index.json'
+
+    @classmethod
+    def build(cls, video_path):
+        packets = []
+        container = av.open(video_path)
+        try:
+            stream = container.streams.video[0]
+            for packet in container.demux(stream):
+                if packet.pts is not None:
+                    packets.append((packet.pts, packet.is_keyframe))
+        finally:
+            container.close()
+        packets.sort()
+        frame_pts = [pts for pts, _ in packets]
+        keyframes = [i for i, (_, is_keyframe) in enumerate(packets)
+            if is_keyframe]
+        return cls(frame_pts, keyframes)
+
+    def save(self, path):
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({ 'pts': self.frame_pts, 'keyframes': self.keyframes }, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            index = json.load(f)
+        return cls(index['pts'], index['keyframes'])
+
+    @classmethod
+    def get(cls, video_path):
+        """
+        Loads the index of the video, builds and saves it, if there is none
+        """
+
+        index_path = cls.get_index_path(video_path)
+        try:
+            return cls.load(index_path)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = cls.build(video_path)
+        try:
+            index.save(index_path)
+        except OSError:
+            pass
+        return index
+
+    def get_keyframe(self, frame):
+        """
+        Returns the number of the closest key frame before the frame
+        """
+
+        pos = bisect_right(self.keyframes, frame)
+        return self.keyframes[pos - 1] if pos else 0
+
+class VideoReader(IMediaReader):
+    def __init__(self, source_path, step=1, start=0, stop=None, index=None):
         super().__init__(
             source_path=source_path,
             step=step,
             start=start,
             stop=stop + 1 if stop is not None else stop,
         )
+        self._index = index
 
     def _has_frame(self, i):
         if i >= self._start:
@@ -211,15 +446,46 @@ class VideoReader(IMediaReader):
 
         return False
 
-    def _decode(self, container):
-        frame_num = 0
+    def _decode(self, container, start_frame=0):
+        frame_numbers = None
+        if self._index is not None:
+            # frame numbers can't be counted after seeking,
+            # they are restored from the frame timestamps
+            frame_numbers = self._index.frame_numbers
+            keyframe = self._index.get_keyframe(start_frame)
+            if keyframe:
+                container.seek(self._index.frame_pts[keyframe],
+                    backward=True, any_frame=False,
+                    stream=container.streams.video[0])
+
+        frame_num = -1
         for packet in container.demux():
             if packet.stream.type == 'video':
                 for image in packet.decode():
-                    frame_num += 1
-                    if self._has_frame(frame_num - 1):
+                    if frame_numbers is not None:
+                        frame_num = frame_numbers.get(image.pts, frame_num + 1)
+                    else:
+                        frame_num += 1
+                    if self._stop is not None and self._stop <= frame_num:
+                        return
+                    if start_frame <= frame_num and self._has_frame(frame_num):
                         yield (image, self._source_path[0], image.pts)
 
+    def get_keyframe(self, frame):
+        if self._index is None:
+            return 0
+        return self._index.get_keyframe(frame)
+
+    def iterate_from(self, frame):
+        """
+        Iterates over the frames, starting from the frame. With the index,
+        decoding is started from the closest key frame.
+        """
+
+        container = self._get_av_container()
+        container.streams.video[0].thread_type = 'AUTO'
+        return self._decode(container, frame)
+
     def __iter__(self):
         container = self._get_av_container()
         source_video_stream = container.streams.video[0]
@@ -286,6 +552,23 @@ class ZipChunkWriter(IChunkWriter):
         # and does not decode it to know img size.
         return []
 
+class ListChunkWriter(IChunkWriter):
+    """
+    Writes a manifest of the original image files instead of copying them.
+    The paths are relative to the chunk directory.
+    """
+
+    def save_as_chunk(self, images, chunk_path):
+        chunk_dir = os.path.dirname(chunk_path)
+        image_paths = []
+        for image, _, _ in images:
+            if not isinstance(image, str):
+                raise Exception('Only image files can be listed in a chunk')
+            image_paths.append(os.path.relpath(image, chunk_dir))
+        with open(chunk_path, 'x') as f:
+            json.dump(image_paths, f)
+        return []
+
 class ZipCompressedChunkWriter(IChunkWriter):
     def save_as_chunk(self, images, chunk_path):
         image_sizes = []
@@ -299,6 +582,9 @@ class ZipCompressedChunkWriter(IChunkWriter):
         return image_sizes
 
 class Mpeg4ChunkWriter(IChunkWriter):
+    # original chunks are decoded on the server from the closest key frame
+    KEYFRAME_INTERVAL = 12
+
     def __init__(self, _):
         super().__init__(17)
         self._output_fps = 25
@@ -331,11 +617,14 @@ class Mpeg4ChunkWriter(IChunkWriter):
             options={
                 "crf": str(self._image_quality),
                 "preset": "ultrafast",
+                "g": str(self.KEYFRAME_INTERVAL),
             },
         )
 
         self._encode_images(images, output_container, output_v_stream)
         output_container.close()
+        VideoFrameIndex.build(chunk_path).save(
+            VideoFrameIndex.get_index_path(chunk_path))
         return [(input_w, input_h)]
 
     @staticmethod
@@ -398,6 +687,13 @@ class Mpeg4CompressedChunkWriter(Mpeg4ChunkWriter):
         output_container.close()
         return [(input_w, input_h)]
 
+def save_chunk_pair(original_chunk_writer, compressed_chunk_writer,
+        chunk_data, original_chunk_path, compressed_chunk_path):
+    # it is called in spawned worker processes, which can import only
+    # the modules without Django dependencies
+    original_chunk_writer.save_as_chunk(chunk_data, original_chunk_path)
+    return compressed_chunk_writer.save_as_chunk(chunk_data, compressed_chunk_path)
+
 def _is_archive(path):
     mime = mimetypes.guess_type(path)
     mime_type = mime[0]
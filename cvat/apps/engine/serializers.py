@@ -2,9 +2,11 @@
 #
 # SPDX-License-Identifier: MIT
 
+import json
 import os
 import re
 import shutil
+from itertools import islice
 
 from rest_framework import serializers
 from django.contrib.auth.models import User, Group
@@ -164,6 +166,7 @@ class WriteOnceMixin:
 class DataSerializer(serializers.ModelSerializer):
     image_quality = serializers.IntegerField(min_value=0, max_value=100)
     use_zip_chunks = serializers.BooleanField(default=False)
+    use_cache = serializers.BooleanField(default=False)
     client_files = ClientFileSerializer(many=True, default=[])
     server_files = ServerFileSerializer(many=True, default=[])
     remote_files = RemoteFileSerializer(many=True, default=[])
@@ -171,7 +174,8 @@ class DataSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Data
         fields = ('chunk_size', 'size', 'image_quality', 'start_frame', 'stop_frame', 'frame_filter',
-            'compressed_chunk_type', 'original_chunk_type', 'client_files', 'server_files', 'remote_files', 'use_zip_chunks')
+            'compressed_chunk_type', 'original_chunk_type', 'client_files', 'server_files', 'remote_files', 'use_zip_chunks',
+            'use_cache')
 
     # pylint: disable=no-self-use
     def validate_frame_filter(self, value):
@@ -199,6 +203,9 @@ class DataSerializer(serializers.ModelSerializer):
         server_files = validated_data.pop('server_files')
         remote_files = validated_data.pop('remote_files')
         validated_data.pop('use_zip_chunks')
+        # the chunks are built on request
+        if validated_data.pop('use_cache'):
+            validated_data['storage_method'] = models.StorageMethodChoice.CACHE
         db_data = models.Data.objects.create(**validated_data)
 
         data_path = db_data.get_data_dirname()
@@ -229,7 +236,7 @@ class TaskSerializer(WriteOnceMixin, serializers.ModelSerializer):
     segments = SegmentSerializer(many=True, source='segment_set', read_only=True)
     data_chunk_size = serializers.ReadOnlyField(source='data.chunk_size')
     data_compressed_chunk_type = serializers.ReadOnlyField(source='data.compressed_chunk_type')
-    data_original_chunk_type = serializers.ReadOnlyField(source='data.original_chunk_type')
+    data_original_chunk_type = serializers.SerializerMethodField()
     size = serializers.ReadOnlyField(source='data.size')
     image_quality = serializers.ReadOnlyField(source='data.image_quality')
     data = serializers.ReadOnlyField(source='data.id')
@@ -245,6 +252,15 @@ class TaskSerializer(WriteOnceMixin, serializers.ModelSerializer):
         write_once_fields = ('overlap', 'segment_size')
         ordering = ['-id']
 
+    # pylint: disable=no-self-use
+    def get_data_original_chunk_type(self, instance):
+        if instance.data is None:
+            return None
+        # manifest chunks are sent as zip archives
+        if instance.data.original_chunk_type == models.DataChoice.LIST:
+            return str(models.DataChoice.IMAGESET)
+        return instance.data.original_chunk_type
+
     # pylint: disable=no-self-use
     def create(self, validated_data):
         labels = validated_data.pop('label_set')
@@ -446,6 +462,91 @@ class LabeledDataSerializer(serializers.Serializer):
     shapes = LabeledShapeSerializer(many=True)
     tracks = LabeledTrackSerializer(many=True)
 
+class LabeledDataStreamSerializer:
+    """
+    Renders annotations from the engine as a sequence of JSON chunks
+    with the LabeledDataSerializer schema. The data is not validated,
+    so it must come from the engine (e.g. from the database). The object
+    lists can be iterators, they are consumed while the chunks are rendered.
+    """
+
+    CHUNK_SIZE = 1000 # objects per chunk
+
+    def __init__(self, data):
+        self._data = data
+
+    @staticmethod
+    def _dumps(obj):
+        # the same options as rest_framework.renderers.JSONRenderer uses
+        return json.dumps(obj, ensure_ascii=False, allow_nan=False,
+            separators=(',', ':'))
+
+    @staticmethod
+    def _attributes(attributes):
+        return [{'spec_id': attr['spec_id'], 'value': str(attr['value'])}
+            for attr in attributes]
+
+    @classmethod
+    def _tag(cls, tag):
+        return {
+            'id': tag.get('id'),
+            'frame': tag['frame'],
+            'label_id': tag['label_id'],
+            'group': tag['group'],
+            'attributes': cls._attributes(tag['attributes']),
+        }
+
+    @classmethod
+    def _shape(cls, shape):
+        return {
+            'type': str(shape['type']),
+            'occluded': bool(shape['occluded']),
+            'z_order': shape.get('z_order', 0),
+            'points': [float(p) for p in shape['points']],
+            'id': shape.get('id'),
+            'frame': shape['frame'],
+            'label_id': shape['label_id'],
+            'group': shape['group'],
+            'attributes': cls._attributes(shape['attributes']),
+        }
+
+    @classmethod
+    def _track(cls, track):
+        return {
+            'id': track.get('id'),
+            'frame': track['frame'],
+            'label_id': track['label_id'],
+            'group': track['group'],
+            'shapes': [{
+                'type': str(shape['type']),
+                'occluded': bool(shape['occluded']),
+                'z_order': shape.get('z_order', 0),
+                'points': [float(p) for p in shape['points']],
+                'id': shape.get('id'),
+                'frame': shape['frame'],
+                'outside': bool(shape['outside']),
+                'attributes': cls._attributes(shape['attributes']),
+            } for shape in track['shapes']],
+            'attributes': cls._attributes(track['attributes']),
+        }
+
+    def __iter__(self):
+        yield '{{"version":{}'.format(self._dumps(self._data['version']))
+        for key, serialize in [('tags', self._tag), ('shapes', self._shape),
+                ('tracks', self._track)]:
+            yield ',"{}":['.format(key)
+            objects = iter(self._data[key])
+            separator = ''
+            while True:
+                chunk = ','.join(self._dumps(serialize(obj))
+                    for obj in islice(objects, self.CHUNK_SIZE))
+                if not chunk:
+                    break
+                yield separator + chunk
+                separator = ','
+            yield ']'
+        yield '}'
+
 class FileInfoSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=1024)
     type = serializers.ChoiceField(choices=["REG", "DIR"])
@@ -4,17 +4,22 @@
 # SPDX-License-Identifier: MIT
 
 import itertools
+import multiprocessing
 import os
 import sys
 import rq
 import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from traceback import print_exception
 from urllib import error as urlerror
 from urllib import parse as urlparse
 from urllib import request as urlrequest
 
-from cvat.apps.engine.media_extractors import get_mime, MEDIA_TYPES, Mpeg4ChunkWriter, ZipChunkWriter, Mpeg4CompressedChunkWriter, ZipCompressedChunkWriter
-from cvat.apps.engine.models import DataChoice
+from cvat.apps.engine.cache import LAZY_MEDIA_TYPES, get_chunk_writer, save_media_info
+from cvat.apps.engine.media_extractors import (get_mime, MEDIA_TYPES,
+    VideoFrameIndex, ZipCompressedChunkWriter, save_chunk_pair)
+from cvat.apps.engine.models import DataChoice, StorageMethodChoice
 
 import django_rq
 from django.conf import settings
@@ -203,6 +208,31 @@ def _download_data(urls, upload_dir):
         local_files[name] = True
     return list(local_files.keys())
 
+def _save_chunks(chunks, save_chunk, workers):
+    """
+    Saves chunks in a pool of processes. Results are yielded in the order
+    of chunks. Only a limited number of chunks is kept in memory.
+    """
+    if workers <= 1:
+        for chunk_args in chunks:
+            yield chunk_args, save_chunk(*chunk_args)
+        return
+
+    # The workers are spawned instead of forked, because the task is
+    # created in a transaction and a forked process would share
+    # the database connection
+    with ProcessPoolExecutor(max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = deque()
+        for chunk_args in chunks:
+            pending.append((chunk_args, executor.submit(save_chunk, *chunk_args)))
+            if len(pending) >= 2 * workers:
+                chunk_args, future = pending.popleft()
+                yield chunk_args, future.result()
+        while pending:
+            chunk_args, future = pending.popleft()
+            yield chunk_args, future.result()
+
 @transaction.atomic
 def _create_thread(tid, data):
     slogger.glob.info("create task #{}".format(tid))
@@ -229,11 +259,13 @@ def _create_thread(tid, data):
 
     db_images = []
     extractor = None
+    source_media_type = None
 
     for media_type, media_files in media.items():
         if media_files:
             if extractor is not None:
                 raise Exception('Combined data types are not supported')
+            source_media_type = media_type
             extractor = MEDIA_TYPES[media_type]['extractor'](
                 source_path=[os.path.join(upload_dir, f) for f in media_files],
                 step=db_data.get_frame_step(),
@@ -243,6 +275,11 @@ def _create_thread(tid, data):
     db_task.mode = task_mode
     db_data.compressed_chunk_type = models.DataChoice.VIDEO if task_mode == 'interpolation' and not data['use_zip_chunks'] else models.DataChoice.IMAGESET
     db_data.original_chunk_type = models.DataChoice.VIDEO if task_mode == 'interpolation' else models.DataChoice.IMAGESET
+    # the uploaded image files are kept, so they are not copied to chunks
+    if db_data.original_chunk_type == models.DataChoice.IMAGESET and \
+            source_media_type in ('image', 'directory') and \
+            settings.ORIGINAL_CHUNK_MANIFESTS:
+        db_data.original_chunk_type = models.DataChoice.LIST
 
     def update_progress(progress):
         progress_animation = '|/-\\'
@@ -258,11 +295,8 @@ def _create_thread(tid, data):
         job.save_meta()
         update_progress.call_counter = (update_progress.call_counter + 1) % len(progress_animation)
 
-    compressed_chunk_writer_class = Mpeg4CompressedChunkWriter if db_data.compressed_chunk_type == DataChoice.VIDEO else ZipCompressedChunkWriter
-    original_chunk_writer_class = Mpeg4ChunkWriter if db_data.original_chunk_type == DataChoice.VIDEO else ZipChunkWriter
-
-    compressed_chunk_writer = compressed_chunk_writer_class(db_data.image_quality)
-    original_chunk_writer = original_chunk_writer_class(100)
+    compressed_chunk_writer = get_chunk_writer(db_data, original=False)
+    original_chunk_writer = get_chunk_writer(db_data, original=True)
 
     # calculate chunk size if it isn't specified
     if db_data.chunk_size is None:
@@ -276,34 +310,71 @@ def _create_thread(tid, data):
     video_path = ""
     video_size = (0, 0)
 
-    counter = itertools.count()
-    generator = itertools.groupby(extractor, lambda x: next(counter) // db_data.chunk_size)
-    for chunk_idx, chunk_data in generator:
-        chunk_data = list(chunk_data)
-        original_chunk_path = db_data.get_original_chunk_path(chunk_idx)
-        original_chunk_writer.save_as_chunk(chunk_data, original_chunk_path)
+    if db_data.storage_method == StorageMethodChoice.CACHE and \
+            source_media_type not in LAZY_MEDIA_TYPES:
+        slogger.glob.warning("Chunks are created in advance for '{}' "
+            "media of Data #{}".format(source_media_type, db_data.id))
+        db_data.storage_method = StorageMethodChoice.FILE_SYSTEM
 
-        compressed_chunk_path = db_data.get_compressed_chunk_path(chunk_idx)
-        img_sizes = compressed_chunk_writer.save_as_chunk(chunk_data, compressed_chunk_path)
+    if db_data.storage_method == StorageMethodChoice.CACHE:
+        # only the media is indexed, the chunks are built on request
+        job.meta['status'] = 'Media files are being indexed...'
+        job.save_meta()
 
         if db_task.mode == 'annotation':
-            db_images.extend([
-                models.Image(
+            for path, frame, (width, height) in extractor.get_image_sizes():
+                db_images.append(models.Image(
                     data=db_data,
-                    path=os.path.relpath(data[1], upload_dir),
-                    frame=data[2],
-                    width=size[0],
-                    height=size[1])
-
-                for data, size in zip(chunk_data, img_sizes)
-            ])
+                    path=os.path.relpath(path, upload_dir),
+                    frame=frame,
+                    width=width,
+                    height=height))
+            db_data.size = len(db_images)
         else:
-            video_size = img_sizes[0]
-            video_path = chunk_data[0][1]
+            video_path = os.path.join(upload_dir, media[source_media_type][0])
+            video_size = extractor.get_image_size()
+            frame_count = len(VideoFrameIndex.get(video_path).frame_pts)
+            stop_frame = frame_count - 1
+            if data['stop_frame'] is not None:
+                stop_frame = min(data['stop_frame'], stop_frame)
+            db_data.size = len(range(db_data.start_frame, stop_frame + 1,
+                db_data.get_frame_step()))
+
+        save_media_info(db_data, source_media_type, media[source_media_type])
+    else:
+        # Decoded video frames can't be passed to other processes
+        workers = settings.CHUNK_CREATION_WORKERS
+        if db_data.original_chunk_type == DataChoice.VIDEO or \
+                db_data.compressed_chunk_type == DataChoice.VIDEO:
+            workers = 1
+
+        counter = itertools.count()
+        generator = itertools.groupby(extractor, lambda x: next(counter) // db_data.chunk_size)
+        chunks = ((original_chunk_writer, compressed_chunk_writer, list(chunk_data),
+                db_data.get_original_chunk_path(chunk_idx),
+                db_data.get_compressed_chunk_path(chunk_idx))
+            for chunk_idx, chunk_data in generator)
+        for chunk_args, img_sizes in _save_chunks(chunks, save_chunk_pair, workers):
+            chunk_data = chunk_args[2]
+
+            if db_task.mode == 'annotation':
+                db_images.extend([
+                    models.Image(
+                        data=db_data,
+                        path=os.path.relpath(data[1], upload_dir),
+                        frame=data[2],
+                        width=size[0],
+                        height=size[1])
+
+                    for data, size in zip(chunk_data, img_sizes)
+                ])
+            else:
+                video_size = img_sizes[0]
+                video_path = chunk_data[0][1]
 
-        db_data.size += len(chunk_data)
-        progress = extractor.get_progress(chunk_data[-1][2])
-        update_progress(progress)
+            db_data.size += len(chunk_data)
+            progress = extractor.get_progress(chunk_data[-1][2])
+            update_progress(progress)
 
     if db_task.mode == 'annotation':
         models.Image.objects.bulk_create(db_images)
@@ -0,0 +1,283 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+# The benchmark is not a part of the test suite. Run it explicitly:
+#   python manage.py test cvat.apps.engine.tests.benchmark_annotation
+
+import random
+from timeit import default_timer as timer
+
+from django.test import TestCase
+
+from cvat.apps.annotation.annotation import Annotation, AnnotationIR
+from cvat.apps.engine import serializers
+from cvat.apps.engine.annotation import (JobAnnotation, _merge_table_rows,
+    dotdict)
+from cvat.apps.engine.tests.test_annotation import (create_db_job,
+    create_db_task, generate_annotations, load_job_annotations,
+    normalize_annotations)
+
+
+class SerializerJobAnnotation(JobAnnotation):
+    """Loads annotations by a wide join of all tables and the serializers"""
+
+    @staticmethod
+    def _extend_attributes(attributeval_set, default_attribute_values):
+        shape_attribute_specs_set = set(attr.spec_id for attr in attributeval_set)
+        for db_attr in default_attribute_values:
+            if db_attr.spec_id not in shape_attribute_specs_set:
+                attributeval_set.append(dotdict([
+                    ('spec_id', db_attr.spec_id),
+                    ('value', db_attr.value),
+                ]))
+
+    def _init_tags_from_db(self):
+        db_tags = self.db_job.labeledimage_set.prefetch_related(
+            "label",
+            "labeledimageattributeval_set"
+        ).values(
+            'id',
+            'frame',
+            'label_id',
+            'group',
+            'labeledimageattributeval__spec_id',
+            'labeledimageattributeval__value',
+            'labeledimageattributeval__id',
+        ).order_by('frame')
+
+        db_tags = _merge_table_rows(
+            rows=db_tags,
+            keys_for_merge={
+                "labeledimageattributeval_set": [
+                    'labeledimageattributeval__spec_id',
+                    'labeledimageattributeval__value',
+                    'labeledimageattributeval__id',
+                ],
+            },
+            field_id='id',
+        )
+
+        for db_tag in db_tags:
+            self._extend_attributes(db_tag.labeledimageattributeval_set,
+                self.db_attributes[db_tag.label_id]["all"].values())
+
+        serializer = serializers.LabeledImageSerializer(db_tags, many=True)
+        self.ir_data.tags = serializer.data
+
+    def _init_shapes_from_db(self):
+        db_shapes = self.db_job.labeledshape_set.prefetch_related(
+            "label",
+            "labeledshapeattributeval_set"
+        ).values(
+            'id',
+            'label_id',
+            'type',
+            'frame',
+            'group',
+            'occluded',
+            'z_order',
+            'points',
+            'labeledshapeattributeval__spec_id',
+            'labeledshapeattributeval__value',
+            'labeledshapeattributeval__id',
+            ).order_by('frame')
+
+        db_shapes = _merge_table_rows(
+            rows=db_shapes,
+            keys_for_merge={
+                'labeledshapeattributeval_set': [
+                    'labeledshapeattributeval__spec_id',
+                    'labeledshapeattributeval__value',
+                    'labeledshapeattributeval__id',
+                ],
+            },
+            field_id='id',
+        )
+        for db_shape in db_shapes:
+            self._extend_attributes(db_shape.labeledshapeattributeval_set,
+                self.db_attributes[db_shape.label_id]["all"].values())
+
+        serializer = serializers.LabeledShapeSerializer(db_shapes, many=True)
+        self.ir_data.shapes = serializer.data
+
+    def _init_tracks_from_db(self):
+        db_tracks = self.db_job.labeledtrack_set.prefetch_related(
+            "label",
+            "labeledtrackattributeval_set",
+            "trackedshape_set__trackedshapeattributeval_set"
+        ).values(
+            "id",
+            "frame",
+            "label_id",
+            "group",
+            "labeledtrackattributeval__spec_id",
+            "labeledtrackattributeval__value",
+            "labeledtrackattributeval__id",
+            "trackedshape__type",
+            "trackedshape__occluded",
+            "trackedshape__z_order",
+            "trackedshape__points",
+            "trackedshape__id",
+            "trackedshape__frame",
+            "trackedshape__outside",
+            "trackedshape__trackedshapeattributeval__spec_id",
+            "trackedshape__trackedshapeattributeval__value",
+            "trackedshape__trackedshapeattributeval__id",
+        ).order_by('id', 'trackedshape__frame')
+
+        db_tracks = _merge_table_rows(
+            rows=db_tracks,
+            keys_for_merge={
+                "labeledtrackattributeval_set": [
+                    "labeledtrackattributeval__spec_id",
+                    "labeledtrackattributeval__value",
+                    "labeledtrackattributeval__id",
+                ],
+                "trackedshape_set":[
+                    "trackedshape__type",
+                    "trackedshape__occluded",
+                    "trackedshape__z_order",
+                    "trackedshape__points",
+                    "trackedshape__id",
+                    "trackedshape__frame",
+                    "trackedshape__outside",
+                    "trackedshape__trackedshapeattributeval__spec_id",
+                    "trackedshape__trackedshapeattributeval__value",
+                    "trackedshape__trackedshapeattributeval__id",
+                ],
+            },
+            field_id="id",
+        )
+
+        for db_track in db_tracks:
+            db_track["trackedshape_set"] = _merge_table_rows(db_track["trackedshape_set"], {
+                'trackedshapeattributeval_set': [
+                    'trackedshapeattributeval__value',
+                    'trackedshapeattributeval__spec_id',
+                    'trackedshapeattributeval__id',
+                ]
+            }, 'id')
+
+            # A result table can consist many equal rows for track/shape attributes
+            # We need filter unique attributes manually
+            db_track["labeledtrackattributeval_set"] = list(set(db_track["labeledtrackattributeval_set"]))
+            self._extend_attributes(db_track.labeledtrackattributeval_set,
+                self.db_attributes[db_track.label_id]["immutable"].values())
+
+            default_attribute_values = self.db_attributes[db_track.label_id]["mutable"].values()
+            for db_shape in db_track["trackedshape_set"]:
+                db_shape["trackedshapeattributeval_set"] = list(
+                    set(db_shape["trackedshapeattributeval_set"])
+                )
+                # in case of trackedshapes need to interpolate attriute values and extend it
+                # by previous shape attribute values (not default values)
+                self._extend_attributes(db_shape["trackedshapeattributeval_set"], default_attribute_values)
+                default_attribute_values = db_shape["trackedshapeattributeval_set"]
+
+
+        serializer = serializers.LabeledTrackSerializer(db_tracks, many=True)
+        self.ir_data.tracks = serializer.data
+
+    def init_from_db(self):
+        self._init_tags_from_db()
+        self._init_shapes_from_db()
+        self._init_tracks_from_db()
+        self._init_version_from_db()
+
+class JobAnnotationLoadingBenchmark(TestCase):
+    SIZES = [(100, 10), (1000, 10), (2000, 50)] # (tracks, shapes per track)
+
+    def test_loading_paths(self):
+        print()
+        print("{:>8} {:>14} {:>12} {:>12}".format(
+            "tracks", "tracked shapes", "serializers", "per-table"))
+        for tracks, shapes_per_track in self.SIZES:
+            db_job = create_db_job(frames=10 * shapes_per_track)
+            generate_annotations(db_job, tracks, shapes_per_track)
+
+            timings = []
+            results = []
+            for annotation_class in [SerializerJobAnnotation, JobAnnotation]:
+                start = timer()
+                results.append(load_job_annotations(db_job, annotation_class))
+                timings.append(timer() - start)
+
+            self.assertEqual(*map(normalize_annotations, results))
+            print("{:>8} {:>14} {:>11.2f}s {:>11.2f}s".format(
+                tracks, tracks * shapes_per_track, *timings))
+
+class LinearLookupAnnotation(Annotation):
+    """Looks up labels and attributes by names with linear search"""
+
+    def _get_label_id(self, label_name):
+        for db_label in self._label_mapping.values():
+            if label_name == db_label.name:
+                return db_label.id
+        return None
+
+    def _get_attribute_name(self, attribute_id):
+        for attribute_mapping in self._attribute_mapping_merged.values():
+            if attribute_id in attribute_mapping:
+                return attribute_mapping[attribute_id]
+
+    def _get_attribute_id(self, label_id, attribute_name, attribute_type=None):
+        if attribute_type:
+            container = self._attribute_mapping[label_id][attribute_type]
+        else:
+            container = self._attribute_mapping_merged[label_id]
+
+        for attr_id, attr_name in container.items():
+            if attribute_name == attr_name:
+                return attr_id
+        return None
+
+    def _export_attributes(self, attributes):
+        return [Annotation.Attribute(name=self._get_attribute_name(attr["spec_id"]),
+            value=attr["value"]) for attr in attributes]
+
+class AnnotationExchangeBenchmark(TestCase):
+    LABELS = 500
+    SHAPES = 20000
+
+    def _upload(self, annotation_class, db_task, shapes):
+        annotation = annotation_class(AnnotationIR(), db_task)
+        for shape in shapes:
+            annotation.add_shape(shape)
+        return annotation.data
+
+    def _dump(self, annotation_class, db_task, data):
+        annotation = annotation_class(data, db_task)
+        return [list(frame.labeled_shapes) for frame in annotation.group_by_frame()]
+
+    def test_dump_and_upload(self):
+        labels = ["label_{}".format(i) for i in range(self.LABELS)]
+        db_task = create_db_task(frames=100, segment_size=100, overlap=0,
+            labels=labels)
+        rng = random.Random(0)
+        shapes = [Annotation.LabeledShape(type="rectangle",
+            frame=rng.randrange(0, 100), label=rng.choice(labels),
+            points=[1.0, 2.0, 3.0, 4.0], occluded=False,
+            attributes=[Annotation.Attribute(name="model", value="bmw"),
+                Annotation.Attribute(name="parked", value="true")])
+            for _ in range(self.SHAPES)]
+
+        print()
+        print("{:>8} {:>8} {:>12} {:>12} {:>12}".format(
+            "labels", "shapes", "operation", "linear", "indexed"))
+        results = { "upload": [], "dump": [] }
+        timings = { "upload": [], "dump": [] }
+        for annotation_class in [LinearLookupAnnotation, Annotation]:
+            start = timer()
+            data = self._upload(annotation_class, db_task, shapes)
+            timings["upload"].append(timer() - start)
+            results["upload"].append(data.data)
+
+            start = timer()
+            results["dump"].append(self._dump(annotation_class, db_task, data))
+            timings["dump"].append(timer() - start)
+
+        for operation in ["upload", "dump"]:
+            self.assertEqual(*results[operation])
+            print("{:>8} {:>8} {:>12} {:>11.2f}s {:>11.2f}s".format(
+                self.LABELS, self.SHAPES, operation, *timings[operation]))
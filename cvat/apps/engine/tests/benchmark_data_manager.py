@@ -0,0 +1,42 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+# The benchmark is not a part of the test suite. Run it explicitly:
+#   python manage.py test cvat.apps.engine.tests.benchmark_data_manager
+
+import copy
+from timeit import default_timer as timer
+
+from unittest import TestCase
+
+from cvat.apps.engine.data_manager import ShapeManager
+from cvat.apps.engine.tests.test_data_manager import (DenseShapeManager,
+    generate_shapes)
+
+
+class ShapeMergeBenchmark(TestCase):
+    SIZES = [100, 500, 2000] # objects per frame
+    IMAGE_SIZE = 2000
+
+    def test_matching(self):
+        print()
+        print("{:>8} {:>12} {:>12}".format("objects", "dense", "sparse"))
+        for count in self.SIZES:
+            old_shapes = generate_shapes(count, frame=10,
+                size=self.IMAGE_SIZE, types=["rectangle"])
+            int_shapes = generate_shapes(count, frame=10,
+                size=self.IMAGE_SIZE, types=["rectangle"], seed=1)
+
+            timings = []
+            results = []
+            for manager_class in [DenseShapeManager, ShapeManager]:
+                manager = manager_class(copy.deepcopy(old_shapes))
+                start = timer()
+                manager.merge(copy.deepcopy(int_shapes),
+                    start_frame=10, overlap=5)
+                timings.append(timer() - start)
+                results.append(manager.objects)
+
+            self.assertEqual(*results)
+            print("{:>8} {:>11.2f}s {:>11.2f}s".format(count, *timings))
@@ -0,0 +1,387 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import random
+import shutil
+from unittest import mock
+
+from django.test import TestCase
+
+from cvat.apps.engine.annotation import (JobAnnotation, TaskAnnotation,
+    _to_copy_text, bulk_insert, stream_job_data)
+from cvat.apps.annotation.annotation import Annotation, AnnotationIR
+from cvat.apps.engine.models import (AttributeSpec, AttributeType, Data, Image,
+    Job, Label, LabeledShape, LabeledShapeAttributeVal, Segment, Task)
+from cvat.apps.engine.serializers import (LabeledDataSerializer,
+    LabeledDataStreamSerializer)
+
+
+def create_db_task(frames, segment_size, overlap, labels=("car", "person")):
+    db_data = Data.objects.create(size=frames, stop_frame=frames - 1)
+    Image.objects.bulk_create([Image(data=db_data, frame=frame, width=800,
+        height=600, path="frame_{}.jpg".format(frame)) for frame in range(frames)])
+    db_task = Task.objects.create(name="synthetic task", mode="interpolation",
+        segment_size=segment_size, overlap=overlap, data=db_data)
+    os.makedirs(db_task.get_task_logs_dirname(), exist_ok=True)
+    for label_name in labels:
+        db_label = Label.objects.create(task=db_task, name=label_name)
+        AttributeSpec.objects.create(label=db_label, name="model",
+            mutable=False, input_type=AttributeType.SELECT,
+            default_value="mazda", values="mazda\nbmw")
+        AttributeSpec.objects.create(label=db_label, name="parked",
+            mutable=True, input_type=AttributeType.CHECKBOX,
+            default_value="false", values="false")
+
+    for start_frame in range(0, frames, segment_size - overlap):
+        stop_frame = min(start_frame + segment_size - 1, frames - 1)
+        db_segment = Segment.objects.create(task=db_task,
+            start_frame=start_frame, stop_frame=stop_frame)
+        Job.objects.create(segment=db_segment)
+        if stop_frame == frames - 1:
+            break
+    return db_task
+
+def create_db_job(frames):
+    db_task = create_db_task(frames, segment_size=frames, overlap=0)
+    return Job.objects.get(segment__task=db_task)
+
+def generate_annotations(db_job, tracks, shapes_per_track, seed=0):
+    """
+    Generates a synthetic job content with tracks, shapes and tags.
+    Each track has shapes_per_track tracked shapes.
+    """
+    rng = random.Random(seed)
+    start_frame = db_job.segment.start_frame
+    frames = db_job.segment.stop_frame + 1 - start_frame
+    labels = {}
+    for db_label in db_job.segment.task.label_set.all():
+        labels[db_label.id] = {db_attr.name: db_attr.id
+            for db_attr in db_label.attributespec_set.all()}
+
+    def points():
+        x, y = rng.uniform(0, 500), rng.uniform(0, 500)
+        return [x, y, x + rng.uniform(1, 50), y + rng.uniform(1, 50)]
+
+    data = { "version": 0, "tags": [], "shapes": [], "tracks": [] }
+    for _ in range(tracks):
+        label_id = rng.choice(list(labels))
+        attributes = labels[label_id]
+        start = start_frame + rng.randrange(0, max(1, frames - shapes_per_track))
+        data["tracks"].append({
+            "frame": start,
+            "label_id": label_id,
+            "group": None,
+            "attributes": [{ "spec_id": attributes["model"], "value": "bmw" }] \
+                if rng.random() < 0.5 else [],
+            "shapes": [{
+                "frame": start + i,
+                "type": "rectangle",
+                "occluded": rng.random() < 0.1,
+                "z_order": 0,
+                "points": points(),
+                "outside": i == shapes_per_track - 1,
+                "attributes": [{ "spec_id": attributes["parked"], "value": "true" }] \
+                    if rng.random() < 0.3 else [],
+            } for i in range(shapes_per_track)],
+        })
+
+        data["shapes"].append({
+            "frame": start_frame + rng.randrange(0, frames),
+            "label_id": label_id,
+            "group": 0,
+            "type": "polygon",
+            "occluded": False,
+            "z_order": 1,
+            "points": points() + points(),
+            "attributes": [{ "spec_id": attributes["parked"], "value": "true" }],
+        })
+
+        data["tags"].append({
+            "frame": start_frame + rng.randrange(0, frames),
+            "label_id": label_id,
+            "group": None,
+            "attributes": [],
+        })
+
+    annotation = JobAnnotation(db_job.id, None)
+    annotation.create(data)
+
+def load_job_annotations(db_job, annotation_class=JobAnnotation):
+    annotation = annotation_class(db_job.id, None)
+    annotation.init_from_db()
+    return annotation.data
+
+def normalize_annotations(data):
+    def normalize(obj):
+        if isinstance(obj, dict):
+            obj = { k: normalize(v) for k, v in obj.items() }
+            if "attributes" in obj:
+                obj["attributes"] = sorted(obj["attributes"],
+                    key=lambda attr: attr["spec_id"])
+            return obj
+        elif isinstance(obj, list):
+            return [normalize(v) for v in obj]
+        return obj
+
+    data = normalize(data)
+    for key in ["tags", "shapes"]:
+        data[key] = sorted(data[key], key=lambda obj: obj["id"])
+    return data
+
+class JobAnnotationLoadingTest(TestCase):
+    def test_can_load_job_annotations(self):
+        db_job = create_db_job(frames=50)
+        generate_annotations(db_job, tracks=20, shapes_per_track=5)
+
+        loaded = load_job_annotations(db_job)
+
+        self.assertEqual(len(loaded["tracks"]), 20)
+        for track in loaded["tracks"]:
+            frames = [shape["frame"] for shape in track["shapes"]]
+            self.assertEqual(len(frames), 5)
+            self.assertEqual(frames, sorted(frames))
+        for obj in loaded["tags"] + loaded["shapes"]:
+            self.assertTrue(obj["attributes"])
+
+    def test_can_load_empty_job(self):
+        db_job = create_db_job(frames=10)
+
+        loaded = load_job_annotations(db_job)
+
+        self.assertEqual(loaded,
+            { "version": 0, "tags": [], "shapes": [], "tracks": [] })
+
+class AnnotationImportTest(TestCase):
+    def _import(self, annotation):
+        rng = random.Random(0)
+        for i in range(40):
+            frame = rng.randrange(0, 100)
+            annotation.add_tag(annotation.Tag(frame=frame, label="car",
+                attributes=[annotation.Attribute(name="model", value="bmw")]))
+            annotation.add_shape(annotation.LabeledShape(type="rectangle",
+                frame=frame, label="person", points=[1.0, 2.0, 3.0 + i, 4.0],
+                occluded=False, attributes=[]))
+            start = rng.randrange(0, 90)
+            annotation.add_track(annotation.Track(label="car", group=0,
+                shapes=[annotation.TrackedShape(type="rectangle", frame=frame,
+                    points=[1.0, 2.0, 3.0 + frame, 4.0], occluded=False,
+                    outside=frame == start + 40, keyframe=True,
+                    attributes=[annotation.Attribute(name="parked", value="true")])
+                for frame in range(start, min(start + 41, 100), 4)]))
+
+    def test_can_split_imported_objects_by_segments(self):
+        db_task = create_db_task(frames=100, segment_size=30, overlap=5)
+        db_segments = list(db_task.segment_set.order_by("start_frame"))
+        imported = { db_segment.id: [] for db_segment in db_segments }
+        annotation = Annotation(AnnotationIR(), db_task,
+            segments=[(db_segment.start_frame, db_segment.stop_frame,
+                imported[db_segment.id].append) for db_segment in db_segments])
+        annotation._MAX_ANNO_SIZE = 50
+        self._import(annotation)
+        annotation.flush()
+        expected = Annotation(AnnotationIR(), db_task)
+        self._import(expected)
+
+        for db_segment in db_segments:
+            batches = imported[db_segment.id]
+            self.assertGreater(len(batches), 1)
+            data = AnnotationIR()
+            for batch in batches:
+                for kind in ["tags", "shapes", "tracks"]:
+                    data[kind].extend(batch[kind])
+            self.assertEqual(data.data, expected.data.slice(
+                db_segment.start_frame, db_segment.stop_frame).serialize())
+
+class AnnotationLookupTest(TestCase):
+    def test_can_find_labels_and_attributes(self):
+        db_task = create_db_task(frames=10, segment_size=10, overlap=0,
+            labels=["car", "person", "bike"])
+        annotation = Annotation(AnnotationIR(), db_task)
+
+        for db_label in db_task.label_set.all():
+            self.assertEqual(annotation._get_label_id(db_label.name), db_label.id)
+            for db_attr in db_label.attributespec_set.all():
+                attr_type = "mutable" if db_attr.mutable else "immutable"
+                self.assertEqual(annotation._get_attribute_name(db_attr.id),
+                    db_attr.name)
+                self.assertEqual(annotation._get_attribute_id(db_label.id,
+                    db_attr.name), db_attr.id)
+                self.assertEqual(annotation._get_attribute_id(db_label.id,
+                    db_attr.name, attr_type), db_attr.id)
+                self.assertIsNone(annotation._get_attribute_id(db_label.id,
+                    db_attr.name, "immutable" if db_attr.mutable else "mutable"))
+        self.assertIsNone(annotation._get_label_id("tree"))
+        self.assertIsNone(annotation._get_attribute_id(None, "model"))
+
+    def test_can_share_exported_attributes(self):
+        db_task = create_db_task(frames=10, segment_size=10, overlap=0)
+        db_attr = db_task.label_set.first().attributespec_set.first()
+        annotation = Annotation(AnnotationIR(), db_task)
+
+        exported = [annotation._export_attributes([
+            { "spec_id": db_attr.id, "value": value }]) for value in ["a", "b", "a"]]
+
+        self.assertEqual(exported[0],
+            [Annotation.Attribute(name=db_attr.name, value="a")])
+        self.assertEqual(exported[1][0].value, "b")
+        self.assertIs(exported[0], exported[2])
+
+class BulkInsertTest(TestCase):
+    def test_can_insert_rows(self):
+        db_job = create_db_job(frames=10)
+        db_label = db_job.segment.task.label_set.first()
+        db_spec = db_label.attributespec_set.first()
+        rows = [(None, db_job.id, db_label.id, frame, None, "rectangle",
+            False, 0, [1.0, 2.0, 3.0, 4.5]) for frame in range(3)]
+
+        ids = bulk_insert(LabeledShape, ("id", "job_id", "label_id", "frame",
+            "group", "type", "occluded", "z_order", "points"), rows,
+            flt_param={"job_id": db_job.id})
+        bulk_insert(LabeledShapeAttributeVal, ("id", "spec_id", "value",
+            "shape_id"), [(None, db_spec.id, "bmw", ids[1])], flt_param={})
+
+        self.assertEqual(len(set(ids)), 3)
+        for frame, shape_id in enumerate(ids):
+            db_shape = LabeledShape.objects.get(id=shape_id)
+            self.assertEqual(db_shape.frame, frame)
+            self.assertEqual(db_shape.points, [1.0, 2.0, 3.0, 4.5])
+        self.assertEqual(LabeledShapeAttributeVal.objects.get(
+            shape_id=ids[1]).value, "bmw")
+
+    def test_can_escape_copy_values(self):
+        self.assertEqual(_to_copy_text(None), "\\N")
+        self.assertEqual(_to_copy_text(True), "t")
+        self.assertEqual(_to_copy_text(0), "0")
+        self.assertEqual(_to_copy_text("a\tb\\c\nd"), "a\\tb\\\\c\\nd")
+
+class LabeledDataStreamSerializerTest(TestCase):
+    def test_can_serialize_same_data_as_labeled_data_serializer(self):
+        db_job = create_db_job(frames=50)
+        generate_annotations(db_job, tracks=5, shapes_per_track=3)
+        data = load_job_annotations(db_job)
+        # the engine can add extra fields which are not a part of the schema
+        data["tracks"][0]["interpolated_shapes"] = []
+        data["tracks"][0]["shapes"][0]["keyframe"] = True
+
+        serializer = LabeledDataSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        stream = LabeledDataStreamSerializer(data)
+        stream.CHUNK_SIZE = 2
+
+        self.assertEqual(json.loads("".join(stream)), serializer.data)
+
+    def test_can_serialize_job_data_from_db_iterators(self):
+        db_job = create_db_job(frames=50)
+        generate_annotations(db_job, tracks=5, shapes_per_track=3)
+        expected = load_job_annotations(db_job)
+
+        with mock.patch.object(LabeledDataStreamSerializer, 'CHUNK_SIZE', 2):
+            stream = stream_job_data(db_job.id, None)
+
+            self.assertEqual(json.loads("".join(stream)),
+                json.loads("".join(LabeledDataStreamSerializer(expected))))
+
+    def test_can_serialize_empty_data(self):
+        data = { "version": 3, "tags": [], "shapes": [], "tracks": [] }
+
+        self.assertEqual(json.loads("".join(LabeledDataStreamSerializer(data))),
+            data)
+
+class TaskAnnotationCacheTest(TestCase):
+    def setUp(self):
+        self.db_task = create_db_task(frames=100, segment_size=30, overlap=5)
+
+    def tearDown(self):
+        shutil.rmtree(self.db_task.get_task_dirname(), ignore_errors=True)
+
+    def _create_annotations(self):
+        # objects in overlaps are duplicated in jobs and merged back
+        db_label = self.db_task.label_set.first()
+        data = { "version": 0, "tags": [], "shapes": [], "tracks": [] }
+        for db_job in self.db_task.segment_set.order_by("id"):
+            start_frame = db_job.start_frame
+            data["tracks"].append({
+                "frame": start_frame + 20,
+                "label_id": db_label.id,
+                "group": None,
+                "attributes": [],
+                "shapes": [{
+                    "frame": start_frame + 20 + i,
+                    "type": "rectangle",
+                    "occluded": False,
+                    "z_order": 0,
+                    "points": [10.0 + i, 10.0, 50.0 + i, 50.0],
+                    "outside": i == 9,
+                    "attributes": [],
+                } for i in range(10)],
+            })
+            data["shapes"].append({
+                "frame": start_frame + 26,
+                "label_id": db_label.id,
+                "group": 0,
+                "type": "rectangle",
+                "occluded": False,
+                "z_order": 0,
+                "points": [1.0, 2.0, 3.0, 4.0],
+                "attributes": [],
+            })
+        TaskAnnotation(self.db_task.id, None).create(data)
+
+    def _load(self, use_cache):
+        annotation = TaskAnnotation(self.db_task.id, None)
+        annotation.init_from_db(use_cache=use_cache)
+        return annotation
+
+    def test_can_merge_same_annotations_with_cache(self):
+        self._create_annotations()
+
+        expected = self._load(use_cache=False).data
+        cold = self._load(use_cache=True)
+        warm = self._load(use_cache=True)
+
+        self.assertEqual(cold.data, expected)
+        self.assertEqual(warm.data, expected)
+        self.assertEqual(cold.merge_cache.job_misses, 4)
+        self.assertEqual(warm.merge_cache.job_misses, 0)
+        self.assertEqual(warm.merge_cache.boundary_misses, 0)
+        self.assertLess(len(expected["tracks"]), 8)
+
+    def test_keeps_cache_in_json_files(self):
+        self._create_annotations()
+        self._load(use_cache=True)
+
+        filenames = os.listdir(self.db_task.get_annotation_cache_dirname())
+        self.assertEqual(len(filenames), 5)
+        for filename in filenames:
+            with open(os.path.join(self.db_task.get_annotation_cache_dirname(),
+                    filename)) as f:
+                json.load(f)
+
+    def test_can_merge_only_boundaries_of_changed_job(self):
+        self._create_annotations()
+        self._load(use_cache=True)
+        db_job = Job.objects.filter(segment__task=self.db_task) \
+            .order_by("id")[1]
+        generate_annotations(db_job, tracks=2, shapes_per_track=3)
+
+        loaded = self._load(use_cache=True)
+
+        self.assertEqual(loaded.data, self._load(use_cache=False).data)
+        self.assertEqual(loaded.merge_cache.job_misses, 1)
+        self.assertEqual(loaded.merge_cache.boundary_misses, 2)
+
+    def test_can_invalidate_cache_on_attribute_change(self):
+        self._create_annotations()
+        self._load(use_cache=True)
+        db_label = self.db_task.label_set.first()
+        AttributeSpec.objects.create(label=db_label, name="color",
+            mutable=False, input_type=AttributeType.TEXT,
+            default_value="red", values="red")
+
+        loaded = self._load(use_cache=True)
+
+        self.assertEqual(loaded.data, self._load(use_cache=False).data)
+        self.assertEqual(loaded.merge_cache.job_misses, 4)
@@ -2,11 +2,64 @@
 #
 # SPDX-License-Identifier: MIT
 
-from cvat.apps.engine.data_manager import TrackManager
+import copy
+import random
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from cvat.apps.engine.data_manager import ShapeManager, TrackManager
 
 from unittest import TestCase
 
 
+class DenseShapeManager(ShapeManager):
+    """Matches objects with the full cost matrix of all pairs"""
+
+    def _match_objects(self, int_objects, old_objects, start_frame, overlap,
+            min_cost_thresh):
+        cost_matrix = np.empty(shape=(len(int_objects), len(old_objects)),
+            dtype=float)
+        for i, int_obj in enumerate(int_objects):
+            for j, old_obj in enumerate(old_objects):
+                cost_matrix[i][j] = 1 - self._calc_objects_similarity(
+                    int_obj, old_obj, start_frame, overlap)
+
+        row_ind, col_ind = linear_sum_assignment(cost_matrix)
+        return [(int(i), int(j)) for i, j in zip(row_ind, col_ind)
+            if cost_matrix[i][j] <= min_cost_thresh]
+
+def generate_shapes(count, frame, labels=(0, 1), size=1000, seed=0,
+        types=("rectangle",) * 8 + ("polygon", "points")):
+    """
+    Generates shapes on a frame. A part of them are noisy copies of
+    the previous ones, like objects of two overlapped segments.
+    """
+    rng = random.Random(seed)
+    shapes = []
+    for _ in range(count):
+        if shapes and rng.random() < 0.3:
+            shape = copy.deepcopy(rng.choice(shapes))
+            shape["points"] = [p + rng.uniform(-3, 3) for p in shape["points"]]
+        else:
+            x, y = rng.uniform(0, size), rng.uniform(0, size)
+            w, h = rng.uniform(5, 40), rng.uniform(5, 40)
+            shape = {
+                "type": rng.choice(types),
+                "label_id": rng.choice(labels),
+                "frame": frame,
+                "group": 0,
+                "occluded": False,
+                "z_order": 0,
+                "attributes": [],
+                "points": [x, y, x + w, y, x + w, y + h],
+            }
+            if shape["type"] == "rectangle":
+                shape["points"] = [x, y, x + w, y + h]
+        shapes.append(shape)
+    return shapes
+
+
 class TrackManagerTest(TestCase):
     def test_single_point_interpolation(self):
         track = {
@@ -36,4 +89,155 @@ class TrackManagerTest(TestCase):
 
         interpolated = TrackManager.get_interpolated_shapes(track, 0, 2)
 
-        self.assertEqual(len(interpolated), 3)
\ No newline at end of file
+        self.assertEqual(len(interpolated), 3)
+
+    def test_rectangle_interpolation(self):
+        track = {
+            "frame": 0,
+            "label_id": 0,
+            "group": None,
+            "attributes": [],
+            "shapes": [
+                {
+                    "frame": 0,
+                    "points": [0.0, 0.0, 4.0, 4.0],
+                    "type": "rectangle",
+                    "occluded": False,
+                    "outside": False,
+                    "attributes": []
+                },
+                {
+                    "frame": 4,
+                    "points": [4.0, 8.0, 8.0, 12.0],
+                    "type": "rectangle",
+                    "occluded": False,
+                    "outside": True,
+                    "attributes": []
+                },
+            ]
+        }
+
+        interpolated = TrackManager.get_interpolated_shapes(track, 0, 4)
+
+        self.assertEqual([shape["frame"] for shape in interpolated],
+            [0, 1, 2, 3, 4])
+        self.assertEqual([shape["keyframe"] for shape in interpolated],
+            [True, False, False, False, True])
+        for shape in interpolated[1:4]:
+            self.assertEqual(shape["points"], [0.0, 0.0, 4.0, 4.0])
+
+    def _make_rectangle_track(self):
+        return {
+            "frame": 0,
+            "label_id": 0,
+            "group": None,
+            "attributes": [],
+            "shapes": [
+                {
+                    "frame": 0,
+                    "points": [0.0, 0.0, 4.0, 4.0],
+                    "type": "rectangle",
+                    "occluded": False,
+                    "outside": False,
+                    "attributes": [{ "spec_id": 1, "value": "a" }]
+                },
+                {
+                    "frame": 4,
+                    "points": [4.0, 8.0, 8.0, 12.0],
+                    "type": "rectangle",
+                    "occluded": False,
+                    "outside": False,
+                    "attributes": [{ "spec_id": 1, "value": "b" }]
+                },
+            ]
+        }
+
+    def test_builds_interpolated_shapes_on_access(self):
+        interpolated = TrackManager.get_interpolated_shapes(
+            self._make_rectangle_track(), 0, 6)
+
+        shapes = interpolated.between(2, 2)
+
+        self.assertEqual([(shape["frame"], shape["points"]) for shape in shapes],
+            [(2, [2.0, 4.0, 6.0, 8.0])])
+        self.assertEqual(sum(isinstance(shape, dict)
+            for shape in interpolated._shapes), 3)
+        self.assertEqual(len(interpolated), 6)
+
+    def test_key_shape_changes_dont_affect_interpolated_shapes(self):
+        interpolated = TrackManager.get_interpolated_shapes(
+            self._make_rectangle_track(), 0, 4)
+
+        interpolated[0]["attributes"].append({ "spec_id": 2, "value": "c" })
+
+        self.assertEqual(interpolated[1]["attributes"],
+            [{ "spec_id": 1, "value": "a" }])
+
+    def test_polygon_interpolation_does_not_depend_on_geometry_backend(self):
+        track = {
+            "frame": 0,
+            "label_id": 0,
+            "group": None,
+            "attributes": [],
+            "shapes": [
+                {
+                    "frame": 0,
+                    "points": [0.0, 0.0, 10.0, 0.5, 10.0, 10.0, 0.0, 10.0],
+                    "type": "polygon",
+                    "occluded": False,
+                    "outside": False,
+                    "attributes": []
+                },
+                {
+                    "frame": 10,
+                    "points": [5.0, 5.0, 20.0, 5.0, 12.0, 20.0],
+                    "type": "polygon",
+                    "occluded": False,
+                    "outside": False,
+                    "attributes": []
+                },
+            ]
+        }
+
+        vectorized = TrackManager._VECTORIZED_GEOMETRY
+        try:
+            TrackManager._VECTORIZED_GEOMETRY = False
+            expected = TrackManager.get_interpolated_shapes(copy.deepcopy(track), 0, 10)
+
+            TrackManager._VECTORIZED_GEOMETRY = vectorized
+            interpolated = TrackManager.get_interpolated_shapes(copy.deepcopy(track), 0, 10)
+        finally:
+            TrackManager._VECTORIZED_GEOMETRY = vectorized
+
+        self.assertEqual(len(interpolated), 11)
+        self.assertEqual(interpolated, expected)
+
+
+class ShapeManagerTest(TestCase):
+    def _merge(self, manager_class, old_shapes, int_shapes):
+        manager = manager_class(copy.deepcopy(old_shapes))
+        manager.merge(copy.deepcopy(int_shapes), start_frame=10, overlap=5)
+        return manager.objects
+
+    def test_can_match_shapes_like_dense_matching(self):
+        for seed in range(5):
+            old_shapes = generate_shapes(100, frame=12, seed=seed)
+            int_shapes = generate_shapes(100, frame=12, seed=seed) + \
+                generate_shapes(20, frame=12, seed=seed + 100)
+
+            self.assertEqual(self._merge(ShapeManager, old_shapes, int_shapes),
+                self._merge(DenseShapeManager, old_shapes, int_shapes))
+
+    def test_can_match_crowded_rectangles(self):
+        old_shapes = generate_shapes(200, frame=10, labels=[0], size=100,
+            types=["rectangle"])
+        int_shapes = generate_shapes(200, frame=10, labels=[0], size=100,
+            types=["rectangle"], seed=1)
+
+        manager = ShapeManager([])
+        matches = manager._match_objects(int_shapes, old_shapes, 10, 5,
+            manager._get_cost_threshold())
+        dense_matches = DenseShapeManager([])._match_objects(int_shapes,
+            old_shapes, 10, 5, manager._get_cost_threshold())
+
+        self.assertEqual(matches, dense_matches)
@@ -0,0 +1,383 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import os.path as osp
+import tempfile
+import zipfile
+from io import BytesIO
+from unittest import TestCase, mock
+
+import av
+import numpy as np
+from PIL import Image
+
+from cvat.apps.engine.cache import ChunkStorage, save_media_info
+from cvat.apps.engine.frame_provider import ChunkCache, FrameProvider
+from cvat.apps.engine.media_extractors import (ListChunkWriter,
+    VideoFrameIndex, ZipChunkWriter)
+from cvat.apps.engine.models import DataChoice, StorageMethodChoice
+
+
+class _TestData:
+    def __init__(self, data_dir, size, chunk_size):
+        self.id = 1
+        self.size = size
+        self.chunk_size = chunk_size
+        self.compressed_chunk_type = DataChoice.IMAGESET
+        self.original_chunk_type = DataChoice.IMAGESET
+        self.storage_method = StorageMethodChoice.FILE_SYSTEM
+        self._data_dir = data_dir
+
+    def get_compressed_chunk_path(self, chunk_number):
+        return osp.join(self._data_dir, '{}.zip'.format(chunk_number))
+
+    get_original_chunk_path = get_compressed_chunk_path
+
+def generate_chunks(data_dir, size, chunk_size):
+    for chunk_number in range(0, (size + chunk_size - 1) // chunk_size):
+        images = []
+        for idx in range(chunk_number * chunk_size,
+                min(size, (chunk_number + 1) * chunk_size)):
+            buf = BytesIO()
+            Image.new('RGB', size=(10 + idx, 10)).save(buf, 'png')
+            images.append((buf, 'frame_{}.png'.format(idx), idx))
+        ZipChunkWriter(100).save_as_chunk(images,
+            osp.join(data_dir, '{}.zip'.format(chunk_number)))
+
+def generate_video_chunk(path, size, keyframe_interval=None):
+    container = av.open(path, 'w')
+    stream = container.add_stream('libx264', rate=25)
+    stream.width = 16
+    stream.height = 16
+    stream.pix_fmt = 'yuv420p'
+    if keyframe_interval:
+        stream.options = { 'g': str(keyframe_interval) }
+    for idx in range(size):
+        frame = av.VideoFrame.from_ndarray(
+            np.full((16, 16, 3), 20 * idx, dtype=np.uint8), format='rgb24')
+        for packet in stream.encode(frame):
+            container.mux(packet)
+    for packet in stream.encode():
+        container.mux(packet)
+    container.close()
+
+class FrameProviderCacheTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        generate_chunks(self._tmp_dir.name, size=10, chunk_size=4)
+        self.db_data = _TestData(self._tmp_dir.name, size=10, chunk_size=4)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_sequential_access_decodes_each_frame_once(self):
+        cache = ChunkCache(max_size=1024 * 1024)
+        frame_provider = FrameProvider(self.db_data, cache=cache)
+
+        for idx in [0, 1, 2, 1, 0, 3]:
+            frame, _ = frame_provider.get_frame(idx,
+                out_type=FrameProvider.Type.PIL)
+            self.assertEqual(frame.width, 10 + idx)
+
+        info = cache.info()
+        self.assertEqual(info.misses, 4)
+        self.assertEqual(info.hits, 2)
+        self.assertEqual(info.chunks, 1)
+
+    def test_can_share_cache_between_providers(self):
+        cache = ChunkCache(max_size=1024 * 1024)
+
+        FrameProvider(self.db_data, cache=cache).get_frame(5)
+        buf, _ = FrameProvider(self.db_data, cache=cache).get_frame(5)
+
+        self.assertEqual(Image.open(buf).width, 15)
+        self.assertEqual(cache.info().hits, 1)
+
+    def test_evicts_least_recently_used_chunk(self):
+        cache = ChunkCache(max_size=1)
+        frame_provider = FrameProvider(self.db_data, cache=cache)
+
+        frame_provider.get_frame(0)
+        frame_provider.get_frame(4)
+        frame_provider.get_frame(8)
+
+        info = cache.info()
+        self.assertEqual(info.chunks, 1)
+        self.assertEqual(info.evictions, 2)
+
+        frame_provider.get_frame(8)
+        self.assertEqual(cache.info().hits, 1)
+
+    def test_disabled_cache_is_not_used(self):
+        cache = ChunkCache(max_size=0)
+        frame_provider = FrameProvider(self.db_data, cache=cache)
+
+        buf, _ = frame_provider.get_frame(9)
+
+        self.assertEqual(Image.open(buf).width, 19)
+        self.assertEqual(cache.info().misses, 0)
+
+class FrameProviderGetFramesTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        generate_chunks(self._tmp_dir.name, size=10, chunk_size=4)
+        self.db_data = _TestData(self._tmp_dir.name, size=10, chunk_size=4)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _get_widths(self, **kwargs):
+        frame_provider = FrameProvider(self.db_data,
+            cache=ChunkCache(max_size=0))
+        return [frame.width for frame, _ in frame_provider.get_frames(
+            out_type=FrameProvider.Type.PIL, **kwargs)]
+
+    def test_can_get_all_frames(self):
+        self.assertEqual(self._get_widths(), [10 + i for i in range(10)])
+
+    def test_can_get_frame_range(self):
+        self.assertEqual(self._get_widths(start=3, stop=9, step=2),
+            [13, 15, 17])
+        self.assertEqual(self._get_widths(start=8, stop=20), [18, 19])
+
+    def test_can_prefetch_chunks(self):
+        self.assertEqual(self._get_widths(step=3, prefetch=True),
+            [10, 13, 16, 19])
+
+    def test_can_get_video_frames_as_arrays(self):
+        generate_video_chunk(osp.join(self._tmp_dir.name, 'video_0.mp4'),
+            size=6)
+        self.db_data.size = 6
+        self.db_data.chunk_size = 6
+        self.db_data.original_chunk_type = DataChoice.VIDEO
+        self.db_data.get_original_chunk_path = lambda chunk_number: \
+            osp.join(self._tmp_dir.name, 'video_{}.mp4'.format(chunk_number))
+        frame_provider = FrameProvider(self.db_data)
+
+        frames = list(frame_provider.get_frames(
+            out_type=FrameProvider.Type.NUMPY_ARRAY, start=1, step=2))
+        images = list(frame_provider.get_frames(
+            out_type=FrameProvider.Type.PIL, start=1, step=2))
+
+        self.assertEqual(len(frames), 3)
+        for (frame, _), (image, _) in zip(frames, images):
+            self.assertTrue(np.array_equal(frame, np.array(image)[:, :, ::-1]))
+
+class VideoFrameIndexTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.chunk_path = osp.join(self._tmp_dir.name, 'video_0.mp4')
+        generate_video_chunk(self.chunk_path, size=8, keyframe_interval=3)
+        self.db_data = _TestData(self._tmp_dir.name, size=8, chunk_size=8)
+        self.db_data.original_chunk_type = DataChoice.VIDEO
+        self.db_data.get_original_chunk_path = lambda chunk_number: \
+            osp.join(self._tmp_dir.name, 'video_{}.mp4'.format(chunk_number))
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_can_build_index_lazily(self):
+        index = VideoFrameIndex.get(self.chunk_path)
+
+        self.assertEqual(len(index.frame_pts), 8)
+        # the encoder can insert more key frames on scene changes
+        self.assertEqual(index.keyframes[0], 0)
+        self.assertLess(1, len(index.keyframes))
+        self.assertEqual(index.get_keyframe(7), index.keyframes[-1])
+        self.assertTrue(osp.isfile(
+            VideoFrameIndex.get_index_path(self.chunk_path)))
+
+        loaded = VideoFrameIndex.get(self.chunk_path)
+        self.assertEqual(loaded.frame_pts, index.frame_pts)
+        self.assertEqual(loaded.keyframes, index.keyframes)
+
+    def _check_random_access(self, cache):
+        expected = [frame for frame, _ in FrameProvider(self.db_data) \
+            .get_frames(out_type=FrameProvider.Type.NUMPY_ARRAY)]
+        frame_provider = FrameProvider(self.db_data, cache=cache)
+
+        for frame_number in [7, 1, 4, 0, 5, 6, 2, 3]:
+            frame, _ = frame_provider.get_frame(frame_number,
+                out_type=FrameProvider.Type.NUMPY_ARRAY)
+            self.assertTrue(np.array_equal(frame, expected[frame_number]),
+                frame_number)
+
+    def test_can_seek_frames(self):
+        self._check_random_access(ChunkCache(max_size=0))
+
+    def test_can_seek_cached_frames(self):
+        self._check_random_access(ChunkCache(max_size=1024 * 1024))
+
+class FrameProviderListChunkTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        raw_dir = osp.join(self._tmp_dir.name, 'raw')
+        original_dir = osp.join(self._tmp_dir.name, 'original')
+        os.makedirs(raw_dir)
+        os.makedirs(original_dir)
+
+        self.images = []
+        for idx in range(5):
+            path = osp.join(raw_dir, 'frame_{}.png'.format(idx))
+            Image.new('RGB', size=(10 + idx, 10)).save(path)
+            with open(path, 'rb') as f:
+                self.images.append(f.read())
+            ListChunkWriter(100).save_as_chunk([(path, path, idx)],
+                osp.join(original_dir, '{}.list'.format(idx)))
+
+        self.db_data = _TestData(self._tmp_dir.name, size=5, chunk_size=1)
+        self.db_data.original_chunk_type = DataChoice.LIST
+        self.db_data.get_original_chunk_path = lambda chunk_number: \
+            osp.join(original_dir, '{}.list'.format(chunk_number))
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_can_get_original_frames(self):
+        frame_provider = FrameProvider(self.db_data)
+
+        buf, mime = frame_provider.get_frame(3)
+
+        self.assertEqual(buf.getvalue(), self.images[3])
+        self.assertEqual(mime, ('image/png', None))
+
+    def test_can_stream_chunk_as_zip(self):
+        frame_provider = FrameProvider(self.db_data)
+
+        self.assertTrue(frame_provider.is_chunk_manifest())
+        archive = zipfile.ZipFile(BytesIO(
+            b''.join(frame_provider.stream_chunk(2))))
+        self.assertEqual(archive.namelist(), ['000000.png'])
+        self.assertEqual(archive.read('000000.png'), self.images[2])
+
+class _LazyTestData(_TestData):
+    def __init__(self, data_dir, size, chunk_size):
+        super().__init__(data_dir, size, chunk_size)
+        self.start_frame = 0
+        self.image_quality = 50
+        self.original_chunk_type = DataChoice.LIST
+        self.storage_method = StorageMethodChoice.CACHE
+        for dirname in ['raw', 'compressed', 'original']:
+            os.makedirs(osp.join(data_dir, dirname))
+
+    def get_frame_step(self):
+        return 1
+
+    def get_upload_dirname(self):
+        return osp.join(self._data_dir, 'raw')
+
+    def get_media_info_path(self):
+        return osp.join(self._data_dir, 'media.json')
+
+    def get_compressed_chunk_path(self, chunk_number):
+        return osp.join(self._data_dir, 'compressed',
+            '{}.zip'.format(chunk_number))
+
+    def get_original_chunk_path(self, chunk_number):
+        return osp.join(self._data_dir, 'original',
+            '{}.list'.format(chunk_number))
+
+class FrameProviderChunkStorageTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.db_data = _LazyTestData(osp.join(self._tmp_dir.name, '1'),
+            size=5, chunk_size=2)
+
+        files = []
+        for idx in range(5):
+            name = 'frame_{}.png'.format(idx)
+            Image.new('RGB', size=(10 + idx, 10)).save(
+                osp.join(self.db_data.get_upload_dirname(), name))
+            files.append(name)
+        save_media_info(self.db_data, 'image', files)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def _make_storage(self, max_size=1024 * 1024, prefetch_count=0,
+            keep_time=0, rescan_interval=60):
+        return ChunkStorage(self._tmp_dir.name, max_size, prefetch_count,
+            keep_time=keep_time, rescan_interval=rescan_interval)
+
+    def test_builds_chunks_on_request(self):
+        frame_provider = FrameProvider(self.db_data,
+            cache=ChunkCache(max_size=0), storage=self._make_storage())
+
+        self.assertFalse(osp.exists(self.db_data.get_compressed_chunk_path(2)))
+        chunk_path = frame_provider.get_chunk(2,
+            FrameProvider.Quality.COMPRESSED)
+        self.assertEqual(zipfile.ZipFile(chunk_path).namelist(),
+            ['000000.jpeg'])
+
+        buf, _ = frame_provider.get_frame(3)
+        self.assertEqual(Image.open(buf).width, 13)
+        self.assertTrue(osp.isfile(self.db_data.get_original_chunk_path(1)))
+        self.assertFalse(osp.exists(self.db_data.get_original_chunk_path(0)))
+
+    def test_builds_next_chunks_in_background(self):
+        storage = self._make_storage(prefetch_count=2)
+
+        storage.get_chunk(self.db_data, 0, original=False)
+        storage._executor.shutdown(wait=True)
+
+        for chunk_number in range(3):
+            self.assertTrue(osp.isfile(
+                self.db_data.get_compressed_chunk_path(chunk_number)))
+
+    def test_removes_least_recently_used_chunks(self):
+        storage = self._make_storage()
+        storage.get_chunk(self.db_data, 0, original=False)
+        chunk_size = osp.getsize(self.db_data.get_compressed_chunk_path(0))
+        storage = self._make_storage(max_size=2 * chunk_size)
+
+        storage.get_chunk(self.db_data, 1, original=False)
+        storage.get_chunk(self.db_data, 0, original=False)
+        storage.get_chunk(self.db_data, 2, original=False)
+
+        self.assertTrue(osp.isfile(self.db_data.get_compressed_chunk_path(0)))
+        self.assertFalse(osp.exists(self.db_data.get_compressed_chunk_path(1)))
+        self.assertTrue(osp.isfile(self.db_data.get_compressed_chunk_path(2)))
+
+    def test_keeps_recently_used_chunks(self):
+        storage = self._make_storage()
+        storage.get_chunk(self.db_data, 0, original=False)
+        chunk_size = osp.getsize(self.db_data.get_compressed_chunk_path(0))
+        storage = self._make_storage(max_size=chunk_size, keep_time=60)
+
+        storage.get_chunk(self.db_data, 0, original=False)
+        storage.get_chunk(self.db_data, 1, original=False)
+
+        self.assertTrue(osp.isfile(self.db_data.get_compressed_chunk_path(0)))
+        self.assertTrue(osp.isfile(self.db_data.get_compressed_chunk_path(1)))
+
+    def test_lists_chunks_once(self):
+        storage = self._make_storage()
+
+        with mock.patch.object(storage, '_list_chunks',
+                wraps=storage._list_chunks) as list_chunks:
+            for chunk_number in range(3):
+                storage.get_chunk(self.db_data, chunk_number, original=False)
+
+        self.assertEqual(list_chunks.call_count, 1)
+
+    def test_counts_chunks_of_other_processes(self):
+        storage = self._make_storage()
+        for chunk_number in range(3):
+            storage.get_chunk(self.db_data, chunk_number, original=False)
+        chunk_paths = [self.db_data.get_compressed_chunk_path(chunk_number)
+            for chunk_number in range(3)]
+        max_size = sum(osp.getsize(path) for path in chunk_paths) - 1
+        for path in chunk_paths:
+            os.remove(path)
+        storage = self._make_storage(max_size=max_size, rescan_interval=0)
+        other_storage = self._make_storage(max_size=max_size)
+
+        storage.get_chunk(self.db_data, 0, original=False)
+        other_storage.get_chunk(self.db_data, 1, original=False)
+        storage.get_chunk(self.db_data, 2, original=False)
+
+        self.assertFalse(osp.exists(chunk_paths[0]))
+        self.assertTrue(osp.isfile(chunk_paths[1]))
+        self.assertTrue(osp.isfile(chunk_paths[2]))
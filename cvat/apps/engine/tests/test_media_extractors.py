@@ -0,0 +1,163 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os.path as osp
+import tarfile
+import tempfile
+import zipfile
+from io import BytesIO
+from unittest import TestCase, mock
+
+import pdf2image
+from PIL import Image
+
+from cvat.apps.engine.media_extractors import (ArchiveReader, PdfReader,
+    ZipCompressedChunkWriter, ZipReader)
+
+
+def generate_tar_archive(path, count):
+    with tarfile.open(path, 'w:gz') as archive:
+        for idx in reversed(range(count)):
+            buf = BytesIO()
+            Image.new('RGB', size=(10 + idx, 10)).save(buf, 'png')
+            info = tarfile.TarInfo('images/{}.png'.format(idx))
+            info.size = buf.tell()
+            buf.seek(0)
+            archive.addfile(info, buf)
+
+        info = tarfile.TarInfo('README.txt')
+        info.size = 1
+        archive.addfile(info, BytesIO(b'a'))
+
+class ArchiveReaderTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.archive_path = osp.join(self._tmp_dir.name, 'images.tar.gz')
+        generate_tar_archive(self.archive_path, count=5)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_can_read_tar_archive_without_extraction(self):
+        reader = ArchiveReader([self.archive_path], step=2)
+
+        frames = list(reader)
+
+        self.assertIsNone(reader._tmp_dir)
+        self.assertEqual([Image.open(image).width for image, _, _ in frames],
+            [10, 12, 14])
+        self.assertEqual([(path, i) for _, path, i in frames], [
+            (osp.join(self._tmp_dir.name, 'images', '{}.png'.format(i)), i)
+            for i in [0, 2, 4]
+        ])
+        self.assertEqual(reader.get_image_size(), (10, 10))
+
+    def test_can_read_tar_archive_range(self):
+        reader = ArchiveReader([self.archive_path], start=1, stop=2)
+
+        frames = list(reader)
+
+        self.assertEqual([(Image.open(image).width, i)
+            for image, _, i in frames], [(11, 1), (12, 2)])
+        self.assertEqual(Image.open(reader.get_image(3)).width, 13)
+
+    def test_can_write_chunks_from_tar_archive(self):
+        reader = ArchiveReader([self.archive_path])
+        chunk_path = osp.join(self._tmp_dir.name, '0.zip')
+
+        sizes = ZipCompressedChunkWriter(50).save_as_chunk(list(reader),
+            chunk_path)
+
+        self.assertEqual(sizes, [(10 + i, 10) for i in range(5)])
+
+class ZipReaderTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.archive_path = osp.join(self._tmp_dir.name, 'images.zip')
+        with zipfile.ZipFile(self.archive_path, 'w') as archive:
+            for idx in range(3):
+                buf = BytesIO()
+                Image.new('RGB', size=(10 + idx, 20)).save(buf, 'png')
+                archive.writestr('{}.png'.format(idx), buf.getvalue())
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_can_get_image_sizes_without_extraction(self):
+        reader = ZipReader([self.archive_path], step=2)
+
+        with mock.patch.object(reader._zip_source, 'read') as read:
+            sizes = list(reader.get_image_sizes())
+
+        read.assert_not_called()
+        self.assertEqual(sizes, [
+            (osp.join(self._tmp_dir.name, '0.png'), 0, (10, 20)),
+            (osp.join(self._tmp_dir.name, '2.png'), 2, (12, 20)),
+        ])
+
+class PdfReaderTest(TestCase):
+    def setUp(self):
+        self.pdf_path = osp.join('data', 'doc.pdf')
+        self.rendered = []
+
+    def _convert_from_path(self, pdf_path, first_page, last_page):
+        self.assertEqual(pdf_path, self.pdf_path)
+        self.rendered.append((first_page, last_page))
+        return [Image.new('RGB', size=(10 + page, 10))
+            for page in range(first_page, last_page + 1)]
+
+    def _mock_pdf2image(self, page_count):
+        # poppler is not required, the pdf2image functions are replaced
+        patches = [
+            mock.patch('pdf2image.pdfinfo_from_path',
+                return_value={ 'Pages': page_count }),
+            mock.patch('pdf2image.convert_from_path',
+                side_effect=self._convert_from_path),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_can_count_pages(self):
+        self._mock_pdf2image(page_count=25)
+
+        reader = PdfReader([self.pdf_path])
+
+        self.assertEqual(reader.get_progress(24), 1)
+        self.assertEqual(reader.get_path(0),
+            osp.join('data', 'doc000000000.jpeg'))
+        self.assertEqual(reader.get_path(24),
+            osp.join('data', 'doc000000024.jpeg'))
+        self.assertEqual(self.rendered, [])
+
+    def test_can_render_pages_by_batches(self):
+        self._mock_pdf2image(page_count=25)
+
+        frames = list(PdfReader([self.pdf_path], start=2))
+
+        self.assertEqual(self.rendered, [(3, 12), (13, 22), (23, 25)])
+        self.assertEqual([(Image.open(image).width, i)
+            for image, _, i in frames], [(13 + i, 2 + i) for i in range(23)])
+
+    def test_can_render_pages_with_step(self):
+        self._mock_pdf2image(page_count=5)
+
+        frames = list(PdfReader([self.pdf_path], step=2))
+
+        self.assertEqual(self.rendered, [(1, 1), (3, 3), (5, 5)])
+        self.assertEqual([i for _, _, i in frames], [0, 2, 4])
+
+    def test_can_count_pages_with_old_pdf2image(self):
+        # pdf2image==1.6.0 has no pdfinfo_from_path()
+        with mock.patch.dict(pdf2image.__dict__), \
+                mock.patch('pdf2image.pdf2image._page_count', create=True,
+                    return_value=3) as page_count:
+            del pdf2image.pdfinfo_from_path
+
+            reader = PdfReader([self.pdf_path])
+
+        page_count.assert_called_once_with(self.pdf_path)
+        self.assertEqual(reader.get_path(2),
+            osp.join('data', 'doc000000002.jpeg'))
+        self.assertEqual(reader.get_progress(2), 1)
@@ -4,6 +4,7 @@
 
 import os
 import shutil
+import json
 from PIL import Image
 from io import BytesIO
 from enum import Enum
@@ -1990,6 +1991,9 @@ class JobAnnotationAPITestCase(APITestCase):
     def _get_api_v1_jobs_id_data(self, jid, user):
         with ForceLogin(user, self.client):
             response = self.client.get("/api/v1/jobs/{}/annotations".format(jid))
+            if response.streaming:
+                response.data = json.loads(
+                    b"".join(response.streaming_content).decode())
 
         return response
 
@@ -2435,6 +2439,9 @@ class TaskAnnotationAPITestCase(JobAnnotationAPITestCase):
     def _get_api_v1_tasks_id_annotations(self, pk, user):
         with ForceLogin(user, self.client):
             response = self.client.get("/api/v1/tasks/{}/annotations".format(pk))
+            if response.streaming:
+                response.data = json.loads(
+                    b"".join(response.streaming_content).decode())
 
         return response
 
@@ -0,0 +1,47 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os.path as osp
+import tempfile
+from io import BytesIO
+from unittest import TestCase
+
+from PIL import Image
+
+from cvat.apps.engine.media_extractors import (ZipChunkWriter,
+    ZipCompressedChunkWriter, ZipReader, save_chunk_pair)
+from cvat.apps.engine.task import _save_chunks
+
+
+class SaveChunksTest(TestCase):
+    def _generate_chunks(self, data_dir, chunk_count, chunk_size):
+        for chunk_idx in range(chunk_count):
+            chunk_data = []
+            for idx in range(chunk_idx * chunk_size, (chunk_idx + 1) * chunk_size):
+                buf = BytesIO()
+                Image.new('RGB', size=(10 + idx, 20)).save(buf, 'png')
+                chunk_data.append((buf, 'frame_{}.png'.format(idx), idx))
+            yield (ZipChunkWriter(100), ZipCompressedChunkWriter(50), chunk_data,
+                osp.join(data_dir, 'original_{}.zip'.format(chunk_idx)),
+                osp.join(data_dir, 'compressed_{}.zip'.format(chunk_idx)))
+
+    def _test_can_save_chunks(self, workers):
+        with tempfile.TemporaryDirectory() as data_dir:
+            chunks = self._generate_chunks(data_dir, chunk_count=7, chunk_size=3)
+
+            results = list(_save_chunks(chunks, save_chunk_pair, workers))
+
+            self.assertEqual(len(results), 7)
+            for chunk_idx, (chunk_args, img_sizes) in enumerate(results):
+                frames = [frame for _, _, frame in chunk_args[2]]
+                self.assertEqual(frames, list(range(3 * chunk_idx, 3 * chunk_idx + 3)))
+                self.assertEqual(img_sizes, [(10 + f, 20) for f in frames])
+                self.assertEqual(len(list(ZipReader([chunk_args[3]]))), 3)
+                self.assertEqual(len(list(ZipReader([chunk_args[4]]))), 3)
+
+    def test_can_save_chunks_serially(self):
+        self._test_can_save_chunks(workers=1)
+
+    def test_can_save_chunks_in_parallel(self):
+        self._test_can_save_chunks(workers=3)
@@ -0,0 +1,49 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import os.path as osp
+import tempfile
+import zipfile
+from io import BytesIO
+from unittest import TestCase
+
+from cvat.apps.engine.utils import stream_zip_files
+
+
+class StreamZipFilesTest(TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.files = {
+            'a.json': b'{"a": 1}' * 100,
+            'images/1.jpg': os.urandom(100),
+            '2.PNG': os.urandom(100),
+        }
+        self.paths = []
+        for idx, (name, data) in enumerate(self.files.items()):
+            path = osp.join(self._tmp_dir.name, '{}{}'.format(idx,
+                osp.splitext(name)[1]))
+            with open(path, 'wb') as f:
+                f.write(data)
+            self.paths.append((path, name))
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_can_stream_archive(self):
+        parts = list(stream_zip_files(self.paths, block_size=10))
+
+        self.assertLess(1, len(parts))
+        with zipfile.ZipFile(BytesIO(b''.join(parts))) as archive:
+            self.assertEqual(archive.namelist(), list(self.files))
+            self.assertEqual(
+                { name: archive.read(name) for name in archive.namelist() },
+                self.files)
+            compression = { i.filename: i.compress_type
+                for i in archive.infolist() }
+        self.assertEqual(compression, {
+            'a.json': zipfile.ZIP_DEFLATED,
+            'images/1.jpg': zipfile.ZIP_STORED,
+            '2.PNG': zipfile.ZIP_STORED,
+        })
@@ -1,8 +1,10 @@
 import ast
 from collections import namedtuple
 import importlib
+import os.path as osp
 import sys
 import traceback
+import zipfile
 
 Import = namedtuple("Import", ["module", "name", "alias"])
 
@@ -58,3 +60,54 @@ def execute_python_code(source_code, global_vars=None, local_vars=None):
         _, _, tb = sys.exc_info()
         line_number = traceback.extract_tb(tb)[-1][1]
         raise InterpreterError("{} at line {}: {}".format(error_class, line_number, details))
+
+# these files are compressed already, deflating them only wastes time
+_STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.jp2', '.mp4', '.avi', '.mkv',
+    '.zip', '.gz', '.bz2', '.xz', '.7z', '.tfrecord', '.npz',
+}
+
+def get_zip_compression(name):
+    if osp.splitext(name)[1].lower() in _STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+class _ZipOutputBuffer:
+    # An unseekable output, zipfile writes the entry sizes after the data
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+def stream_zip_files(files, compression=get_zip_compression,
+        block_size=1024 * 1024):
+    """
+    Yields a zip archive of the (path, name) files by parts, while it is
+    being built. Can be used for HTTP responses and uploads
+    to object storage.
+    """
+
+    output = _ZipOutputBuffer()
+    with zipfile.ZipFile(output, 'w') as archive:
+        for path, name in files:
+            entry = zipfile.ZipInfo.from_file(path, name)
+            entry.compress_type = compression(name)
+            with open(path, 'rb') as src, archive.open(entry, 'w') as dst:
+                for block in iter(lambda: src.read(block_size), b''):
+                    dst.write(block)
+                    data = output.pop()
+                    if data:
+                        yield data
+    data = output.pop()
+    if data:
+        yield data
@@ -16,7 +16,7 @@ import requests
 from rules.contrib.views import permission_required, objectgetter
 
 from django.views.generic import RedirectView
-from django.http import HttpResponse, HttpResponseNotFound
+from django.http import HttpResponse, HttpResponseNotFound, StreamingHttpResponse
 from django.shortcuts import render
 from django.conf import settings
 from sendfile import sendfile
@@ -455,6 +455,13 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
 					data_id = int(data_id)
 					data_quality = FrameProvider.Quality.COMPRESSED \
 						if data_quality == 'compressed' else FrameProvider.Quality.ORIGINAL
+					if frame_provider.is_chunk_manifest(data_quality):
+						# the original files are not copied to the chunk,
+						# it is built on the fly
+						return StreamingHttpResponse(
+							frame_provider.stream_chunk(data_id, data_quality),
+							content_type='application/zip')
+
 					path = os.path.realpath(frame_provider.get_chunk(data_id, data_quality))
 
 					# Follow symbol links if the chunk is a link on a real image otherwise
@@ -491,10 +498,9 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
 	def annotations(self, request, pk):
 		self.get_object() # force to call check_object_permissions
 		if request.method == 'GET':
-			data = annotation.get_task_data(pk, request.user)
-			serializer = LabeledDataSerializer(data=data)
-			if serializer.is_valid(raise_exception=True):
-				return Response(serializer.data)
+			return get_annotations_response(request,
+				get_data=lambda: annotation.get_task_data(pk, request.user),
+				stream_data=lambda: annotation.stream_task_data(pk, request.user))
 		elif request.method == 'PUT':
 			if request.query_params.get("format", ""):
 				return load_data_proxy(
@@ -826,8 +832,9 @@ class JobViewSet(viewsets.GenericViewSet,
 		self.get_object() # force to call check_object_permissions
 		slogger.glob.info("annotation request {} {}".format(request, pk))
 		if request.method == 'GET':
-			data = annotation.get_job_data(pk, request.user)
-			return Response(data)
+			return get_annotations_response(request,
+				get_data=lambda: annotation.get_job_data(pk, request.user),
+				stream_data=lambda: annotation.stream_job_data(pk, request.user))
 		elif request.method == 'PUT':
 			if request.query_params.get("format", ""):
 				return load_data_proxy(
@@ -934,6 +941,15 @@ class PluginViewSet(viewsets.ModelViewSet):
 	def request_detail(self, request, name, rq_id):
 		pass
 
+def get_annotations_response(request, get_data, stream_data):
+	# JSON is rendered by chunks and not validated, the data comes from the engine
+	if request.accepted_renderer.format == 'json':
+		return StreamingHttpResponse(stream_data(),
+			content_type='application/json')
+	serializer = LabeledDataSerializer(data=get_data())
+	if serializer.is_valid(raise_exception=True):
+		return Response(serializer.data)
+
 def rq_handler(job, exc_type, exc_value, tb):
 	job.exc_info = "".join(
 		traceback.format_exception_only(exc_type, exc_value))
@@ -0,0 +1,194 @@
+# Copyright (C) 2020 Onepanel Inc.
+#
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import os
+import os.path as osp
+import threading
+import time
+
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from django.conf import settings
+from s3transfer.subscribers import BaseSubscriber
+from s3transfer.utils import ChunksizeAdjuster
+
+from datumaro.util.image import ImageWriter
+
+
+MB = 1024 * 1024
+
+def make_transfer_config(workers=None, part_size=None):
+    if workers is None:
+        workers = settings.OBJECT_STORAGE_UPLOAD_WORKERS
+    if part_size is None:
+        part_size = settings.OBJECT_STORAGE_UPLOAD_PART_SIZE_MB * MB
+    return TransferConfig(
+        multipart_threshold=part_size,
+        multipart_chunksize=part_size,
+        max_concurrency=workers,
+        num_download_attempts=10,
+        max_io_queue=100,
+        io_chunksize=256 * 1024,
+        use_threads=True,
+    )
+
+def get_etag(path, config):
+    """
+    Computes the ETag, which S3 gives to the file uploaded with the config.
+    Multipart uploads have the MD5 of the part MD5s with the part count.
+    """
+
+    size = osp.getsize(path)
+    with open(path, 'rb') as f:
+        if size < config.multipart_threshold:
+            return hashlib.md5(f.read()).hexdigest()
+
+        part_size = ChunksizeAdjuster().adjust_chunksize(
+            config.multipart_chunksize, size)
+        part_hashes = [hashlib.md5(part).digest()
+            for part in iter(lambda: f.read(part_size), b'')]
+    return '{}-{}'.format(hashlib.md5(b''.join(part_hashes)).hexdigest(),
+        len(part_hashes))
+
+class _ProgressSubscriber(BaseSubscriber):
+    def __init__(self, uploader):
+        self._uploader = uploader
+
+    def on_progress(self, future, bytes_transferred, **kwargs):
+        self._uploader._add_progress(bytes_transferred)
+
+class DirectoryUploader:
+    """
+    Uploads the files of a directory to object storage. The files are
+    uploaded concurrently, big files are uploaded by parts. The files can
+    be submitted while the directory is being written. The files, which
+    are in the storage already with the same size and ETag, are skipped,
+    so that an interrupted upload to the same prefix can be resumed.
+    """
+
+    def __init__(self, s3_client, bucket_name, src_dir, prefix,
+            config=None, on_progress=None, progress_interval=1.0):
+        if config is None:
+            config = make_transfer_config()
+        self._config = config
+        self._s3_client = s3_client
+        self._manager = create_transfer_manager(s3_client, config)
+        self._bucket_name = bucket_name
+        self._src_dir = src_dir
+        self._prefix = prefix
+        self._existing = self._list_objects(s3_client, bucket_name, prefix)
+
+        self._lock = threading.Lock()
+        self._submitted = set()
+        self._futures = []
+        self.total_size = 0
+        self.uploaded_size = 0
+        self.skipped = 0
+
+        self._on_progress = on_progress
+        self._progress_interval = progress_interval
+        self._last_progress_time = 0
+
+    @staticmethod
+    def _list_objects(s3_client, bucket_name, prefix):
+        objects = {} # key: (size, etag)
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                objects[obj['Key']] = (obj['Size'], obj['ETag'].strip('"'))
+        return objects
+
+    def _is_uploaded(self, key, path, size):
+        existing = self._existing.get(key)
+        return existing is not None and existing[0] == size and \
+            existing[1] == get_etag(path, self._config)
+
+    def _get_key(self, path):
+        rel_path = osp.relpath(path, self._src_dir)
+        return self._prefix + '/'.join(rel_path.split(os.sep))
+
+    def _add_progress(self, size, force=False):
+        with self._lock:
+            self.uploaded_size += size
+            now = time.monotonic()
+            if not force and \
+                    now - self._last_progress_time < self._progress_interval:
+                return
+            self._last_progress_time = now
+            progress = (self.uploaded_size, self.total_size)
+        if self._on_progress is not None:
+            self._on_progress(*progress)
+
+    def upload(self, path):
+        key = self._get_key(path)
+        size = osp.getsize(path)
+        with self._lock:
+            if key in self._submitted:
+                return
+            self._submitted.add(key)
+            self.total_size += size
+
+        if self._is_uploaded(key, path, size):
+            with self._lock:
+                self.skipped += 1
+            self._add_progress(size)
+            return
+
+        with self._lock:
+            self._futures.append(self._manager.upload(path, self._bucket_name,
+                key, subscribers=[_ProgressSubscriber(self)]))
+
+    def upload_all(self):
+        for dirpath, _, filenames in os.walk(self._src_dir):
+            for name in filenames:
+                self.upload(osp.join(dirpath, name))
+
+    def wait(self):
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.result()
+        self._add_progress(0, force=True)
+
+    def remove_stale_objects(self):
+        """
+        Removes the objects under the prefix, which are left from
+        the previous uploads and are not a part of this one.
+        """
+
+        with self._lock:
+            stale_keys = sorted(set(self._existing) - self._submitted)
+        for start in range(0, len(stale_keys), 1000):
+            self._s3_client.delete_objects(Bucket=self._bucket_name, Delete={
+                'Objects': [{'Key': key}
+                    for key in stale_keys[start : start + 1000]],
+                'Quiet': True,
+            })
+
+    def close(self, cancel=False):
+        self._manager.shutdown(cancel=cancel)
+
+    def __enter__(self):
+        return self
+
+    # pylint: disable=redefined-builtin
+    def __exit__(self, type=None, value=None, traceback=None):
+        self.close(cancel=type is not None)
+    # pylint: enable=redefined-builtin
+
+class UploadingImageWriter(ImageWriter):
+    """
+    Starts uploading images as soon as they are written,
+    before the export is finished.
+    """
+
+    def __init__(self, uploader, **kwargs):
+        super().__init__(**kwargs)
+        self._uploader = uploader
+
+    def save(self, image, path):
+        if not super().save(image, path):
+            return False
+        self._uploader.upload(path)
+        return True
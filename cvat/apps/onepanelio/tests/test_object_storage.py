@@ -0,0 +1,117 @@
+# Copyright (C) 2020 Onepanel Inc.
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import os.path as osp
+import tempfile
+from unittest import TestCase
+
+import boto3
+import numpy as np
+try:
+    from moto import mock_aws
+except ImportError: # moto < 5
+    from moto import mock_s3 as mock_aws
+
+from cvat.apps.onepanelio.object_storage import (MB, DirectoryUploader,
+    UploadingImageWriter, get_etag, make_transfer_config)
+
+from datumaro.util.image import Image
+
+
+class DirectoryUploaderTest(TestCase):
+    def setUp(self):
+        self._mock = mock_aws()
+        self._mock.start()
+        self.s3_client = boto3.client('s3', region_name='us-east-1')
+        self.s3_client.create_bucket(Bucket='test')
+
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.src_dir = self._tmp_dir.name
+        self.files = {
+            'a.txt': b'a',
+            'images/b.bin': os.urandom(11 * MB),
+        }
+        for name, data in self.files.items():
+            self._write_file(name, data)
+
+        # S3 doesn't accept parts smaller than 5 MB
+        self.config = make_transfer_config(workers=4, part_size=5 * MB)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+        self._mock.stop()
+
+    def _write_file(self, name, data):
+        path = osp.join(self.src_dir, name)
+        os.makedirs(osp.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def _read_objects(self):
+        objects = {}
+        for obj in self.s3_client.list_objects_v2(Bucket='test') \
+                .get('Contents', []):
+            objects[obj['Key']] = self.s3_client.get_object(Bucket='test',
+                Key=obj['Key'])['Body'].read()
+        return objects
+
+    def _upload(self, **kwargs):
+        with DirectoryUploader(self.s3_client, 'test', self.src_dir,
+                'dump/1/', config=self.config, **kwargs) as uploader:
+            uploader.upload_all()
+            uploader.wait()
+            uploader.remove_stale_objects()
+        return uploader
+
+    def test_can_upload_directory(self):
+        progress = []
+
+        uploader = self._upload(
+            on_progress=lambda *args: progress.append(args))
+
+        self.assertEqual(self._read_objects(), { 'dump/1/' + name: data
+            for name, data in self.files.items() })
+        self.assertEqual(uploader.skipped, 0)
+        total_size = sum(len(data) for data in self.files.values())
+        self.assertEqual(progress[-1], (total_size, total_size))
+
+    def test_can_resume_interrupted_upload(self):
+        with DirectoryUploader(self.s3_client, 'test', self.src_dir,
+                'dump/1/', config=self.config) as uploader:
+            uploader.upload(osp.join(self.src_dir, 'images', 'b.bin'))
+            uploader.wait()
+        self.s3_client.put_object(Bucket='test', Key='dump/1/old.txt',
+            Body=b'old')
+        # the file is changed, but its size is the same
+        self.files['a.txt'] = b'b'
+        self._write_file('a.txt', b'b')
+        self.s3_client.put_object(Bucket='test', Key='dump/1/a.txt',
+            Body=b'a')
+
+        uploader = self._upload()
+
+        self.assertEqual(uploader.skipped, 1)
+        self.assertEqual(self._read_objects(), { 'dump/1/' + name: data
+            for name, data in self.files.items() })
+
+    def test_can_compute_etag_of_multipart_upload(self):
+        self._upload()
+        path = osp.join(self.src_dir, 'images', 'b.bin')
+
+        etag = self.s3_client.head_object(Bucket='test',
+            Key='dump/1/images/b.bin')['ETag'].strip('"')
+
+        self.assertEqual(get_etag(path, self.config), etag)
+        self.assertTrue(etag.endswith('-3'))
+
+    def test_can_upload_images_while_writing(self):
+        with DirectoryUploader(self.s3_client, 'test', self.src_dir,
+                'dump/1/', config=self.config) as uploader:
+            writer = UploadingImageWriter(uploader)
+            writer.save(Image(data=np.ones((2, 3, 3))),
+                osp.join(self.src_dir, 'c.png'))
+            uploader.wait()
+
+            self.assertIn('dump/1/c.png', self._read_objects())
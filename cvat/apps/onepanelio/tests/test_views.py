@@ -0,0 +1,123 @@
+# Copyright (C) 2020 Onepanel Inc.
+#
+# SPDX-License-Identifier: MIT
+
+import tempfile
+from datetime import timedelta
+from unittest import TestCase
+
+import boto3
+import django_rq
+from rq.job import JobStatus
+from django.utils import timezone
+from fakeredis import FakeStrictRedis
+try:
+    from moto import mock_aws
+except ImportError: # moto < 5
+    from moto import mock_s3 as mock_aws
+from rest_framework import status
+from rest_framework.test import (APIRequestFactory, APITestCase,
+    force_authenticate)
+
+from cvat.apps.engine.tests.test_rest_api import (create_db_users,
+    create_dummy_db_tasks)
+from cvat.apps.onepanelio.views import (find_training_dump,
+    get_training_workflow_rq_id, get_training_workflow_status, pop_auth_token, save_auth_token,
+    save_training_dump)
+
+
+class _TestTask:
+    def __init__(self, task_dir):
+        self.id = 1
+        self.updated_date = timezone.now()
+        self._task_dir = task_dir
+
+    def get_task_dirname(self):
+        return self._task_dir
+
+class TrainingDumpTest(TestCase):
+    def setUp(self):
+        self._mock = mock_aws()
+        self._mock.start()
+        self.s3_client = boto3.client('s3', region_name='us-east-1')
+        self.s3_client.create_bucket(Bucket='test')
+        self.s3_client.put_object(Bucket='test', Key='dump/1/a.txt', Body=b'a')
+
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.db_task = _TestTask(self._tmp_dir.name)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+        self._mock.stop()
+
+    def _save_dump(self, prefix='dump/1/'):
+        save_training_dump(self.db_task, 'cvat_coco', prefix, 'test',
+            timezone.now().timestamp())
+
+    def test_reuses_dump_of_unchanged_task(self):
+        self._save_dump()
+
+        self.assertEqual(find_training_dump(self.db_task, 'cvat_coco',
+            self.s3_client, 'test'), 'dump/1/')
+        self.assertIsNone(find_training_dump(self.db_task, 'cvat_voc',
+            self.s3_client, 'test'))
+
+    def test_doesnt_reuse_dump_of_changed_task(self):
+        self._save_dump()
+        self.db_task.updated_date = timezone.now() + timedelta(seconds=1)
+
+        self.assertIsNone(find_training_dump(self.db_task, 'cvat_coco',
+            self.s3_client, 'test'))
+
+    def test_doesnt_reuse_removed_dump(self):
+        self._save_dump(prefix='dump/2/')
+
+        self.assertIsNone(find_training_dump(self.db_task, 'cvat_coco',
+            self.s3_client, 'test'))
+
+
+class AuthTokenTest(TestCase):
+    def setUp(self):
+        self.connection = FakeStrictRedis()
+
+    def test_can_pop_saved_token(self):
+        key = save_auth_token(self.connection, 'token')
+
+        self.assertEqual(pop_auth_token(self.connection, key), 'token')
+        self.assertFalse(self.connection.exists(key))
+
+    def test_cant_pop_token_twice(self):
+        key = save_auth_token(self.connection, 'token')
+        pop_auth_token(self.connection, key)
+
+        with self.assertRaises(Exception):
+            pop_auth_token(self.connection, key)
+
+class TrainingWorkflowStatusTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_db_users(cls)
+        cls.task = create_dummy_db_tasks(cls)[0]
+
+    def _get_status(self, user):
+        # the authentication classes require Onepanel, they are skipped
+        request = APIRequestFactory().get('')
+        force_authenticate(request, user=user)
+        return get_training_workflow_status(request, pk=self.task.id)
+
+    def test_user_cant_get_status_of_other_task(self):
+        response = self._get_status(self.user)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_failure_details_are_not_shown(self):
+        queue = django_rq.get_queue('default')
+        job = queue.enqueue_call(func='json.dumps', args=(None,),
+            job_id=get_training_workflow_rq_id(self.task.id))
+        job.exc_info = 'Traceback: secret'
+        job.set_status(JobStatus.FAILED)
+        self.addCleanup(job.delete)
+
+        response = self._get_status(self.owner)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['state'], 'Failed')
+        self.assertNotIn('secret', response.data['message'])
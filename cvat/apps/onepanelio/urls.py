@@ -21,6 +21,7 @@ urlpatterns = [
     path('get_object_counts/<int:pk>', views.get_object_counts),
     path('get_base_model', views.get_base_model),
     path('execute_workflow/<int:pk>', views.execute_training_workflow),
+    path('execute_workflow/<int:pk>/status', views.get_training_workflow_status),
     path('get_available_dump_formats', views.get_available_dump_formats),
     path('get_output_path/<int:pk>', views.generate_output_path),
     path('get_annotation_path/<int:pk>', views.generate_dataset_path),
@@ -5,15 +5,21 @@
 from __future__ import print_function
 
 import os
+import json
 import yaml
 import tempfile
-from datetime import datetime
+import uuid
+from datetime import datetime, timedelta
 
 from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+import django_rq
 
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import PermissionDenied
 
 from cvat.apps.engine import annotation
 from cvat.apps.engine.models import Task
@@ -27,11 +33,17 @@ from onepanel.core.api.models import Parameter
 
 import boto3
 import botocore
-from s3transfer import TransferConfig, S3Transfer
+import rq
+
+from cvat.apps.onepanelio.object_storage import (MB, DirectoryUploader,
+    UploadingImageWriter)
 
 
 def onepanel_authorize(request):
-    auth_token = OnepanelAuth.get_auth_token(request)
+    return make_onepanel_configuration(OnepanelAuth.get_auth_token(request))
+
+
+def make_onepanel_configuration(auth_token):
     configuration = onepanel.core.api.Configuration(
         host=os.getenv('ONEPANEL_API_URL'),
         api_key={'authorization': auth_token})
@@ -178,41 +190,166 @@ def get_base_model(request):
     return Response({'keys': []})
 
 
-def upload_annotation_data(uid, db_task, parameters, object_storage_prefix, s3_client, bucket_name):
-    project = DatumaroTask.TaskProject.from_task(
-        Task.objects.get(pk=uid), db_task.owner.username)
+def get_training_dumps_path(db_task):
+    return os.path.join(DatumaroTask.get_export_cache_dir(db_task), 'training_dumps.json')
+
+
+def load_training_dumps(db_task):
+    try:
+        with open(get_training_dumps_path(db_task)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def find_training_dump(db_task, dump_format, s3_client, bucket_name):
+    """
+        Returns the object storage prefix of the last dump of the task
+        in the format, if the task hasn't been changed since then.
+    """
+    dump = load_training_dumps(db_task).get(dump_format)
+    if not dump or dump['bucket'] != bucket_name or \
+            not dump.get('complete', True):
+        return None
+
+    task_time = timezone.localtime(db_task.updated_date).timestamp()
+    if dump['time'] < task_time:
+        return None
+
+    results = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=dump['prefix'], MaxKeys=1)
+    if not results.get('KeyCount'):
+        return None
+    return dump['prefix']
+
+
+def find_unfinished_training_dump(db_task, dump_format, bucket_name):
+    """
+        Returns the object storage prefix of the last dump of the task
+        in the format, if its upload has been interrupted.
+    """
+    dump = load_training_dumps(db_task).get(dump_format)
+    if not dump or dump['bucket'] != bucket_name or \
+            dump.get('complete', True):
+        return None
+    return dump['prefix']
+
+
+def save_training_dump(db_task, dump_format, object_storage_prefix, bucket_name, dump_time,
+        complete=True):
+    dumps = load_training_dumps(db_task)
+    dumps[dump_format] = {
+        'prefix': object_storage_prefix,
+        'bucket': bucket_name,
+        'time': dump_time,
+        'complete': complete,
+    }
+    dumps_path = get_training_dumps_path(db_task)
+    os.makedirs(os.path.dirname(dumps_path), exist_ok=True)
+    with open(dumps_path + '.tmp', 'w') as f:
+        json.dump(dumps, f)
+    os.replace(dumps_path + '.tmp', dumps_path)
+
 
+def upload_annotation_data(uid, db_task, parameters, object_storage_prefix, s3_client, bucket_name):
+    """
+        Uploads the task dataset to object storage, returns the prefix of
+        the uploaded files. A previous dump is reused, if the task hasn't
+        been changed. An interrupted dump is resumed in its prefix, the files,
+        which have been uploaded already, are skipped.
+    """
     data = DatumaroTask.get_export_formats()
     formats = {d['name']: d['tag'] for d in data}
     dump_format = parameters.get('dump-format', '')
     if dump_format not in formats.values():
         dump_format = 'cvat_tfrecord'
 
-    with tempfile.TemporaryDirectory(dir=os.getenv('CVAT_DATA_DIR', '/cvat/data')) as tmp_dir:
-        project.export(dump_format, tmp_dir, save_images=True)
+    dump_prefix = find_training_dump(db_task, dump_format, s3_client, bucket_name)
+    if dump_prefix:
+        slogger.task[db_task.id].info('Annotation data in {} are reused'.format(dump_prefix))
+        return dump_prefix
+
+    # changes made during the export will require a new dump
+    dump_time = timezone.now().timestamp()
+    unfinished_prefix = find_unfinished_training_dump(db_task, dump_format, bucket_name)
+    if unfinished_prefix:
+        object_storage_prefix = unfinished_prefix
+    else:
+        save_training_dump(db_task, dump_format, object_storage_prefix, bucket_name,
+            dump_time, complete=False)
+    project = DatumaroTask.TaskProject.from_task(
+        Task.objects.get(pk=uid), db_task.owner.username)
+
+    # the progress is reported from the upload threads
+    on_progress = None
+    job = rq.get_current_job()
+    if job is not None:
+        on_progress = lambda uploaded_size, total_size: \
+            report_upload_progress(job, uploaded_size, total_size)
+
+    with tempfile.TemporaryDirectory(dir=os.getenv('CVAT_DATA_DIR', '/cvat/data')) as tmp_dir, \
+            DirectoryUploader(s3_client, bucket_name, tmp_dir, object_storage_prefix,
+                on_progress=on_progress) as uploader:
+        # images are uploaded while the export is running
+        project.export(dump_format, tmp_dir, save_images=True,
+            image_writer=UploadingImageWriter(uploader))
+        uploader.upload_all()
+        uploader.wait()
+        uploader.remove_stale_objects()
+
+        slogger.task[db_task.id].info('Annotation data are uploaded to {}: {} bytes, '
+            '{} files were uploaded before'.format(object_storage_prefix,
+                uploader.total_size, uploader.skipped))
+
+    save_training_dump(db_task, dump_format, object_storage_prefix, bucket_name, dump_time)
+    return object_storage_prefix
+
+
+def report_upload_progress(job, uploaded_size, total_size):
+    job.meta['status'] = 'Uploaded {:.1f} of {:.1f} MB'.format(
+        uploaded_size / MB, total_size / MB)
+    job.meta['progress'] = uploaded_size / total_size if total_size else 0
+    job.save_meta()
+
+
+def get_training_workflow_rq_id(pk):
+    return '/onepanelio/execute_workflow/{}'.format(pk)
+
 
-        TB = 1024 ** 4
-        transfer_config = TransferConfig(
-            multipart_threshold=1 * TB,
-            max_concurrency=10,
-            num_download_attempts=10,
-        )
-        transfer = S3Transfer(s3_client, transfer_config)
+# the token is needed only until the job is started
+AUTH_TOKEN_TTL = timedelta(hours=1)
+
+def save_auth_token(connection, auth_token):
+    """
+        Keeps the token in Redis for a short time, the job gets the key
+        instead of the token, so the token isn't stored with the job.
+    """
+    key = 'onepanelio:auth_token:{}'.format(uuid.uuid4().hex)
+    connection.set(key, auth_token, ex=AUTH_TOKEN_TTL)
+    return key
+
+
+def pop_auth_token(connection, key):
+    pipeline = connection.pipeline()
+    pipeline.get(key)
+    pipeline.delete(key)
+    auth_token, _ = pipeline.execute()
+    if auth_token is None:
+        raise Exception('The authorization token is expired')
+    return auth_token.decode()
 
-        for root, dirs, files in os.walk(tmp_dir):
-            for file in files:
-                upload_dir = root.replace(tmp_dir, '')
-                if upload_dir.startswith('/'):
-                    upload_dir = upload_dir[1:]
-                root_file = os.path.join(root, file)
-                file_object = os.path.join(object_storage_prefix, upload_dir, file)
-                transfer.upload_file(root_file, bucket_name, file_object)
+
+def get_task_for_training(request, pk):
+    db_task = get_object_or_404(Task, pk=pk)
+    if not request.user.has_perm('engine.task.access', db_task):
+        raise PermissionDenied()
+    return db_task
 
 
 @api_view(['POST'])
 def execute_training_workflow(request, pk):
     """
-        Executes workflow selected by User.
+        Executes workflow selected by User. The annotations are dumped and
+        the workflow is created in background, see get_training_workflow_status.
     """
     form_data = request.data
     slogger.glob.info('Form data without preprocessing {} {}'.format(form_data, type(form_data)))
@@ -220,13 +357,7 @@ def execute_training_workflow(request, pk):
     parameters = form_data['parameters']
     workflow_template_uid = form_data['workflow_template']
 
-    db_task = Task.objects.get(pk=pk)
-    db_labels = db_task.label_set.prefetch_related('attributespec_set').all()
-    db_labels = {db_label.id: db_label.name for db_label in db_labels}
-    num_classes = len(db_labels.values())
-
-    time = datetime.now()
-    stamp = time.strftime('%m%d%Y%H%M%S')
+    db_task = get_task_for_training(request, pk)
 
     s3_client, bucket_name = create_s3_client()
 
@@ -237,12 +368,77 @@ def execute_training_workflow(request, pk):
         if not 'Contents' in results:
             return JsonResponse({'message': 'Checkpoint path does not exist in object storage.'}, status=status.HTTP_404_NOT_FOUND)
 
+    rq_id = get_training_workflow_rq_id(db_task.id)
+    queue = django_rq.get_queue('default')
+    rq_job = queue.fetch_job(rq_id)
+    if rq_job is not None:
+        if rq_job.is_queued or rq_job.is_started:
+            return JsonResponse({'message': 'A training workflow is being executed for the task already.'},
+                status=status.HTTP_409_CONFLICT)
+        rq_job.delete()
+
+    auth_token_key = save_auth_token(queue.connection,
+        OnepanelAuth.get_auth_token(request))
+    queue.enqueue_call(func=run_training_workflow,
+        args=(db_task.id, workflow_template_uid, parameters, auth_token_key),
+        job_id=rq_id)
+    return Response(status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+def get_training_workflow_status(request, pk):
+    """
+        Returns the state of the training workflow execution. The workflow
+        metadata is returned in 'result', when it is created.
+    """
+    db_task = get_task_for_training(request, pk)
+    queue = django_rq.get_queue('default')
+    job = queue.fetch_job(get_training_workflow_rq_id(db_task.id))
+    if job is None:
+        return JsonResponse({'message': 'No training workflow is executed for the task.'},
+            status=status.HTTP_404_NOT_FOUND)
+
+    if job.is_finished:
+        response = {'state': 'Finished', 'result': job.return_value}
+    elif job.is_queued:
+        response = {'state': 'Queued'}
+    elif job.is_failed:
+        # the traceback is in the server logs, it isn't shown to users
+        response = {'state': 'Failed', 'message': job.meta.get('error',
+            'The training workflow could not be executed.')}
+    else:
+        response = {'state': 'Started', 'message': job.meta.get('status', '')}
+        if 'progress' in job.meta:
+            response['progress'] = job.meta['progress']
+    return Response(response)
+
+
+def run_training_workflow(pk, workflow_template_uid, parameters, auth_token_key):
+    job = rq.get_current_job()
+    auth_token = pop_auth_token(job.connection, auth_token_key)
+    job.meta['status'] = 'Annotation data are being uploaded..'
+    job.save_meta()
+
+    db_task = Task.objects.get(pk=pk)
+    db_labels = db_task.label_set.prefetch_related('attributespec_set').all()
+    db_labels = {db_label.id: db_label.name for db_label in db_labels}
+    num_classes = len(db_labels.values())
+
+    time = datetime.now()
+    stamp = time.strftime('%m%d%Y%H%M%S')
+
+    s3_client, bucket_name = create_s3_client()
+
     # dump annotations into object storage
     annotations_object_storage_prefix = os.getenv('CVAT_ANNOTATIONS_OBJECT_STORAGE_PREFIX') + str(
         db_task.id) + '/' + stamp + '/'
-    upload_annotation_data(int(pk), db_task, parameters, annotations_object_storage_prefix, s3_client, bucket_name)
+    annotations_object_storage_prefix = upload_annotation_data(int(pk), db_task, parameters,
+        annotations_object_storage_prefix, s3_client, bucket_name)
 
-    configuration = onepanel_authorize(request)
+    job.meta['status'] = 'Workflow is being created..'
+    job.save_meta()
+
+    configuration = make_onepanel_configuration(auth_token)
     # Enter a context with an instance of the API client
     with onepanel.core.api.ApiClient(configuration) as api_client:
         # Create an instance of the API class
@@ -266,10 +462,10 @@ def execute_training_workflow(request, pk):
                                                                      {'key': 'cvat-job-id', 'value': str(pk)}])
         try:
             api_response = api_instance.create_workflow_execution(namespace, body)
-            return Response(data=api_response.to_dict()['metadata'], status=status.HTTP_200_OK)
+            return api_response.to_dict()['metadata']
         except ApiException as e:
             slogger.glob.exception(
                 'Exception when calling WorkflowServiceApi->create_workflow_execution: {}\n'.format(e))
-            return Response(data='error occurred', status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-    return Response(status=status.HTTP_200_OK)
+            job.meta['error'] = 'The workflow could not be created: {}'.format(e.reason)
+            job.save_meta()
+            raise
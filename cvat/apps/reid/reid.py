@@ -7,7 +7,6 @@ import rq
 import cv2
 import math
 import numpy
-import itertools
 
 from openvino.inference_engine import IENetwork, IEPlugin
 from scipy.optimize import linear_sum_assignment
@@ -40,10 +39,10 @@ class ReID:
         db_job = Job.objects.select_related('segment__task').get(pk = jid)
         db_segment = db_job.segment
         db_task = db_segment.task
-        self.__frame_iter = itertools.islice(
-            FrameProvider(db_task.data).get_frames(FrameProvider.Quality.ORIGINAL),
-            db_segment.start_frame,
-            db_segment.stop_frame + 1,
+        self.__frame_iter = FrameProvider(db_task.data).get_frames(
+            FrameProvider.Quality.ORIGINAL,
+            start=db_segment.start_frame,
+            stop=db_segment.stop_frame + 1,
         )
 
         self.__stop_frame = db_segment.stop_frame
@@ -76,7 +76,8 @@ def run_tensorflow_annotation(frame_provider, labels_mapping, threshold, model_p
             config = tf.ConfigProto()
             config.gpu_options.allow_growth=True
             sess = tf.Session(graph=detection_graph, config=config)
-            frames = frame_provider.get_frames(frame_provider.Quality.ORIGINAL)
+            frames = frame_provider.get_frames(frame_provider.Quality.ORIGINAL,
+                frame_provider.Type.PIL, prefetch=True)
             for image_num, (image, _) in enumerate(frames):
 
                 job.refresh()
@@ -87,7 +88,6 @@ def run_tensorflow_annotation(frame_provider, labels_mapping, threshold, model_p
                 job.meta['progress'] = image_num * 100 / len(frame_provider)
                 job.save_meta()
 
-                image = Image.open(image)
                 width, height = image.size
                 if width > 1920 or height > 1080:
                     image = image.resize((width // 2, height // 2), Image.ANTIALIAS)
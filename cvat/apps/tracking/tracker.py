@@ -5,7 +5,6 @@ from cvat.settings.base import DATA_ROOT
 import os, fnmatch
 from cvat.apps.engine.frame_provider import FrameProvider
 from cvat.apps.engine.models import Task as TaskModel
-from PIL import Image
 import numpy as np
 
 
@@ -34,16 +33,11 @@ def make_image_list(jid, start_frame, stop_frame):
 	db_task = TaskModel.objects.get(pk=jid)
 	# Get image list
 	image_list = FrameProvider(db_task.data)
-	image_list = image_list.get_frames(image_list.Quality.ORIGINAL)
-	count = 0
-	for img in image_list:
-		if count >= start_frame and count <= stop_frame:
-			pil_image = Image.open(img[0])
-			opencvImage = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-			yield count, opencvImage
-		count +=1
-		if count > stop_frame:
-			break
+	image_list = image_list.get_frames(image_list.Quality.ORIGINAL,
+		image_list.Type.PIL, start=start_frame, stop=stop_frame + 1)
+	for count, (pil_image, _) in enumerate(image_list, start_frame):
+		opencvImage = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+		yield count, opencvImage
 
 class RectangleTracker:
 	trackerTypes = ['BOOSTING', 'MIL', 'KCF', 'CSRT', 'MEDIANFLOW', 'TLD',
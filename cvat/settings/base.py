@@ -455,6 +455,49 @@ DATA_UPLOAD_MAX_NUMBER_FIELDS = None   # this django check disabled
 LOCAL_LOAD_MAX_FILES_COUNT = 500
 LOCAL_LOAD_MAX_FILES_SIZE = 512 * 1024 * 1024  # 512 MB
 
+# Size of the per-process cache of decoded frames (0 disables the cache)
+FRAME_CACHE_MAX_SIZE_MB = int(os.getenv('CVAT_FRAME_CACHE_SIZE_MB', 512))
+
+# Number of processes used to compress chunks during task creation.
+# Each task creation job starts its own processes, so the default is
+# limited to keep the server responsive.
+CHUNK_CREATION_WORKERS = int(os.getenv('CVAT_CHUNK_CREATION_WORKERS',
+    min(os.cpu_count() or 1, 4)))
+
+# Number of threads used to convert dataset items during export
+DATASET_EXPORT_WORKERS = int(os.getenv('CVAT_DATASET_EXPORT_WORKERS',
+    os.cpu_count() or 1))
+
+# Number of concurrent requests and the multipart part size of object storage
+# uploads
+OBJECT_STORAGE_UPLOAD_WORKERS = int(os.getenv(
+    'CVAT_OBJECT_STORAGE_UPLOAD_WORKERS', 10))
+OBJECT_STORAGE_UPLOAD_PART_SIZE_MB = int(os.getenv(
+    'CVAT_OBJECT_STORAGE_UPLOAD_PART_SIZE_MB', 64))
+
+# Number of rows in a COPY statement for annotation writes on PostgreSQL
+ANNOTATION_BULK_INSERT_BATCH_SIZE = int(os.getenv(
+    'CVAT_ANNOTATION_BULK_INSERT_BATCH_SIZE', 10000))
+
+# Keep job annotations and matching results of tasks on disk to merge
+# task annotations incrementally. The cache is stored in the task
+# directories and takes about as much space as the annotations.
+TASK_ANNOTATION_CACHE = 'yes' == os.getenv('CVAT_TASK_ANNOTATION_CACHE', 'no')
+
+# Keep a list of the uploaded files as original chunks of image tasks
+# instead of copies of the files
+ORIGINAL_CHUNK_MANIFESTS = 'yes' == os.getenv('CVAT_ORIGINAL_CHUNK_MANIFESTS',
+    'yes')
+
+# Total size of the chunks, built on request for the tasks created
+# without chunks. The least recently used chunks are removed first.
+# The limit is shared by the server processes, the chunks of the other
+# processes are counted with a delay of up to a minute.
+CHUNK_CACHE_MAX_SIZE_MB = int(os.getenv('CVAT_CHUNK_CACHE_SIZE_MB', 10240))
+
+# Number of chunks built in background after the requested one
+CHUNK_PREFETCH_COUNT = int(os.getenv('CVAT_CHUNK_PREFETCH_COUNT', 2))
+
 datumaro_path_env = os.environ.get("CVAT_DATUMARO_DIR", None)
 if datumaro_path_env is None:
     DATUMARO_PATH = os.path.join(BASE_DIR, 'datumaro')
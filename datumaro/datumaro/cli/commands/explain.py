@@ -5,6 +5,7 @@
 
 import argparse
 import logging as log
+import numpy as np
 import os
 import os.path as osp
 
@@ -107,7 +108,7 @@ def explain_command(args):
 
     if args.target[0] == TargetKinds.image:
         image_path = args.target[1]
-        image = load_image(image_path)
+        image = load_image(image_path, dtype=np.float32)
         if model.preferred_input_size() is not None:
             h, w = model.preferred_input_size()
             image = cv2.resize(image, (w, h))
@@ -154,12 +155,12 @@ def explain_command(args):
             log.info("Running inference explanation for '%s'" % project_name)
 
         for item in dataset:
-            image = item.image
-            if image is None:
+            if not item.has_image or not item.image.has_data:
                 log.warn(
                     "Dataset item %s does not have image data. Skipping." % \
                     (item.id))
                 continue
+            image = item.image.data.astype(np.float32)
 
             if model.preferred_input_size() is not None:
                 h, w = model.preferred_input_size()
@@ -3,9 +3,13 @@
 #
 # SPDX-License-Identifier: MIT
 
+from datumaro.util.image import ImageWriter
+
+
 class Converter:
     def __init__(self, cmdline_args=None):
-        pass
+        # counts the copied and re-encoded images of the saved datasets
+        self.image_writer = ImageWriter()
 
     def __call__(self, extractor, save_dir):
         raise NotImplementedError()
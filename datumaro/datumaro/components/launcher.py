@@ -43,7 +43,8 @@ class InferenceWrapper(Transform):
                 if len(batch_items) == 0:
                     break
 
-            inputs = np.array([item.image.data for item in batch_items])
+            inputs = np.array([item.image.data for item in batch_items],
+                dtype=np.float32)
             inference = self._launcher.launch(inputs)
 
             for item, annotations in zip(batch_items, inference):
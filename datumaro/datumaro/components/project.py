@@ -354,13 +354,11 @@ class Dataset(Extractor):
         else:
             anno_key = ''.join(filter(lambda x: 'anno' in x, self._sources.keys()))
             images_key = ''.join(filter(lambda x: 'images' in x, self._sources.keys()))
-        
-            for item in self._sources[anno_key]:
-                for item_image in self._sources[images_key]:
-                    if item.id == item_image.id:
-                        item = item.wrap(path=None, annotations=item.annotations, image=item_image.image)
-                        yield item
-                        break
+
+            for item, item_image in self._join_images(
+                    self._sources[anno_key], self._sources[images_key]):
+                yield item.wrap(path=None, annotations=item.annotations,
+                    image=item_image.image)
 
     def __len__(self):
         if self._length is None:
@@ -417,6 +415,31 @@ class Dataset(Extractor):
         assert not self._categories
         self._categories = categories
 
+    @staticmethod
+    def _join_images(items, image_items):
+        """
+        Pairs items with the items of the same id from the image source.
+        The image source is read only once and in its own order, so each
+        image is produced at most once. Images met ahead of their items
+        are kept until requested, which is cheap when both sources
+        follow the same order. Items without an image are skipped.
+        """
+        image_items = iter(image_items)
+        pending = {}
+        for item in items:
+            item_image = pending.pop(item.id, None)
+            while item_image is None:
+                next_image = next(image_items, None)
+                if next_image is None:
+                    break
+                if next_image.id == item.id:
+                    item_image = next_image
+                else:
+                    pending[next_image.id] = next_image
+
+            if item_image is not None:
+                yield item, item_image
+
     @staticmethod
     def _lazy_image(item):
         # NOTE: avoid https://docs.python.org/3/faq/programming.html#why-do-lambdas-defined-in-a-loop-with-different-values-all-return-the-same-result
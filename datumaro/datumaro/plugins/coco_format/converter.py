@@ -18,8 +18,9 @@ from datumaro.components.extractor import (DEFAULT_SUBSET_NAME,
 )
 from datumaro.components.cli_plugin import CliPlugin
 from datumaro.util import find, cast
-from datumaro.util.image import save_image
+from datumaro.util.image import ImageWriter
 import datumaro.util.mask_tools as mask_tools
+from datumaro.util.parallel import parallel_map
 import datumaro.util.annotation_tools as anno_tools
 
 from .format import CocoTask, CocoPath
@@ -84,10 +85,21 @@ class _TaskConverter:
         raise NotImplementedError()
 
     def save_annotations(self, item):
+        self.add_annotations(self.convert_annotations(item))
+
+    def convert_annotations(self, item):
+        """
+        Returns the item annotations without adding them to the task.
+        Can be called from several threads.
+        """
         raise NotImplementedError()
 
+    def add_annotations(self, annotations):
+        self.annotations.extend(annotations)
+
     def write(self, path):
-        next_id = self._min_ann_id
+        next_id = max([self._min_ann_id] +
+            [ann['id'] for ann in self.annotations if ann['id']])
         for ann in self.annotations:
             if ann['id'] is None:
                 ann['id'] = next_id
@@ -104,11 +116,9 @@ class _TaskConverter:
     def categories(self):
         return self._data['categories']
 
-    def _get_ann_id(self, annotation):
-        ann_id = annotation.id
-        if ann_id:
-            self._min_ann_id = max(ann_id, self._min_ann_id)
-        return ann_id
+    @staticmethod
+    def _get_ann_id(annotation):
+        return annotation.id
 
 class _ImageInfoConverter(_TaskConverter):
     def is_empty(self):
@@ -117,14 +127,15 @@ class _ImageInfoConverter(_TaskConverter):
     def save_categories(self, dataset):
         pass
 
-    def save_annotations(self, item):
-        pass
+    def convert_annotations(self, item):
+        return []
 
 class _CaptionsConverter(_TaskConverter):
     def save_categories(self, dataset):
         pass
 
-    def save_annotations(self, item):
+    def convert_annotations(self, item):
+        annotations = []
         for ann_idx, ann in enumerate(item.annotations):
             if ann.type != AnnotationType.caption:
                 continue
@@ -142,7 +153,8 @@ class _CaptionsConverter(_TaskConverter):
                     log.warning("Item '%s', ann #%s: failed to convert "
                         "attribute 'score': %e" % (item.id, ann_idx, e))
 
-            self.annotations.append(elem)
+            annotations.append(elem)
+        return annotations
 
 class _InstancesConverter(_TaskConverter):
     def save_categories(self, dataset):
@@ -244,15 +256,16 @@ class _InstancesConverter(_TaskConverter):
     def find_instances(cls, annotations):
         return anno_tools.find_instances(cls.find_instance_anns(annotations))
 
-    def save_annotations(self, item):
+    def convert_annotations(self, item):
+        annotations = []
         instances = self.find_instances(item.annotations)
         if not instances:
-            return
+            return annotations
 
         if not item.has_image:
             log.warn("Item '%s': skipping writing instances "
                 "since no image info available" % item.id)
-            return
+            return annotations
         h, w = item.image.size
         instances = [self.find_instance_parts(i, w, h) for i in instances]
 
@@ -262,7 +275,8 @@ class _InstancesConverter(_TaskConverter):
         for instance in instances:
             elem = self.convert_instance(instance, item)
             if elem:
-                self.annotations.append(elem)
+                annotations.append(elem)
+        return annotations
 
     def convert_instance(self, instance, item):
         ann, polygons, mask, bbox = instance
@@ -341,21 +355,23 @@ class _KeypointsConverter(_InstancesConverter):
                     })
             self.categories.append(cat)
 
-    def save_annotations(self, item):
+    def convert_annotations(self, item):
+        annotations = []
         point_annotations = [a for a in item.annotations
             if a.type == AnnotationType.points]
         if not point_annotations:
-            return
+            return annotations
 
         # Create annotations for solitary keypoints annotations
         for points in self.find_solitary_points(item.annotations):
             instance = [points, [], None, points.get_bbox()]
             elem = super().convert_instance(instance, item)
             elem.update(self.convert_points_object(points))
-            self.annotations.append(elem)
+            annotations.append(elem)
 
         # Create annotations for complete instance + keypoints annotations
-        super().save_annotations(item)
+        annotations.extend(super().convert_annotations(item))
+        return annotations
 
     @classmethod
     def find_solitary_points(cls, annotations):
@@ -412,7 +428,8 @@ class _LabelsConverter(_TaskConverter):
                 'supercategory': cast(cat.parent, str, ''),
             })
 
-    def save_annotations(self, item):
+    def convert_annotations(self, item):
+        annotations = []
         for ann in item.annotations:
             if ann.type != AnnotationType.label:
                 continue
@@ -429,7 +446,8 @@ class _LabelsConverter(_TaskConverter):
                     log.warning("Item '%s': failed to convert attribute "
                         "'score': %e" % (item.id, e))
 
-            self.annotations.append(elem)
+            annotations.append(elem)
+        return annotations
 
 class _Converter:
     _TASK_CONVERTER = {
@@ -442,7 +460,7 @@ class _Converter:
 
     def __init__(self, extractor, save_dir,
             tasks=None, save_images=False, segmentation_mode=None,
-            crop_covered=False):
+            crop_covered=False, workers=1, image_writer=None):
         assert tasks is None or isinstance(tasks, (CocoTask, list, str))
         if tasks is None:
             tasks = list(self._TASK_CONVERTER)
@@ -462,6 +480,9 @@ class _Converter:
         self._save_dir = save_dir
 
         self._save_images = save_images
+        if image_writer is None:
+            image_writer = ImageWriter()
+        self._image_writer = image_writer
 
         assert segmentation_mode is None or \
             segmentation_mode in SegmentationMode or \
@@ -473,6 +494,7 @@ class _Converter:
         self._segmentation_mode = segmentation_mode
 
         self._crop_covered = crop_covered
+        self._workers = workers
 
         self._image_ids = {}
 
@@ -501,11 +523,6 @@ class _Converter:
         return image_id
 
     def _save_image(self, item):
-        image = item.image.data
-        if image is None:
-            log.warning("Item '%s' has no image" % item.id)
-            return ''
-
         filename = item.image.filename
         if filename:
             filename = osp.splitext(filename)[0]
@@ -513,7 +530,9 @@ class _Converter:
             filename = item.id
         filename += CocoPath.IMAGE_EXT
         path = osp.join(self._images_dir, filename)
-        save_image(path, image)
+        if not self._image_writer.save(item.image, path):
+            log.warning("Item '%s' has no image" % item.id)
+            return ''
         return filename
 
     def convert(self):
@@ -533,7 +552,8 @@ class _Converter:
             task_converters = self._make_task_converters()
             for task_conv in task_converters.values():
                 task_conv.save_categories(subset)
-            for item in subset:
+
+            def convert_item(item):
                 filename = ''
                 if item.has_image:
                     filename = item.image.path
@@ -542,9 +562,21 @@ class _Converter:
                         filename = self._save_image(item)
                     else:
                         log.debug("Item '%s' has no image info" % item.id)
-                for task_conv in task_converters.values():
+                return item, filename, [task_conv.convert_annotations(item)
+                    for task_conv in task_converters.values()]
+
+            def prepare_items():
+                for item in subset:
+                    # image ids depend on the order of items
+                    self._get_image_id(item)
+                    yield item
+
+            for item, filename, annotations in parallel_map(convert_item,
+                    prepare_items(), workers=self._workers):
+                for task_conv, task_annotations in zip(
+                        task_converters.values(), annotations):
                     task_conv.save_image_info(item, filename)
-                    task_conv.save_annotations(item)
+                    task_conv.add_annotations(task_annotations)
 
             for task, task_conv in task_converters.items():
                 task_conv.write(osp.join(self._ann_dir,
@@ -580,11 +612,13 @@ class CocoConverter(Converter, CliPlugin):
             default=None,
             help="COCO task filter, comma-separated list of {%s} "
                 "(default: all)" % ', '.join([t.name for t in CocoTask]))
+        parser.add_argument('--workers', type=int, default=1,
+            help="Number of threads to convert items (default: %(default)s)")
         return parser
 
     def __init__(self,
             tasks=None, save_images=False, segmentation_mode=None,
-            crop_covered=False):
+            crop_covered=False, workers=1):
         super().__init__()
 
         self._options = {
@@ -592,10 +626,12 @@ class CocoConverter(Converter, CliPlugin):
             'save_images': save_images,
             'segmentation_mode': segmentation_mode,
             'crop_covered': crop_covered,
+            'workers': workers,
         }
 
     def __call__(self, extractor, save_dir):
-        converter = _Converter(extractor, save_dir, **self._options)
+        converter = _Converter(extractor, save_dir,
+            image_writer=self.image_writer, **self._options)
         converter.convert()
 
 class CocoInstancesConverter(CocoConverter):
@@ -17,7 +17,8 @@ from datumaro.components.extractor import (
     LabelCategories, MaskCategories, PointsCategories
 )
 from datumaro.util import cast
-from datumaro.util.image import save_image
+from datumaro.util.image import ImageWriter
+from datumaro.util.parallel import parallel_map
 import pycocotools.mask as mask_utils
 from datumaro.components.cli_plugin import CliPlugin
 
@@ -44,6 +45,14 @@ class _SubsetWriter:
         return self._data['items']
 
     def write_item(self, item):
+        self.items.append(self.convert_item(item))
+
+    def convert_item(self, item):
+        """
+        Returns the item description and saves the item image.
+        Can be called from several threads.
+        """
+
         annotations = []
         item_desc = {
             'id': item.id,
@@ -60,7 +69,6 @@ class _SubsetWriter:
                 'size': item.image.size,
                 'path': path,
             }
-        self.items.append(item_desc)
 
         for ann in item.annotations:
             if isinstance(ann, Label):
@@ -80,6 +88,7 @@ class _SubsetWriter:
             else:
                 raise NotImplementedError()
             annotations.append(converted_ann)
+        return item_desc
 
     def write_categories(self, categories):
         for ann_type, desc in categories.items():
@@ -217,10 +226,15 @@ class _SubsetWriter:
         return converted
 
 class _Converter:
-    def __init__(self, extractor, save_dir, save_images=False):
+    def __init__(self, extractor, save_dir, save_images=False, workers=1,
+            image_writer=None):
         self._extractor = extractor
         self._save_dir = save_dir
         self._save_images = save_images
+        self._workers = workers
+        if image_writer is None:
+            image_writer = ImageWriter()
+        self._image_writer = image_writer
 
     def convert(self):
         os.makedirs(self._save_dir, exist_ok=True)
@@ -242,22 +256,18 @@ class _Converter:
         for subset, writer in subsets.items():
             writer.write_categories(self._extractor.categories())
 
-        for item in self._extractor:
-            subset = item.subset
-            if not subset:
-                subset = DEFAULT_SUBSET_NAME
-            writer = subsets[subset]
+        def convert_item(item):
+            writer = subsets[item.subset or DEFAULT_SUBSET_NAME]
+            return writer, writer.convert_item(item)
 
-            writer.write_item(item)
+        for writer, item_desc in parallel_map(convert_item, self._extractor,
+                workers=self._workers):
+            writer.items.append(item_desc)
 
         for subset, writer in subsets.items():
             writer.write(annotations_dir)
 
     def _save_image(self, item):
-        image = item.image.data
-        if image is None:
-            return ''
-
         filename = item.image.filename
         if filename:
             filename = osp.splitext(filename)[0]
@@ -265,7 +275,8 @@ class _Converter:
             filename = item.id
         filename += DatumaroPath.IMAGE_EXT
         image_path = osp.join(self._images_dir, filename)
-        save_image(image_path, image)
+        if not self._image_writer.save(item.image, image_path):
+            return ''
         return filename
 
 class DatumaroConverter(Converter, CliPlugin):
@@ -274,15 +285,19 @@ class DatumaroConverter(Converter, CliPlugin):
         parser = super().build_cmdline_parser(**kwargs)
         parser.add_argument('--save-images', action='store_true',
             help="Save images (default: %(default)s)")
+        parser.add_argument('--workers', type=int, default=1,
+            help="Number of threads to convert items (default: %(default)s)")
         return parser
 
-    def __init__(self, save_images=False):
+    def __init__(self, save_images=False, workers=1):
         super().__init__()
 
         self._options = {
             'save_images': save_images,
+            'workers': workers,
         }
 
     def __call__(self, extractor, save_dir):
-        converter = _Converter(extractor, save_dir, **self._options)
+        converter = _Converter(extractor, save_dir,
+            image_writer=self.image_writer, **self._options)
         converter.convert()
@@ -178,7 +178,8 @@ class TfDetectionApiConverter(Converter, CliPlugin):
         if self._save_images:
             if item.has_image and item.image.has_data:
                 fmt = DetectionApiPath.IMAGE_FORMAT
-                buffer = encode_image(item.image.data, DetectionApiPath.IMAGE_EXT)
+                buffer = self.image_writer.encode(item.image,
+                    DetectionApiPath.IMAGE_EXT)
 
                 features.update({
                     'image/encoded': bytes_feature(buffer),
@@ -16,7 +16,8 @@ from datumaro.components.converter import Converter
 from datumaro.components.extractor import (DEFAULT_SUBSET_NAME, AnnotationType,
     LabelCategories, CompiledMask,
 )
-from datumaro.util.image import save_image
+from datumaro.util.image import ImageWriter, save_image
+from datumaro.util.parallel import parallel_map
 from datumaro.util.mask_tools import paint_mask, remap_mask
 
 from .format import (VocTask, VocPath,
@@ -52,7 +53,8 @@ LabelmapType = Enum('LabelmapType', ['voc', 'source', 'guess'])
 
 class _Converter:
     def __init__(self, extractor, save_dir,
-            tasks=None, apply_colormap=True, save_images=False, label_map=None):
+            tasks=None, apply_colormap=True, save_images=False, label_map=None,
+            workers=1, image_writer=None):
         assert tasks is None or isinstance(tasks, (VocTask, list, set))
         if tasks is None:
             tasks = set(VocTask)
@@ -66,6 +68,10 @@ class _Converter:
         self._save_dir = save_dir
         self._apply_colormap = apply_colormap
         self._save_images = save_images
+        self._workers = workers
+        if image_writer is None:
+            image_writer = ImageWriter()
+        self._image_writer = image_writer
 
         self._load_categories(label_map)
 
@@ -131,190 +137,212 @@ class _Converter:
             layout_list = OrderedDict()
             segm_list = OrderedDict()
 
-            for item in subset:
-                log.debug("Converting item '%s'", item.id)
-
-                image_filename = ''
-                if item.has_image:
-                    image_filename = item.image.filename
-                if self._save_images:
-                    if item.has_image and item.image.has_data:
-                        if image_filename:
-                            image_filename = osp.splitext(image_filename)[0]
-                        else:
-                            image_filename = item.id
-                        image_filename += VocPath.IMAGE_EXT
-                        save_image(osp.join(self._images_dir, image_filename),
-                            item.image.data)
-                    else:
-                        log.debug("Item '%s' has no image" % item.id)
-
-                labels = []
-                bboxes = []
-                masks = []
-                for a in item.annotations:
-                    if a.type == AnnotationType.label:
-                        labels.append(a)
-                    elif a.type == AnnotationType.bbox:
-                        bboxes.append(a)
-                    elif a.type == AnnotationType.mask:
-                        masks.append(a)
-
-                if len(bboxes) != 0:
-                    root_elem = ET.Element('annotation')
-                    if '_' in item.id:
-                        folder = item.id[ : item.id.find('_')]
-                    else:
-                        folder = ''
-                    ET.SubElement(root_elem, 'folder').text = folder
-                    ET.SubElement(root_elem, 'filename').text = image_filename
-
-                    source_elem = ET.SubElement(root_elem, 'source')
-                    ET.SubElement(source_elem, 'database').text = 'Unknown'
-                    ET.SubElement(source_elem, 'annotation').text = 'Unknown'
-                    ET.SubElement(source_elem, 'image').text = 'Unknown'
-
-                    if item.has_image:
-                        h, w = item.image.size
-                        if item.image.has_data:
-                            image_shape = item.image.data.shape
-                            c = 1 if len(image_shape) == 2 else image_shape[2]
-                        else:
-                            c = 3
-                        size_elem = ET.SubElement(root_elem, 'size')
-                        ET.SubElement(size_elem, 'width').text = str(w)
-                        ET.SubElement(size_elem, 'height').text = str(h)
-                        ET.SubElement(size_elem, 'depth').text = str(c)
-
-                    item_segmented = 0 < len(masks)
-                    ET.SubElement(root_elem, 'segmented').text = \
-                        str(int(item_segmented))
-
-                    objects_with_parts = []
-                    objects_with_actions = defaultdict(dict)
-
-                    main_bboxes = []
-                    layout_bboxes = []
-                    for bbox in bboxes:
-                        label = self.get_label(bbox.label)
-                        if self._is_part(label):
-                            layout_bboxes.append(bbox)
-                        elif self._is_label(label):
-                            main_bboxes.append(bbox)
-
-                    for new_obj_id, obj in enumerate(main_bboxes):
-                        attr = obj.attributes
-
-                        obj_elem = ET.SubElement(root_elem, 'object')
-
-                        obj_label =  self.get_label(obj.label)
-                        ET.SubElement(obj_elem, 'name').text = obj_label
-
-                        if 'pose' in attr:
-                            pose = _convert_attr('pose', attr,
-                                lambda v: VocPose[v], VocPose.Unspecified)
-                            ET.SubElement(obj_elem, 'pose').text = pose.name
-
-                        if 'truncated' in attr:
-                            truncated = _convert_attr('truncated', attr, int, 0)
-                            ET.SubElement(obj_elem, 'truncated').text = \
-                                '%d' % truncated
-
-                        if 'difficult' in attr:
-                            difficult = _convert_attr('difficult', attr, int, 0)
-                            ET.SubElement(obj_elem, 'difficult').text = \
-                                '%d' % difficult
-
-                        if 'occluded' in attr:
-                            occluded = _convert_attr('occluded', attr, int, 0)
-                            ET.SubElement(obj_elem, 'occluded').text = \
-                                '%d' % occluded
-
-                        bbox = obj.get_bbox()
-                        if bbox is not None:
-                            _write_xml_bbox(bbox, obj_elem)
-
-                        for part_bbox in filter(
-                                lambda x: obj.group and obj.group == x.group,
-                                layout_bboxes):
-                            part_elem = ET.SubElement(obj_elem, 'part')
-                            ET.SubElement(part_elem, 'name').text = \
-                                self.get_label(part_bbox.label)
-                            _write_xml_bbox(part_bbox.get_bbox(), part_elem)
-
-                            objects_with_parts.append(new_obj_id)
-
-                        label_actions = self._get_actions(obj_label)
-                        actions_elem = ET.Element('actions')
-                        for action in label_actions:
-                            present = 0
-                            if action in attr:
-                                present = _convert_attr(action, attr,
-                                    lambda v: int(v == True), 0)
-                                ET.SubElement(actions_elem, action).text = \
-                                    '%d' % present
-
-                            objects_with_actions[new_obj_id][action] = present
-                        if len(actions_elem) != 0:
-                            obj_elem.append(actions_elem)
-
-                    if self._tasks & {None,
-                            VocTask.detection,
-                            VocTask.person_layout,
-                            VocTask.action_classification}:
-                        with open(osp.join(self._ann_dir, item.id + '.xml'), 'w') as f:
-                            f.write(ET.tostring(root_elem,
-                                encoding='unicode', pretty_print=True))
-
-                    clsdet_list[item.id] = True
-                    layout_list[item.id] = objects_with_parts
-                    action_list[item.id] = objects_with_actions
-
-                for label_ann in labels:
-                    label = self.get_label(label_ann.label)
-                    if not self._is_label(label):
-                        continue
-                    class_list = class_lists.get(item.id, set())
-                    class_list.add(label_ann.label)
-                    class_lists[item.id] = class_list
-
-                    clsdet_list[item.id] = True
-
-                if masks:
-                    compiled_mask = CompiledMask.from_instance_masks(masks,
-                        instance_labels=[self._label_id_mapping(m.label)
-                            for m in masks])
-
-                    self.save_segm(
-                        osp.join(self._segm_dir, item.id + VocPath.SEGM_EXT),
-                        compiled_mask.class_mask)
-                    self.save_segm(
-                        osp.join(self._inst_dir, item.id + VocPath.SEGM_EXT),
-                        compiled_mask.instance_mask,
-                        colormap=VocInstColormap)
-
-                    segm_list[item.id] = True
-
-                if len(item.annotations) == 0:
-                    clsdet_list[item.id] = None
-                    layout_list[item.id] = None
-                    action_list[item.id] = None
-                    segm_list[item.id] = None
-
-                if self._tasks & {None,
-                        VocTask.classification,
-                        VocTask.detection,
-                        VocTask.action_classification,
-                        VocTask.person_layout}:
-                    self.save_clsdet_lists(subset_name, clsdet_list)
-                    if self._tasks & {None, VocTask.classification}:
-                        self.save_class_lists(subset_name, class_lists)
-                if self._tasks & {None, VocTask.action_classification}:
-                    self.save_action_lists(subset_name, action_list)
-                if self._tasks & {None, VocTask.person_layout}:
-                    self.save_layout_lists(subset_name, layout_list)
-                if self._tasks & {None, VocTask.segmentation}:
-                    self.save_segm_lists(subset_name, segm_list)
+            for item_lists in parallel_map(self._save_item, subset,
+                    workers=self._workers):
+                for item_id, item_labels in item_lists[0].items():
+                    class_lists.setdefault(item_id, set()).update(item_labels)
+                clsdet_list.update(item_lists[1])
+                action_list.update(item_lists[2])
+                layout_list.update(item_lists[3])
+                segm_list.update(item_lists[4])
+
+            if self._tasks & {None,
+                    VocTask.classification,
+                    VocTask.detection,
+                    VocTask.action_classification,
+                    VocTask.person_layout}:
+                self.save_clsdet_lists(subset_name, clsdet_list)
+                if self._tasks & {None, VocTask.classification}:
+                    self.save_class_lists(subset_name, class_lists)
+            if self._tasks & {None, VocTask.action_classification}:
+                self.save_action_lists(subset_name, action_list)
+            if self._tasks & {None, VocTask.person_layout}:
+                self.save_layout_lists(subset_name, layout_list)
+            if self._tasks & {None, VocTask.segmentation}:
+                self.save_segm_lists(subset_name, segm_list)
+
+    def _save_item(self, item):
+        """
+        Saves the item files and returns the item entries of the subset
+        lists. Can be called from several threads.
+        """
+
+        class_lists = OrderedDict()
+        clsdet_list = OrderedDict()
+        action_list = OrderedDict()
+        layout_list = OrderedDict()
+        segm_list = OrderedDict()
+
+        log.debug("Converting item '%s'", item.id)
+
+        image_filename = ''
+        if item.has_image:
+            image_filename = item.image.filename
+        if self._save_images:
+            if item.has_image and item.image.has_data:
+                if image_filename:
+                    image_filename = osp.splitext(image_filename)[0]
+                else:
+                    image_filename = item.id
+                image_filename += VocPath.IMAGE_EXT
+                self._image_writer.save(item.image,
+                    osp.join(self._images_dir, image_filename))
+            else:
+                log.debug("Item '%s' has no image" % item.id)
+
+        labels = []
+        bboxes = []
+        masks = []
+        for a in item.annotations:
+            if a.type == AnnotationType.label:
+                labels.append(a)
+            elif a.type == AnnotationType.bbox:
+                bboxes.append(a)
+            elif a.type == AnnotationType.mask:
+                masks.append(a)
+
+        if len(bboxes) != 0:
+            root_elem = ET.Element('annotation')
+            if '_' in item.id:
+                folder = item.id[ : item.id.find('_')]
+            else:
+                folder = ''
+            ET.SubElement(root_elem, 'folder').text = folder
+            ET.SubElement(root_elem, 'filename').text = image_filename
+
+            source_elem = ET.SubElement(root_elem, 'source')
+            ET.SubElement(source_elem, 'database').text = 'Unknown'
+            ET.SubElement(source_elem, 'annotation').text = 'Unknown'
+            ET.SubElement(source_elem, 'image').text = 'Unknown'
+
+            if item.has_image:
+                h, w = item.image.size
+                if item.image.has_data:
+                    image_shape = item.image.data.shape
+                    c = 1 if len(image_shape) == 2 else image_shape[2]
+                else:
+                    c = 3
+                size_elem = ET.SubElement(root_elem, 'size')
+                ET.SubElement(size_elem, 'width').text = str(w)
+                ET.SubElement(size_elem, 'height').text = str(h)
+                ET.SubElement(size_elem, 'depth').text = str(c)
+
+            item_segmented = 0 < len(masks)
+            ET.SubElement(root_elem, 'segmented').text = \
+                str(int(item_segmented))
+
+            objects_with_parts = []
+            objects_with_actions = defaultdict(dict)
+
+            main_bboxes = []
+            layout_bboxes = []
+            for bbox in bboxes:
+                label = self.get_label(bbox.label)
+                if self._is_part(label):
+                    layout_bboxes.append(bbox)
+                elif self._is_label(label):
+                    main_bboxes.append(bbox)
+
+            for new_obj_id, obj in enumerate(main_bboxes):
+                attr = obj.attributes
+
+                obj_elem = ET.SubElement(root_elem, 'object')
+
+                obj_label =  self.get_label(obj.label)
+                ET.SubElement(obj_elem, 'name').text = obj_label
+
+                if 'pose' in attr:
+                    pose = _convert_attr('pose', attr,
+                        lambda v: VocPose[v], VocPose.Unspecified)
+                    ET.SubElement(obj_elem, 'pose').text = pose.name
+
+                if 'truncated' in attr:
+                    truncated = _convert_attr('truncated', attr, int, 0)
+                    ET.SubElement(obj_elem, 'truncated').text = \
+                        '%d' % truncated
+
+                if 'difficult' in attr:
+                    difficult = _convert_attr('difficult', attr, int, 0)
+                    ET.SubElement(obj_elem, 'difficult').text = \
+                        '%d' % difficult
+
+                if 'occluded' in attr:
+                    occluded = _convert_attr('occluded', attr, int, 0)
+                    ET.SubElement(obj_elem, 'occluded').text = \
+                        '%d' % occluded
+
+                bbox = obj.get_bbox()
+                if bbox is not None:
+                    _write_xml_bbox(bbox, obj_elem)
+
+                for part_bbox in filter(
+                        lambda x: obj.group and obj.group == x.group,
+                        layout_bboxes):
+                    part_elem = ET.SubElement(obj_elem, 'part')
+                    ET.SubElement(part_elem, 'name').text = \
+                        self.get_label(part_bbox.label)
+                    _write_xml_bbox(part_bbox.get_bbox(), part_elem)
+
+                    objects_with_parts.append(new_obj_id)
+
+                label_actions = self._get_actions(obj_label)
+                actions_elem = ET.Element('actions')
+                for action in label_actions:
+                    present = 0
+                    if action in attr:
+                        present = _convert_attr(action, attr,
+                            lambda v: int(v == True), 0)
+                        ET.SubElement(actions_elem, action).text = \
+                            '%d' % present
+
+                    objects_with_actions[new_obj_id][action] = present
+                if len(actions_elem) != 0:
+                    obj_elem.append(actions_elem)
+
+            if self._tasks & {None,
+                    VocTask.detection,
+                    VocTask.person_layout,
+                    VocTask.action_classification}:
+                with open(osp.join(self._ann_dir, item.id + '.xml'), 'w') as f:
+                    f.write(ET.tostring(root_elem,
+                        encoding='unicode', pretty_print=True))
+
+            clsdet_list[item.id] = True
+            layout_list[item.id] = objects_with_parts
+            action_list[item.id] = objects_with_actions
+
+        for label_ann in labels:
+            label = self.get_label(label_ann.label)
+            if not self._is_label(label):
+                continue
+            class_list = class_lists.get(item.id, set())
+            class_list.add(label_ann.label)
+            class_lists[item.id] = class_list
+
+            clsdet_list[item.id] = True
+
+        if masks:
+            compiled_mask = CompiledMask.from_instance_masks(masks,
+                instance_labels=[self._label_id_mapping(m.label)
+                    for m in masks])
+
+            self.save_segm(
+                osp.join(self._segm_dir, item.id + VocPath.SEGM_EXT),
+                compiled_mask.class_mask)
+            self.save_segm(
+                osp.join(self._inst_dir, item.id + VocPath.SEGM_EXT),
+                compiled_mask.instance_mask,
+                colormap=VocInstColormap)
+
+            segm_list[item.id] = True
+
+        if len(item.annotations) == 0:
+            clsdet_list[item.id] = None
+            layout_list[item.id] = None
+            action_list[item.id] = None
+            segm_list[item.id] = None
+
+        return class_lists, clsdet_list, action_list, layout_list, segm_list
 
     def save_action_lists(self, subset_name, action_list):
         if not action_list:
@@ -556,11 +584,13 @@ class VocConverter(Converter, CliPlugin):
             default=None,
             help="VOC task filter, comma-separated list of {%s} "
                 "(default: all)" % ', '.join([t.name for t in VocTask]))
+        parser.add_argument('--workers', type=int, default=1,
+            help="Number of threads to convert items (default: %(default)s)")
 
         return parser
 
     def __init__(self, tasks=None, save_images=False,
-            apply_colormap=False, label_map=None):
+            apply_colormap=False, label_map=None, workers=1):
         super().__init__()
 
         self._options = {
@@ -568,10 +598,12 @@ class VocConverter(Converter, CliPlugin):
             'save_images': save_images,
             'apply_colormap': apply_colormap,
             'label_map': label_map,
+            'workers': workers,
         }
 
     def __call__(self, extractor, save_dir):
-        converter = _Converter(extractor, save_dir, **self._options)
+        converter = _Converter(extractor, save_dir,
+            image_writer=self.image_writer, **self._options)
         converter.convert()
 
 class VocClassificationConverter(VocConverter):
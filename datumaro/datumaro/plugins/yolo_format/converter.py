@@ -11,7 +11,6 @@ import os.path as osp
 from datumaro.components.converter import Converter
 from datumaro.components.extractor import AnnotationType
 from datumaro.components.cli_plugin import CliPlugin
-from datumaro.util.image import save_image
 
 from .format import YoloPath
 
@@ -87,8 +86,8 @@ class YoloConverter(Converter, CliPlugin):
                         if not item_name:
                             item_name = item.id
                         image_name = item_name + '.jpg'
-                        save_image(osp.join(subset_dir, image_name),
-                            item.image.data)
+                        self.image_writer.save(item.image,
+                            osp.join(subset_dir, image_name))
                     else:
                         log.warning("Item '%s' has no image" % item.id)
                 image_paths[item.id] = osp.join('data',
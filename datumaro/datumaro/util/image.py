@@ -7,7 +7,10 @@
 
 from io import BytesIO
 import numpy as np
+import os
 import os.path as osp
+import shutil
+import threading
 
 from enum import Enum
 _IMAGE_BACKENDS = Enum('_IMAGE_BACKENDS', ['cv2', 'PIL'])
@@ -22,28 +25,49 @@ except ImportError:
 from datumaro.util.image_cache import ImageCache as _ImageCache
 
 
-def load_image(path):
+# The element type of loaded images. None keeps the decoded type,
+# which is uint8 for the most of images.
+_IMAGE_DTYPE = None
+
+def _convert_loaded_image(image, dtype):
+    assert len(image.shape) in {2, 3}
+    if len(image.shape) == 3:
+        assert image.shape[2] in {3, 4}
+
+    if dtype is None:
+        dtype = _IMAGE_DTYPE
+    if dtype is not None:
+        image = image.astype(dtype, copy=False)
+    return image
+
+def _prepare_image_for_pil(image):
+    if len(image.shape) == 3 and image.shape[2] in {3, 4}:
+        image = np.array(image, dtype=np.uint8) # a copy to be modified
+        image[:, :, :3] = image[:, :, 2::-1] # BGR to RGB
+    else:
+        image = image.astype(np.uint8, copy=False)
+    return image
+
+def load_image(path, dtype=None):
     """
-    Reads an image in the HWC Grayscale/BGR(A) float [0; 255] format.
+    Reads an image in the HWC Grayscale/BGR(A) [0; 255] format.
+    The pixels are converted to dtype, if it is specified here or
+    in _IMAGE_DTYPE, otherwise they are kept in the decoded type.
     """
 
     if _IMAGE_BACKEND == _IMAGE_BACKENDS.cv2:
         import cv2
         image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
-        image = image.astype(np.float32)
     elif _IMAGE_BACKEND == _IMAGE_BACKENDS.PIL:
         from PIL import Image
         image = Image.open(path)
-        image = np.asarray(image, dtype=np.float32)
+        image = np.array(image)
         if len(image.shape) == 3 and image.shape[2] in {3, 4}:
             image[:, :, :3] = image[:, :, 2::-1] # RGB to BGR
     else:
         raise NotImplementedError()
 
-    assert len(image.shape) in {2, 3}
-    if len(image.shape) == 3:
-        assert image.shape[2] in {3, 4}
-    return image
+    return _convert_loaded_image(image, dtype)
 
 def save_image(path, image, params=None):
     if _IMAGE_BACKEND == _IMAGE_BACKENDS.cv2:
@@ -52,7 +76,7 @@ def save_image(path, image, params=None):
         if ext.upper() == '.JPG':
             params = [ int(cv2.IMWRITE_JPEG_QUALITY), 75 ]
 
-        image = image.astype(np.uint8)
+        image = image.astype(np.uint8, copy=False)
         cv2.imwrite(path, image, params=params)
     elif _IMAGE_BACKEND == _IMAGE_BACKENDS.PIL:
         from PIL import Image
@@ -60,9 +84,7 @@ def save_image(path, image, params=None):
         if not params:
             params = {}
 
-        image = image.astype(np.uint8)
-        if len(image.shape) == 3 and image.shape[2] in {3, 4}:
-            image[:, :, :3] = image[:, :, 2::-1] # BGR to RGB
+        image = _prepare_image_for_pil(image)
         image = Image.fromarray(image)
         image.save(path, **params)
     else:
@@ -78,7 +100,7 @@ def encode_image(image, ext, params=None):
         if ext.upper() == '.JPG':
             params = [ int(cv2.IMWRITE_JPEG_QUALITY), 75 ]
 
-        image = image.astype(np.uint8)
+        image = image.astype(np.uint8, copy=False)
         success, result = cv2.imencode(ext, image, params=params)
         if not success:
             raise Exception("Failed to encode image to '%s' format" % (ext))
@@ -92,9 +114,7 @@ def encode_image(image, ext, params=None):
         if not params:
             params = {}
 
-        image = image.astype(np.uint8)
-        if len(image.shape) == 3 and image.shape[2] in {3, 4}:
-            image[:, :, :3] = image[:, :, 2::-1] # BGR to RGB
+        image = _prepare_image_for_pil(image)
         image = Image.fromarray(image)
         with BytesIO() as buffer:
             image.save(buffer, format=ext, **params)
@@ -102,25 +122,26 @@ def encode_image(image, ext, params=None):
     else:
         raise NotImplementedError()
 
-def decode_image(image_bytes):
+def decode_image(image_bytes, dtype=None):
+    """
+    Decodes an image in the HWC Grayscale/BGR(A) [0; 255] format.
+    The pixels are converted as in load_image().
+    """
+
     if _IMAGE_BACKEND == _IMAGE_BACKENDS.cv2:
         import cv2
         image = np.frombuffer(image_bytes, dtype=np.uint8)
         image = cv2.imdecode(image, cv2.IMREAD_UNCHANGED)
-        image = image.astype(np.float32)
     elif _IMAGE_BACKEND == _IMAGE_BACKENDS.PIL:
         from PIL import Image
         image = Image.open(BytesIO(image_bytes))
-        image = np.asarray(image, dtype=np.float32)
+        image = np.array(image)
         if len(image.shape) == 3 and image.shape[2] in {3, 4}:
             image[:, :, :3] = image[:, :, 2::-1] # RGB to BGR
     else:
         raise NotImplementedError()
 
-    assert len(image.shape) in {2, 3}
-    if len(image.shape) == 3:
-        assert image.shape[2] in {3, 4}
-    return image
+    return _convert_loaded_image(image, dtype)
 
 
 class lazy_image:
@@ -218,4 +239,131 @@ class Image:
             (np.array_equal(self.size, other.size)) and \
             (self.has_data == other.has_data) and \
             (self.has_data and np.array_equal(self.data, other.data) or \
-                not self.has_data)
\ No newline at end of file
+                not self.has_data)
+
+
+class ByteImage(Image):
+    """
+    An image, backed by the encoded image bytes. The bytes are decoded
+    only when the pixel data is requested.
+    """
+
+    def __init__(self, data=None, path=None, ext=None, size=None):
+        # data: bytes or a callable, returning bytes
+        assert data is not None, "Image can not be empty"
+        super().__init__(data=lambda: decode_image(self.get_bytes()),
+            path=path, size=size)
+        self._bytes_data = data
+
+        if not ext and path:
+            ext = osp.splitext(path)[1]
+        if ext:
+            ext = ext.lower()
+            if not ext.startswith('.'):
+                ext = '.' + ext
+        self._ext = ext or ''
+
+    def get_bytes(self):
+        if callable(self._bytes_data):
+            return self._bytes_data()
+        return self._bytes_data
+
+    @property
+    def ext(self):
+        return self._ext
+
+
+class ImageWriter:
+    """
+    Writes images to files and buffers. An image is copied as is, when it
+    is already encoded in the requested format, and re-encoded otherwise.
+    """
+
+    _EXT_ALIASES = { '.jpeg': '.jpg', '.tiff': '.tif' }
+
+    def __init__(self, link=False):
+        # link: hard-link the source files instead of copying, if possible
+        self.link = link
+        self.copied = 0
+        self.transcoded = 0
+        self._lock = threading.Lock() # images can be written from threads
+
+    def _count(self, copied):
+        with self._lock:
+            if copied:
+                self.copied += 1
+            else:
+                self.transcoded += 1
+
+    @classmethod
+    def _is_same_format(cls, src_ext, dst_ext):
+        src_ext = src_ext.lower()
+        dst_ext = dst_ext.lower()
+        return src_ext and \
+            cls._EXT_ALIASES.get(src_ext, src_ext) == \
+            cls._EXT_ALIASES.get(dst_ext, dst_ext)
+
+    @staticmethod
+    def _get_source_file(image):
+        # the file can be used only if the pixels are read from it
+        loader = image._data
+        if isinstance(loader, lazy_image) and loader.loader is load_image \
+                and loader.path == image.path and osp.isfile(image.path):
+            return image.path
+        return None
+
+    def save(self, image, path):
+        """
+        Saves the image to the path, the format is defined by the path
+        extension. Returns False, if the image has no data.
+        """
+
+        ext = osp.splitext(path)[1]
+        if isinstance(image, ByteImage) and \
+                self._is_same_format(image.ext, ext):
+            with open(path, 'wb') as f:
+                f.write(image.get_bytes())
+            self._count(copied=True)
+            return True
+
+        src_path = self._get_source_file(image)
+        if src_path and self._is_same_format(osp.splitext(src_path)[1], ext):
+            if osp.exists(path) and osp.samefile(src_path, path):
+                pass
+            elif self.link:
+                try:
+                    if osp.exists(path):
+                        os.remove(path)
+                    os.link(src_path, path)
+                except OSError:
+                    shutil.copyfile(src_path, path)
+            else:
+                shutil.copyfile(src_path, path)
+            self._count(copied=True)
+            return True
+
+        data = image.data
+        if data is None:
+            return False
+        save_image(path, data)
+        self._count(copied=False)
+        return True
+
+    def encode(self, image, ext):
+        """
+        Returns the image bytes in the format, defined by the extension.
+        """
+
+        if isinstance(image, ByteImage) and \
+                self._is_same_format(image.ext, ext):
+            self._count(copied=True)
+            return image.get_bytes()
+
+        src_path = self._get_source_file(image)
+        if src_path and self._is_same_format(osp.splitext(src_path)[1], ext):
+            with open(src_path, 'rb') as f:
+                self._count(copied=True)
+                return f.read()
+
+        self._count(copied=False)
+        return encode_image(image.data, ext)
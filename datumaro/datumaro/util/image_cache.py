@@ -1,11 +1,36 @@
-from collections import OrderedDict
+# Copyright (C) 2019-2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+from collections import OrderedDict, namedtuple
+import os
+import os.path as osp
+import shutil
+import sys
+import tempfile
+import threading
+import weakref
+
+import numpy as np
 
 
 _instance = None
 
-DEFAULT_CAPACITY = 2
+DEFAULT_CAPACITY = 128 * 1024 * 1024 # bytes
 
 class ImageCache:
+    """
+    Thread-safe LRU cache of decoded images. The capacity limits the total
+    size of the cached images in bytes. The most recently used image is
+    kept even if it doesn't fit.
+
+    Optionally, evicted arrays can be spilled to a directory on disk and
+    read from there on request, which is cheaper than decoding.
+    """
+
+    CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions',
+        'items', 'size', 'capacity', 'spilled_items', 'spilled_size'])
+
     @staticmethod
     def get_instance():
         global _instance
@@ -13,26 +38,123 @@ class ImageCache:
             _instance = ImageCache()
         return _instance
 
-    def __init__(self, capacity=DEFAULT_CAPACITY):
+    def __init__(self, capacity=DEFAULT_CAPACITY,
+            spill_dir=None, spill_capacity=0):
         self.capacity = int(capacity)
-        self.items = OrderedDict()
+        self.items = OrderedDict() # id: (image, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        self._spill_capacity = int(spill_capacity)
+        self._spill_root = spill_dir
+        self._spill_dir = None
+        self._spilled = OrderedDict() # id: (path, size)
+        self._spilled_size = 0
+        self._spilled_count = 0
+
+    @staticmethod
+    def _get_image_size(image):
+        if isinstance(image, np.ndarray):
+            return image.nbytes
+        return sys.getsizeof(image)
 
     def push(self, item_id, image):
-        if self.capacity <= len(self.items):
-            self.items.popitem(last=True)
-        self.items[item_id] = image
+        size = self._get_image_size(image)
+        with self._lock:
+            self._remove(item_id)
+            self.items[item_id] = (image, size)
+            self._size += size
+            self._evict()
 
     def get(self, item_id):
-        default = object()
-        item = self.items.get(item_id, default)
-        if item is default:
+        with self._lock:
+            entry = self.items.get(item_id)
+            if entry is not None:
+                self.items.move_to_end(item_id)
+                self._hits += 1
+                return entry[0]
+
+            image = self._unspill(item_id)
+            if image is None:
+                self._misses += 1
+                return None
+
+            self._hits += 1
+            size = self._get_image_size(image)
+            self.items[item_id] = (image, size)
+            self._size += size
+            self._evict()
+            return image
+
+    def _remove(self, item_id):
+        entry = self.items.pop(item_id, None)
+        if entry is not None:
+            self._size -= entry[1]
+        entry = self._spilled.pop(item_id, None)
+        if entry is not None:
+            self._spilled_size -= entry[1]
+            os.remove(entry[0])
+
+    def _evict(self):
+        while self.capacity < self._size and 1 < len(self.items):
+            item_id, (image, size) = self.items.popitem(last=False)
+            self._size -= size
+            self._evictions += 1
+            self._spill(item_id, image, size)
+
+    def _spill(self, item_id, image, size):
+        if self._spill_capacity < size or not isinstance(image, np.ndarray):
+            return
+
+        if self._spill_dir is None:
+            if self._spill_root:
+                os.makedirs(self._spill_root, exist_ok=True)
+            self._spill_dir = tempfile.mkdtemp(prefix='image_cache_',
+                dir=self._spill_root)
+            weakref.finalize(self, shutil.rmtree, self._spill_dir, True)
+
+        while self._spill_capacity < self._spilled_size + size:
+            _, (path, spilled_size) = self._spilled.popitem(last=False)
+            self._spilled_size -= spilled_size
+            os.remove(path)
+
+        path = osp.join(self._spill_dir, '%s.npy' % self._spilled_count)
+        self._spilled_count += 1
+        np.save(path, image, allow_pickle=False)
+        self._spilled[item_id] = (path, size)
+        self._spilled_size += size
+
+    def _unspill(self, item_id):
+        entry = self._spilled.pop(item_id, None)
+        if entry is None:
             return None
 
-        self.items.move_to_end(item_id, last=False) # naive splay tree
-        return item
+        path, size = entry
+        self._spilled_size -= size
+        image = np.load(path, allow_pickle=False)
+        os.remove(path)
+        return image
 
     def size(self):
         return len(self.items)
 
     def clear(self):
-        self.items.clear()
\ No newline at end of file
+        with self._lock:
+            self.items.clear()
+            self._size = 0
+            self._spilled.clear()
+            self._spilled_size = 0
+            if self._spill_dir is not None:
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+                self._spill_dir = None
+
+    def info(self):
+        with self._lock:
+            return self.CacheInfo(hits=self._hits, misses=self._misses,
+                evictions=self._evictions, items=len(self.items),
+                size=self._size, capacity=self.capacity,
+                spilled_items=len(self._spilled),
+                spilled_size=self._spilled_size)
@@ -0,0 +1,28 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parallel_map(func, iterable, workers=1, executor_class=ThreadPoolExecutor):
+    """
+    Applies func to the elements in a pool of workers. Results are yielded
+    in the order of elements. The iterable is read in the calling thread,
+    and only a limited number of elements is processed at once.
+    """
+
+    if workers is None or workers <= 1:
+        for elem in iterable:
+            yield func(elem)
+        return
+
+    with executor_class(max_workers=workers) as executor:
+        pending = deque()
+        for elem in iterable:
+            pending.append(executor.submit(func, elem))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -97,4 +97,19 @@ def compare_datasets(test, expected, actual):
 
             ann_b = find(ann_b_matches, lambda x: x == ann_a)
             test.assertEqual(ann_a, ann_b, 'ann: %s' % ann_to_str(ann_a))
-            item_b.annotations.remove(ann_b) # avoid repeats
\ No newline at end of file
+            item_b.annotations.remove(ann_b) # avoid repeats
+
+
+def compare_dirs(test, expected, actual):
+    expected_files = sorted(osp.relpath(osp.join(d, f), expected)
+        for d, _, files in os.walk(expected) for f in files)
+    actual_files = sorted(osp.relpath(osp.join(d, f), actual)
+        for d, _, files in os.walk(actual) for f in files)
+    test.assertEqual(expected_files, actual_files)
+
+    for path in expected_files:
+        with open(osp.join(expected, path), 'rb') as f:
+            expected_data = f.read()
+        with open(osp.join(actual, path), 'rb') as f:
+            actual_data = f.read()
+        test.assertEqual(expected_data, actual_data, path)
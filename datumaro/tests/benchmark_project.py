@@ -0,0 +1,71 @@
+# The benchmark is not a part of the test suite. Run it explicitly:
+#   python -m pytest datumaro/tests/benchmark_project.py -s
+
+import numpy as np
+from timeit import default_timer as timer
+
+from unittest import TestCase
+
+from datumaro.components.extractor import Extractor, DatasetItem, Label
+from datumaro.components.project import Dataset
+
+
+class AnnoExtractor(Extractor):
+    def __init__(self, size):
+        super().__init__()
+        self._size = size
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield DatasetItem(id=i, annotations=[ Label(0) ])
+
+class ImagesExtractor(Extractor):
+    def __init__(self, size):
+        super().__init__()
+        self._size = size
+        self.decoded = 0
+
+    def __iter__(self):
+        for i in range(self._size):
+            self.decoded += 1
+            yield DatasetItem(id=i, image=np.zeros((4, 4, 3), dtype=np.uint8))
+
+class NestedLoopDataset(Dataset):
+    def __iter__(self):
+        for item in self._sources['task_anno']:
+            for item_image in self._sources['task_images']:
+                if item.id == item_image.id:
+                    yield item.wrap(path=None, annotations=item.annotations,
+                        image=item_image.image)
+                    break
+
+class DatasetJoinBenchmark(TestCase):
+    SIZES = [500, 1000, 2000, 10000] # frames
+    NESTED_LOOP_MAX_SIZE = 2000
+
+    def _export(self, dataset_class, size):
+        images = ImagesExtractor(size)
+        dataset = dataset_class()
+        dataset._sources = {
+            'task_anno': AnnoExtractor(size), 'task_images': images
+        }
+
+        start = timer()
+        count = sum(1 for _ in dataset)
+        elapsed = timer() - start
+
+        self.assertEqual(count, size)
+        return elapsed, images.decoded
+
+    def test_join(self):
+        print()
+        print("{:>8} {:>12} {:>12} {:>12} {:>12}".format("frames",
+            "nested", "decoded", "indexed", "decoded"))
+        for size in self.SIZES:
+            if size <= self.NESTED_LOOP_MAX_SIZE:
+                nested = "{:>11.2f}s {:>12}".format(
+                    *self._export(NestedLoopDataset, size))
+            else:
+                nested = "{:>12} {:>12}".format('-', '-')
+            indexed = "{:>11.2f}s {:>12}".format(*self._export(Dataset, size))
+            print("{:>8} {} {}".format(size, nested, indexed))
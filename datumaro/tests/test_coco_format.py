@@ -20,7 +20,7 @@ from datumaro.plugins.coco_format.converter import (
 )
 from datumaro.plugins.coco_format.importer import CocoImporter
 from datumaro.util.image import save_image, Image
-from datumaro.util.test_utils import TestDir, compare_datasets
+from datumaro.util.test_utils import TestDir, compare_datasets, compare_dirs
 
 
 class CocoImporterTest(TestCase):
@@ -657,4 +657,37 @@ class CocoConverterTest(TestCase):
 
         with TestDir() as test_dir:
             self._test_save_and_load(TestExtractor(),
-                CocoConverter(tasks='image_info'), test_dir)
\ No newline at end of file
+                CocoConverter(tasks='image_info'), test_dir)
+
+    def test_can_save_in_parallel(self):
+        class TestExtractor(Extractor):
+            def __iter__(self):
+                for i in range(10):
+                    yield DatasetItem(id=i, subset='train',
+                        image=np.ones((4, 4, 3)) * i,
+                        annotations=[
+                            Label(i % 3, id=1),
+                            Caption('caption %s' % i, id=2),
+                            Bbox(0, 1, 2, 2, label=i % 3, group=3, id=3),
+                            Polygon([0, 1, 2, 1, 2, 3, 0, 3],
+                                label=i % 3, group=4, id=4),
+                            Mask(np.eye(4, dtype=np.uint8), label=i % 3,
+                                attributes={ 'is_crowd': True }),
+                        ])
+
+            def categories(self):
+                label_cat = LabelCategories()
+                for label in range(3):
+                    label_cat.add('label_' + str(label))
+                return { AnnotationType.label: label_cat }
+
+        with TestDir() as test_dir:
+            serial_dir = osp.join(test_dir, 'serial')
+            parallel_dir = osp.join(test_dir, 'parallel')
+
+            CocoConverter(save_images=True, workers=1)(
+                TestExtractor(), serial_dir)
+            CocoConverter(save_images=True, workers=4)(
+                TestExtractor(), parallel_dir)
+
+            compare_dirs(self, serial_dir, parallel_dir)
@@ -1,4 +1,5 @@
 import numpy as np
+import os.path as osp
 
 from unittest import TestCase
 
@@ -11,8 +12,8 @@ from datumaro.components.extractor import (Extractor, DatasetItem,
 from datumaro.plugins.datumaro_format.importer import DatumaroImporter
 from datumaro.plugins.datumaro_format.converter import DatumaroConverter
 from datumaro.util.mask_tools import generate_colormap
-from datumaro.util.image import Image
-from datumaro.util.test_utils import TestDir, item_to_str
+from datumaro.util.image import ByteImage, Image, encode_image
+from datumaro.util.test_utils import TestDir, compare_dirs, item_to_str
 
 
 class DatumaroConverterTest(TestCase):
@@ -105,4 +106,39 @@ class DatumaroConverterTest(TestCase):
         with TestDir() as test_dir:
             DatumaroConverter()(self.TestExtractor(), save_dir=test_dir)
 
-            self.assertTrue(DatumaroImporter.detect(test_dir))
\ No newline at end of file
+            self.assertTrue(DatumaroImporter.detect(test_dir))
+
+    def test_can_save_encoded_images_as_is(self):
+        class TestExtractor(Extractor):
+            def __iter__(self):
+                return iter([
+                    DatasetItem(id=1, image=ByteImage(path='a.jpg',
+                        data=encode_image(np.ones((2, 3, 3)), '.jpg'))),
+                    DatasetItem(id=2, image=ByteImage(path='b.png',
+                        data=encode_image(np.ones((2, 3, 3)), '.png'))),
+                ])
+
+        with TestDir() as test_dir:
+            source_dataset = TestExtractor()
+
+            converter = DatumaroConverter(save_images=True)
+            converter(source_dataset, test_dir)
+
+            items = list(source_dataset)
+            with open(osp.join(test_dir, 'images', 'a.jpg'), 'rb') as f:
+                self.assertEqual(f.read(), items[0].image.get_bytes())
+            self.assertTrue(osp.isfile(osp.join(test_dir, 'images', 'b.jpg')))
+            self.assertEqual(converter.image_writer.copied, 1)
+            self.assertEqual(converter.image_writer.transcoded, 1)
+
+    def test_can_save_in_parallel(self):
+        with TestDir() as test_dir:
+            serial_dir = osp.join(test_dir, 'serial')
+            parallel_dir = osp.join(test_dir, 'parallel')
+
+            DatumaroConverter(save_images=True, workers=1)(
+                self.TestExtractor(), serial_dir)
+            DatumaroConverter(save_images=True, workers=4)(
+                self.TestExtractor(), parallel_dir)
+
+            compare_dirs(self, serial_dir, parallel_dir)
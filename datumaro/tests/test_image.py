@@ -11,9 +11,11 @@ from datumaro.util.test_utils import TestDir
 class ImageOperationsTest(TestCase):
     def setUp(self):
         self.default_backend = image_module._IMAGE_BACKEND
+        self.default_dtype = image_module._IMAGE_DTYPE
 
     def tearDown(self):
         image_module._IMAGE_BACKEND = self.default_backend
+        image_module._IMAGE_DTYPE = self.default_dtype
 
     def test_save_and_load_backends(self):
         backends = image_module._IMAGE_BACKENDS
@@ -50,3 +52,47 @@ class ImageOperationsTest(TestCase):
 
             self.assertTrue(np.array_equal(src_image, dst_image),
                 'save: %s, load: %s' % (save_backend, load_backend))
+
+    def test_can_select_loaded_image_type(self):
+        for backend, c in product(image_module._IMAGE_BACKENDS, [1, 3, 4]):
+            with TestDir() as test_dir:
+                if c == 1:
+                    src_image = np.random.randint(0, 255 + 1, (2, 4))
+                else:
+                    src_image = np.random.randint(0, 255 + 1, (2, 4, c))
+                path = osp.join(test_dir, 'img.png')
+                image_module._IMAGE_BACKEND = backend
+                image_module.save_image(path, src_image)
+                with open(path, 'rb') as f:
+                    image_bytes = f.read()
+
+                image_module._IMAGE_DTYPE = None
+                for image in [image_module.load_image(path),
+                        image_module.decode_image(image_bytes)]:
+                    self.assertEqual(image.dtype, np.uint8)
+                    self.assertTrue(np.array_equal(src_image, image))
+
+                for image in [
+                        image_module.load_image(path, dtype=np.float32),
+                        image_module.decode_image(image_bytes,
+                            dtype=np.float32)]:
+                    self.assertEqual(image.dtype, np.float32)
+                    self.assertTrue(np.array_equal(src_image, image))
+
+                image_module._IMAGE_DTYPE = np.float32
+                self.assertEqual(image_module.load_image(path).dtype,
+                    np.float32)
+
+    def test_save_does_not_modify_input(self):
+        for backend in image_module._IMAGE_BACKENDS:
+            with TestDir() as test_dir:
+                src_image = np.random.randint(0, 255 + 1, (2, 4, 3),
+                    dtype=np.uint8)
+                expected = src_image.copy()
+                image_module._IMAGE_BACKEND = backend
+
+                image_module.save_image(osp.join(test_dir, 'img.png'),
+                    src_image)
+                image_module.encode_image(src_image, '.png')
+
+                self.assertTrue(np.array_equal(src_image, expected))
@@ -1,10 +1,13 @@
 import numpy as np
+import os
 import os.path as osp
+from threading import Thread
 
 from unittest import TestCase
 
 from datumaro.util.test_utils import TestDir
-from datumaro.util.image import lazy_image, load_image, save_image, Image
+from datumaro.util.image import (lazy_image, load_image, save_image,
+    encode_image, ByteImage, Image, ImageWriter)
 from datumaro.util.image_cache import ImageCache
 
 
@@ -22,21 +25,74 @@ class LazyImageTest(TestCase):
             self.assertFalse(non_caching_loader() is non_caching_loader())
 
 class ImageCacheTest(TestCase):
-    def test_cache_fifo_displacement(self):
+    def test_cache_lru_displacement(self):
         capacity = 2
-        cache = ImageCache(capacity)
+        cache = ImageCache(capacity * 10)
 
-        loaders = [lazy_image(None, loader=lambda p: object(), cache=cache)
+        loaders = [lazy_image(None, cache=cache,
+                loader=lambda p: np.zeros(10, dtype=np.uint8))
             for _ in range(capacity + 1)]
 
         first_request = [loader() for loader in loaders[1 : ]]
-        loaders[0]() # pop something from the cache
+        loaders[0]() # pop the least recently used image from the cache
 
         second_request = [loader() for loader in loaders[2 : ]]
         second_request.insert(0, loaders[1]())
 
         matches = sum([a is b for a, b in zip(first_request, second_request)])
         self.assertEqual(matches, len(first_request) - 1)
+        self.assertTrue(first_request[1] is second_request[1])
+
+        info = cache.info()
+        self.assertEqual((info.hits, info.misses, info.evictions), (1, 4, 2))
+        self.assertEqual((info.items, info.size), (2, 20))
+
+    def test_keeps_last_image_if_it_does_not_fit(self):
+        cache = ImageCache(10)
+
+        cache.push(1, np.zeros(5, dtype=np.uint8))
+        cache.push(2, np.zeros(20, dtype=np.uint8))
+
+        self.assertEqual(cache.get(1), None)
+        self.assertEqual(cache.get(2).shape, (20,))
+
+    def test_can_spill_images_to_disk(self):
+        with TestDir() as test_dir:
+            cache = ImageCache(10, spill_dir=test_dir, spill_capacity=20)
+            images = [np.full(10, i, dtype=np.uint8) for i in range(4)]
+
+            for i, image in enumerate(images):
+                cache.push(i, image)
+
+            info = cache.info()
+            self.assertEqual((info.items, info.spilled_items), (1, 2))
+            self.assertEqual(cache.get(0), None)
+            self.assertTrue(np.array_equal(cache.get(1), images[1]))
+            self.assertTrue(np.array_equal(cache.get(2), images[2]))
+            self.assertEqual(cache.info().hits, 2)
+
+            cache.clear()
+            self.assertEqual(cache.info().spilled_items, 0)
+            self.assertEqual(os.listdir(test_dir), [])
+
+    def test_can_be_used_from_threads(self):
+        cache = ImageCache(100)
+
+        def worker(offset):
+            for i in range(1000):
+                key = (offset + i) % 20
+                if cache.get(key) is None:
+                    cache.push(key, np.zeros(10, dtype=np.uint8))
+
+        threads = [Thread(target=worker, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        info = cache.info()
+        self.assertEqual(info.hits + info.misses, 4000)
+        self.assertLessEqual(info.size, 100)
 
     def test_global_cache_is_accessible(self):
         loader = lazy_image(None, loader=lambda p: object())
@@ -77,3 +133,75 @@ class ImageTest(TestCase):
                     img.data
                 img.size
                 # pylint: enable=pointless-statement
+
+class ByteImageTest(TestCase):
+    def test_decodes_bytes_on_data_access(self):
+        image = np.ones((2, 4, 3))
+        image_bytes = encode_image(image, '.png')
+        requests = []
+        def get_bytes():
+            requests.append(1)
+            return image_bytes
+
+        img = ByteImage(data=get_bytes, path='dir/name.PNG', size=(2, 4))
+
+        self.assertEqual(img.ext, '.png')
+        self.assertEqual(img.size, (2, 4))
+        self.assertEqual(len(requests), 0)
+
+        self.assertEqual(img.get_bytes(), image_bytes)
+        self.assertTrue(np.array_equal(img.data, image))
+        self.assertEqual(len(requests), 2)
+
+    def test_can_get_ext_without_path(self):
+        self.assertEqual(ByteImage(data=b'', ext='jpg').ext, '.jpg')
+
+class ImageWriterTest(TestCase):
+    def test_can_copy_encoded_bytes(self):
+        with TestDir() as test_dir:
+            image_bytes = encode_image(np.ones((2, 4, 3)), '.png')
+            writer = ImageWriter()
+
+            writer.save(ByteImage(data=image_bytes, ext='.png'),
+                osp.join(test_dir, 'a.png'))
+            writer.save(ByteImage(data=image_bytes, ext='.png'),
+                osp.join(test_dir, 'a.jpg'))
+
+            with open(osp.join(test_dir, 'a.png'), 'rb') as f:
+                self.assertEqual(f.read(), image_bytes)
+            self.assertEqual(load_image(osp.join(test_dir, 'a.jpg')).shape,
+                (2, 4, 3))
+            self.assertEqual((writer.copied, writer.transcoded), (1, 1))
+
+    def test_can_copy_source_files(self):
+        with TestDir() as test_dir:
+            src_path = osp.join(test_dir, 'src.jpeg')
+            save_image(src_path, np.ones((2, 4, 3)))
+            with open(src_path, 'rb') as f:
+                src_bytes = f.read()
+
+            for link in [False, True]:
+                writer = ImageWriter(link=link)
+                dst_path = osp.join(test_dir, 'dst_%s.jpg' % link)
+
+                writer.save(Image(path=src_path), dst_path)
+
+                with open(dst_path, 'rb') as f:
+                    self.assertEqual(f.read(), src_bytes)
+                self.assertEqual((writer.copied, writer.transcoded), (1, 0))
+
+    def test_reencodes_modified_images(self):
+        with TestDir() as test_dir:
+            src_path = osp.join(test_dir, 'src.png')
+            save_image(src_path, np.ones((2, 4, 3)))
+            writer = ImageWriter()
+
+            writer.save(Image(path=src_path, data=np.zeros((2, 4, 3))),
+                osp.join(test_dir, 'dst.png'))
+            image_bytes = writer.encode(Image(path=src_path), '.png')
+
+            self.assertTrue(np.array_equal(
+                load_image(osp.join(test_dir, 'dst.png')), np.zeros((2, 4, 3))))
+            with open(src_path, 'rb') as f:
+                self.assertEqual(image_bytes, f.read())
+            self.assertEqual((writer.copied, writer.transcoded), (1, 1))
@@ -531,6 +531,40 @@ class DatasetTest(TestCase):
 
         compare_datasets(self, DstExtractor(), dataset)
 
+    def test_can_join_sources_reading_images_once(self):
+        class AnnoExtractor(Extractor):
+            def __iter__(self):
+                return iter([
+                    DatasetItem(id=i, annotations=[ Label(i) ])
+                    for i in [0, 2, 1, 3, 5]
+                ])
+
+        class ImagesExtractor(Extractor):
+            def __init__(self):
+                super().__init__()
+                self.iterations = 0
+
+            def __iter__(self):
+                self.iterations += 1
+                return iter([
+                    DatasetItem(id=i, image=np.ones((2, 3)) * i)
+                    for i in range(5)
+                ])
+
+        images = ImagesExtractor()
+        dataset = Dataset()
+        dataset._sources = {
+            'task_1_anno': AnnoExtractor(), 'task_1_images': images
+        }
+
+        items = list(dataset)
+
+        self.assertEqual(images.iterations, 1)
+        self.assertEqual([item.id for item in items], ['0', '2', '1', '3'])
+        for item in items:
+            self.assertEqual(item.annotations, [ Label(int(item.id)) ])
+            self.assertEqual(item.image, np.ones((2, 3)) * int(item.id))
+
 
 class DatasetItemTest(TestCase):
     def test_ctor_requires_id(self):
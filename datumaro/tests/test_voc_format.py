@@ -29,7 +29,7 @@ from datumaro.plugins.voc_format.converter import (
 from datumaro.plugins.voc_format.importer import VocImporter
 from datumaro.components.project import Project
 from datumaro.util.image import save_image, Image
-from datumaro.util.test_utils import TestDir, compare_datasets
+from datumaro.util.test_utils import TestDir, compare_datasets, compare_dirs
 
 
 class VocTest(TestCase):
@@ -746,6 +746,34 @@ class VocConverterTest(TestCase):
             self._test_save_and_load(TestExtractor(),
                 VocConverter(label_map='voc'), test_dir)
 
+    def test_can_save_in_parallel(self):
+        class TestExtractor(TestExtractorBase):
+            def __iter__(self):
+                for i in range(10):
+                    yield DatasetItem(id=i, subset='ab'[i % 2],
+                        image=np.ones((4, 5, 3)) * i,
+                        annotations=[
+                            Label(i % 5 + 1),
+                            Bbox(1, 1, 2, 2, label=self._label('person'),
+                                attributes={
+                                    VOC.VocAction(1).name: True,
+                                }),
+                            Bbox(2, 1, 1, 2, label=i % 5 + 1),
+                            Mask(np.eye(4, 5, dtype=np.uint8),
+                                label=i % 5 + 1),
+                        ])
+
+        with TestDir() as test_dir:
+            serial_dir = osp.join(test_dir, 'serial')
+            parallel_dir = osp.join(test_dir, 'parallel')
+
+            VocConverter(label_map='voc', save_images=True, workers=1)(
+                TestExtractor(), serial_dir)
+            VocConverter(label_map='voc', save_images=True, workers=4)(
+                TestExtractor(), parallel_dir)
+
+            compare_dirs(self, serial_dir, parallel_dir)
+
 class VocImportTest(TestCase):
     def test_can_import(self):
         with TestDir() as test_dir: